@@ -0,0 +1,89 @@
+from Column import Column
+from Table import Table
+from utils import canonical_table_name, parse_table_name
+
+class Session():
+    """Object used to store the tables known while parsing the statements of one '.sql' script
+
+    Attributes
+    ----------
+    redshift_cursor : sqlparse.connection()
+        The ``sqlparse`` database session
+    tables : dict of str to Table()
+        The tables created by the script's statements, like ``CREATE TEMP TABLE ... AS``
+    catalog : dict of str to Table()
+        The tables already queried from Redshift, which can be shared between sessions
+    """
+    def __init__(self, redshift_cursor, catalog:dict=None):
+        """The initialization of the Session object.
+
+        Parameters
+        ----------
+        redshift_cursor : sqlparse.connection()
+            The ``sqlparse`` database session
+        catalog : dict of str to Table(), default to None
+            The tables already queried from Redshift by other sessions
+        """
+        self.redshift_cursor = redshift_cursor
+        self.tables = {}
+        self.catalog = catalog if catalog is not None else {}
+
+    def __str__(self) -> str:
+        return f'Session with {len(self.tables)} created and {len(self.catalog)} queried tables'
+
+    def __repr__(self) -> str:
+        return str(self)
+
+    def has_table(self, table_name:str) -> bool:
+        """Returns whether the table was created by a previous statement of the script"""
+        return canonical_table_name(table_name) in self.tables
+
+    def register_table(self, table:Table, columns:list) -> Table:
+        """Registers a table created by the script with the columns it was created with
+
+        Parameters
+        ----------
+        table : Table()
+            The table being created
+        columns : list of tuple
+            The name, data type and length of every column of the table
+
+        Returns
+        -------
+        Table()
+            The registered table
+        """
+        table.columns = [
+            Column(column_name, data_type, data_length, 'YES', None, table)
+            for column_name, data_type, data_length in columns
+        ]
+        table.has_queried = True
+        self.tables[table.key] = table
+        return table
+
+    def drop_table(self, table_name:str) -> None:
+        """Removes a table dropped by the script"""
+        self.tables.pop(canonical_table_name(table_name), None)
+
+    def get_table(self, table_name:str, alias:str=None) -> Table:
+        """Returns a table with its columns
+
+        The tables created by the script are used before the Redshift catalog, which is queried at
+        most once per table. A temp table the script did not create is returned without columns.
+
+        Parameters
+        ----------
+        table_name : str
+            The name of the table, with or without its schema
+        alias : str, default to None
+            The table's alias used in the SQL statement
+        """
+        key = canonical_table_name(table_name)
+        if key in self.tables:
+            return self.tables[key].with_alias(alias)
+        _name = parse_table_name(table_name)
+        if _name.schema is None:
+            return Table(_name.table, _name.table, self.redshift_cursor, alias)
+        if key not in self.catalog:
+            self.catalog[key] = Table(_name.schema, _name.table, self.redshift_cursor).query_data()
+        return self.catalog[key].with_alias(alias)
@@ -1,4 +1,6 @@
+import copy
 from Column import Column
+from utils import canonical_table_name
 
 class Table():
     """Object used to store table metadata
@@ -63,19 +65,33 @@ class Table():
         yield 'alias', self.alias
         yield 'columns', [dict(column) for column in self.columns]
 
+    @property
+    def key(self) -> str:
+        """The canonical name used to look up the table"""
+        if self.is_temp:
+            return canonical_table_name(self.table_name)
+        return canonical_table_name(f'{self.schema}.{self.table_name}')
+
     def has_column(self, column_name:str) -> bool:
         """Returns whether the table has a column with a specific name"""
         return len([column for column in self.columns if column.column_name == column_name]) == 1
 
     def get_column(self, column_name:str):
         """Returns the column from the table"""
-        if not self.has_column(column_name) and not self.is_temp:
-            raise Exception(
-                f'`{self.schema}.{self.table_name}` does not have column `{column_name}`'
-            )
+        if self.has_column(column_name):
+            return [column for column in self.columns if column.column_name == column_name][0]
+        # The columns of a temp table created outside the parsed script are unknown.
         if self.is_temp:
             return Column(column_name, 'UNKNOWN', 0, 'UNKNOWN', None, self)
-        return [column for column in self.columns if column.column_name == column_name][0]
+        raise Exception(
+            f'`{self.schema}.{self.table_name}` does not have column `{column_name}`'
+        )
+
+    def with_alias(self, alias:str):
+        """Returns the same table used with another alias, sharing its columns"""
+        table = copy.copy(self)
+        table.alias = alias
+        return table
 
     def query_data(self):
         """Queries the table's metadata from Redshift"""
@@ -1,5 +1,5 @@
-import json
 from pprint import pprint
+from results_store import open_results
 
 
 tables = [
@@ -13,14 +13,12 @@ tables = [
     'stg.mbo_order_base'
 ]
 
-with open('apps_modifying_tables.json') as f:
-  data = json.load(f)
+store = open_results()
 
 for table in tables:
     print( table )
-    for app in data.keys():
-        if table in data[app]:
-            print( f'\t{app}' )
+    for app in store.apps_touching( table ):
+        print( f'\t{app}' )
 
 # for app in data.keys():
 #     tables_app_uses = data[app]
@@ -0,0 +1,208 @@
+"""Finds the join subgraphs and subqueries recomputed by several statements of the corpus.
+
+The equality joins of every parsed statement form a graph of tables whose edges are the joined
+pairs of tables and the columns they are joined on. Each subquery and CTE has a graph of its own,
+as its joins are computed apart from the joins of the query using it. Every connected set of up to
+``MAX_EDGES`` edges of a graph is canonicalized, sorted by table and column, and hashed, so
+``stg.erp_invoices`` joined to ``stg.orders`` joined to ``stg.erp_shipments`` is the same subgraph
+whatever the order and aliases of the joins. The derived tables and CTEs are hashed
+by their query template, as ``fingerprint.py`` does for statements.
+
+The subgraphs and subqueries found in several statements are candidates for a materialized view,
+or a staging table computed once per run. A subgraph is only reported when no larger subgraph
+holding it is found in as many statements.
+"""
+import os
+import json
+import hashlib
+import argparse
+from distribution import statement_join_pairs
+from fingerprint import template
+
+# The largest number of joins of a reported subgraph
+MAX_EDGES = 5
+# The smallest number of tables of a reported subgraph
+MIN_TABLES = 3
+# The smallest number of statements a subgraph or subquery is found in to be reported
+MIN_STATEMENTS = 2
+
+def _hash(value:str) -> str:
+    """Returns the short hash of a canonical subgraph or subquery"""
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()[:16]
+
+def _tables(edges) -> set:
+    """Returns the tables joined by a set of edges"""
+    return {table for edge in edges for table in (edge.left_table, edge.right_table)}
+
+def connected_subgraphs(edges:set, max_edges:int=MAX_EDGES) -> set:
+    """Returns every connected set of up to ``max_edges`` edges of a join graph
+
+    Parameters
+    ----------
+    edges : set of distribution.JoinPair()
+        The joins of a statement
+    max_edges : int, default to MAX_EDGES
+        The largest number of edges of a subgraph
+
+    Returns
+    -------
+    set of frozenset
+        The subgraphs, each a set of edges sharing a table with another edge of the set
+    """
+    found = {frozenset((edge,)) for edge in edges}
+    frontier = set(found)
+    for _ in range(max_edges - 1):
+        grown = set()
+        for subgraph in frontier:
+            tables = _tables(subgraph)
+            for edge in edges - subgraph:
+                if edge.left_table in tables or edge.right_table in tables:
+                    grown.add(subgraph | {edge})
+        grown -= found
+        found |= grown
+        frontier = grown
+    return found
+
+class CommonSubexpressionReport():
+    """Counts the statements computing every join subgraph and subquery
+
+    Attributes
+    ----------
+    subgraphs : dict of str to dict
+        The edges and occurrences of every subgraph, keyed by its hash
+    subqueries : dict of str to dict
+        The template and occurrences of every subquery, keyed by its hash
+    apps : dict of str to set
+        The apps running every '.sql' file
+    min_tables : int
+        The smallest number of tables of a counted subgraph
+    """
+    def __init__(self, apps:dict=None, min_tables:int=MIN_TABLES) -> None:
+        self.subgraphs = {}
+        self.subqueries = {}
+        self.apps = apps or {}
+        self.min_tables = min_tables
+
+    @staticmethod
+    def _occurrence(entries:dict, key:str, value:dict, statement:tuple, apps:set) -> None:
+        """Counts a statement computing a subgraph or subquery"""
+        entry = entries.setdefault(key, {**value, 'statements': set(), 'apps': set()})
+        entry['statements'].add(statement)
+        entry['apps'].update(apps)
+
+    def add_statements(self, statements:list) -> None:
+        """Adds the subgraphs and subqueries of the parsed statements of a '.sql' script"""
+        for position, parsed in enumerate(statements):
+            statement = (parsed.file_name, position)
+            apps = self.apps.get(parsed.file_name, set())
+            for _statement in parsed.walk():
+                if _statement is not parsed:
+                    _template = template(str(_statement.tokens))
+                    self._occurrence(
+                        self.subqueries, _hash(_template), {'template': _template}, statement, apps
+                    )
+                # The joins of a subquery or CTE are not combined with the joins using it.
+                for subgraph in connected_subgraphs(set(statement_join_pairs(_statement))):
+                    if len(_tables(subgraph)) < self.min_tables:
+                        continue
+                    canonical = sorted(
+                        (
+                            edge.left_table, edge.right_table,
+                            [list(columns) for columns in edge.columns]
+                        )
+                        for edge in subgraph
+                    )
+                    self._occurrence(
+                        self.subgraphs, _hash(json.dumps(canonical)), {'edges': canonical},
+                        statement, apps
+                    )
+
+    @staticmethod
+    def _entry(key:str, entry:dict) -> dict:
+        """Returns a reported subgraph or subquery"""
+        return {
+            'hash': key,
+            **{name: value for name, value in entry.items() if name not in ('statements', 'apps')},
+            'statements': len(entry['statements']),
+            'apps': sorted(entry['apps']),
+            'files': sorted({os.path.basename(file_name) for file_name, _ in entry['statements']})
+        }
+
+    def recurring_subgraphs(self) -> list:
+        """Returns the subgraphs found in several statements, the most statements first
+
+        A subgraph is left out when a larger subgraph holding its edges is found in the same
+        statements.
+        """
+        recurring = {
+            key: entry for key, entry in self.subgraphs.items()
+            if len(entry['statements']) >= MIN_STATEMENTS
+        }
+        edges = {
+            key: {json.dumps(edge) for edge in entry['edges']} for key, entry in recurring.items()
+        }
+        out = []
+        for key, entry in recurring.items():
+            if any(
+                other != key and edges[key] < edges[other]
+                and recurring[other]['statements'] == entry['statements']
+                for other in recurring
+            ):
+                continue
+            out.append({
+                **self._entry(key, entry),
+                'tables': sorted({table for edge in entry['edges'] for table in edge[:2]})
+            })
+        return sorted(out, key=lambda found: (-found['statements'], -len(found['edges'])))
+
+    def recurring_subqueries(self) -> list:
+        """Returns the subqueries found in several statements, the most statements first"""
+        return sorted(
+            (
+                self._entry(key, entry) for key, entry in self.subqueries.items()
+                if len(entry['statements']) >= MIN_STATEMENTS
+            ),
+            key=lambda found: -found['statements']
+        )
+
+    def report(self) -> dict:
+        """Returns the recurring subgraphs and subqueries"""
+        return {
+            'subgraphs': self.recurring_subgraphs(),
+            'subqueries': self.recurring_subqueries()
+        }
+
+if __name__ == '__main__':
+    #pylint: disable=C0415
+    from concurrency import UnparsedStatement
+    from new_join_parser import connect_to_redshift, parse_file
+    from results_store import open_results
+    arguments = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    arguments.add_argument(
+        '--min-tables', type=int, default=MIN_TABLES,
+        help='The smallest number of tables of a reported join subgraph'
+    )
+    options = arguments.parse_args()
+    cursor = connect_to_redshift().cursor()
+    results = open_results()
+    _apps = {}
+    for _app, path, _position, _record in results.statements():
+        _apps.setdefault(path, set()).add(_app)
+    results.close()
+    _report = CommonSubexpressionReport(_apps, options.min_tables)
+    _catalog = {}
+    _unparsed = 0
+    for _file_name in _apps:
+        if not os.path.isfile(_file_name):
+            continue
+        # The statements the parser rejects are skipped instead of stopping the report.
+        _statements = parse_file(_file_name, cursor, _catalog, keep_unparsed=True)
+        _parsed = [
+            _statement for _statement in _statements
+            if not isinstance(_statement, UnparsedStatement)
+        ]
+        _unparsed += len(_statements) - len(_parsed)
+        _report.add_statements(_parsed)
+    with open('common_subexpressions.json', 'w', encoding='utf-8') as json_file:
+        json.dump(_report.report(), json_file, indent=4)
+    print(f'{_unparsed} statements were not parsed and are left out of the report')
@@ -0,0 +1,208 @@
+"""Finds the statements of a single '.sql' script that could run concurrently.
+
+Redshift runs the statements of an ETL script one after another. Two statements only need to
+keep that order when one writes a table the other reads or writes. Every other pair could be
+issued concurrently or split into parallel steps.
+"""
+import os
+import sys
+import json
+from typing import Union, Tuple
+from sqlparse.sql import IdentifierList, Identifier, Parenthesis
+from sqlparse.tokens import Keyword, Name
+from corpus import write_target
+from utils import table_key
+
+# The keywords that are followed by the tables a statement reads from.
+READ_KEYWORDS = (
+    'FROM',
+    'USING',
+    'JOIN',
+    'LEFT JOIN',
+    'RIGHT JOIN',
+    'INNER JOIN',
+    'FULL JOIN',
+    'LEFT OUTER JOIN',
+    'RIGHT OUTER JOIN',
+    'FULL OUTER JOIN',
+    'CROSS JOIN'
+)
+
+def _identifier_table(identifier) -> Union[str, None]:
+    """Returns the table referenced by an identifier or ``None`` when it is a subquery"""
+    if not isinstance(identifier, Identifier) or isinstance(identifier.token_first(), Parenthesis):
+        return None
+    if identifier.token_first().ttype is not Name:
+        return None
+    if identifier.get_parent_name() is None:
+        return table_key(identifier.get_real_name())
+    return table_key(f'{identifier.get_parent_name()}.{identifier.get_real_name()}')
+
+def referenced_tables(tokens) -> set:
+    """Returns the keys of every table read by the tokens, including the tables read in
+    subqueries and ``WHERE ... IN (SELECT ...)`` clauses."""
+    found = set()
+    # Walk the token tree with a stack so deeply nested queries do not recurse.
+    stack = [tokens]
+    while stack:
+        token_list = stack.pop()
+        from_seen = False
+        for _token in token_list.tokens:
+            if _token.is_whitespace:
+                continue
+            if _token.ttype is Keyword:
+                from_seen = _token.value.upper() in READ_KEYWORDS
+                continue
+            if from_seen:
+                if isinstance(_token, IdentifierList):
+                    identifiers = list(_token.get_identifiers())
+                else:
+                    identifiers = [_token]
+                for identifier in identifiers:
+                    _table = _identifier_table(identifier)
+                    if _table is not None:
+                        found.add(_table)
+                from_seen = False
+            if _token.is_group:
+                stack.append(_token)
+    return found
+
+class UnparsedStatement():
+    """A statement of a script that ``ParsedStatement`` does not parse, like an ``UPDATE``,
+    ``TRUNCATE`` or ``DROP``, kept for the tables it reads and writes
+
+    Attributes
+    ----------
+    tokens : sqlparse.sql.Statement()
+        The SQL statement parsed using ``sqlparse``
+    file_name : str
+        The name of the '.sql' file the statement is from
+    reads : set of str
+        The keys of the tables the statement reads
+    writes : set of str
+        The keys of the table the statement writes
+    """
+    def __init__(self, tokens, file_name:str) -> None:
+        self.tokens = tokens
+        self.file_name = file_name
+        target = write_target(tokens)
+        self.writes = {target} if target is not None else set()
+        self.reads = referenced_tables(tokens) - self.writes
+
+    def __repr__(self) -> str:
+        return f'Unparsed {self.tokens.get_type()} of {sorted(self.writes)}'
+
+def statement_reads_writes(statement) -> Tuple[set, set]:
+    """Returns the keys of the tables a ``ParsedStatement`` or ``UnparsedStatement`` reads and
+    writes"""
+    if isinstance(statement, UnparsedStatement):
+        return statement.reads, statement.writes
+    writes = set()
+    if statement.table is not None:
+        writes.add(statement.table.key)
+    reads = {_table.key for _table in statement.table_cache}
+    reads |= referenced_tables(statement.tokens)
+    # The CTEs are read like tables but only exist within the statement.
+    reads -= set(statement.ctes)
+    # ``DELETE`` statements list their target table after ``FROM``.
+    return reads - writes, writes
+
+def build_dependencies(statements:list) -> list:
+    """Returns the ordering constraints between the statements of a script
+
+    Parameters
+    ----------
+    statements : list of new_join_parser.ParsedStatement() or UnparsedStatement()
+        The statements of a single '.sql' script, in the order they are executed
+
+    Returns
+    -------
+    list of tuple
+        The ``(before, after, kind, table)`` constraints, where ``before`` and ``after`` are the
+        indexes of the statements and ``kind`` is ``read-after-write``, ``write-after-write`` or
+        ``write-after-read``
+    """
+    dependencies = []
+    last_writer = {}
+    readers_since_write = {}
+    for index, statement in enumerate(statements):
+        reads, writes = statement_reads_writes(statement)
+        for _table in sorted(reads):
+            if _table in last_writer:
+                dependencies.append((last_writer[_table], index, 'read-after-write', _table))
+        for _table in sorted(writes):
+            if _table in last_writer:
+                dependencies.append((last_writer[_table], index, 'write-after-write', _table))
+            for reader in readers_since_write.get(_table, []):
+                dependencies.append((reader, index, 'write-after-read', _table))
+        for _table in reads:
+            readers_since_write.setdefault(_table, []).append(index)
+        for _table in writes:
+            last_writer[_table] = index
+            readers_since_write[_table] = []
+    return dependencies
+
+def parallel_groups(statements:list, dependencies:list) -> list:
+    """Returns the statements grouped into steps where every statement of a step only depends
+    on statements in earlier steps."""
+    levels = [0] * len(statements)
+    # Dependencies always point forward in the script, so one pass in order is enough.
+    for before, after, _, _ in sorted(dependencies, key=lambda dependency: dependency[1]):
+        levels[after] = max(levels[after], levels[before] + 1)
+    groups = [[] for _ in range(max(levels) + 1 if levels else 0)]
+    for index, level in enumerate(levels):
+        groups[level].append(index)
+    return groups
+
+def analyze_script(statements:list) -> dict:
+    """Analyzes the statements of a single '.sql' script for concurrency
+
+    Parameters
+    ----------
+    statements : list of new_join_parser.ParsedStatement() or UnparsedStatement()
+        The statements of a single '.sql' script, in the order they are executed
+
+    Returns
+    -------
+    dict
+        The independent groups of statements, the constraints between them, the length of the
+        serial chain and the maximum number of statements that could run at once
+    """
+    dependencies = build_dependencies(statements)
+    groups = parallel_groups(statements, dependencies)
+    _statements = []
+    for index, statement in enumerate(statements):
+        reads, writes = statement_reads_writes(statement)
+        _statements.append({
+            'index': index,
+            'type': statement.tokens.get_type(),
+            'reads': sorted(reads),
+            'writes': sorted(writes)
+        })
+    return {
+        'file_name': statements[0].file_name if statements else None,
+        'statements': _statements,
+        'dependencies': [
+            {'before': before, 'after': after, 'kind': kind, 'table': _table}
+            for before, after, kind, _table in dependencies
+        ],
+        'groups': groups,
+        'serial_chain_length': len(groups),
+        'parallel_width': max([len(group) for group in groups], default=0),
+        'estimated_speedup': len(statements) / len(groups) if groups else 1.0
+    }
+
+if __name__ == '__main__':
+    from new_join_parser import connect_to_redshift, parse_file
+    cursor = connect_to_redshift().cursor()
+    for sql_file in sys.argv[1:]:
+        analysis = analyze_script(parse_file(sql_file, cursor, keep_unparsed=True))
+        print(
+            f'{sql_file}: {len(analysis["statements"])} statements in '
+            + f'{analysis["serial_chain_length"]} serial steps, at most '
+            + f'{analysis["parallel_width"]} at once'
+        )
+        with open(
+            f'{os.path.basename(sql_file)}.concurrency.json', 'w', encoding='utf-8'
+        ) as json_file:
+            json.dump(analysis, json_file, indent=4)
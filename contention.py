@@ -0,0 +1,234 @@
+"""Finds the tables apps write while another app writes or reads them in the same run window.
+
+Redshift aborts one of two concurrent transactions writing the same table with a serializable
+isolation violation, and a transaction reading a table waits on the lock of another one writing
+it. The tables each app writes and reads are read from the results database, and the daily run
+window of every app from a schedule with the ``App Name`` of ``UsedApps.csv``, its ``Start`` as
+``HH:MM`` and its ``Duration`` in minutes. ``UsedApps.csv`` can hold the two columns itself, or
+they can be kept in a local schedule of the same format. An app without a run window is assumed
+to overlap every other app.
+
+For every pair of apps with intersecting run windows, the tables both write (``write_write``) and
+the tables one writes while the other reads (``write_read``) are reported. The apps are then
+ordered so the writer of a table runs before its readers, and two writers of a table in the order
+they start, and the start times removing every overlap are suggested.
+"""
+import json
+import argparse
+from itertools import combinations
+import pandas as pd
+from corpus import statement_reads, statement_target
+from results_store import ResultsStore, open_results
+from utils import parse_table_name
+
+SCHEDULE_FILE = 'UsedApps.csv'
+# The minutes of a daily schedule
+DAY = 24 * 60
+
+class RunWindow():
+    """The daily run window of an app
+
+    Attributes
+    ----------
+    start : int
+        The minute of the day the app starts
+    duration : int
+        The number of minutes the app runs
+    """
+    def __init__(self, start:int, duration:int) -> None:
+        self.start = start % DAY
+        self.duration = duration
+
+    def __repr__(self) -> str:
+        return f'{self.start // 60:02d}:{self.start % 60:02d}+{self.duration}m'
+
+    @property
+    def end(self) -> int:
+        """The minute the app stops, after midnight when it runs past it"""
+        return self.start + self.duration
+
+    def overlaps(self, other) -> bool:
+        """Returns whether two daily windows intersect, including across midnight"""
+        return any(
+            self.start < other.end + shift and other.start + shift < self.end
+            for shift in (-DAY, 0, DAY)
+        )
+
+def load_schedule(file_name:str=SCHEDULE_FILE) -> dict:
+    """Reads the run window of every app, the apps without ``Start`` or ``Duration`` are left out
+    """
+    schedule_df = pd.read_csv(file_name)
+    if 'Start' not in schedule_df.columns or 'Duration' not in schedule_df.columns:
+        return {}
+    schedule = {}
+    for app, start, duration in schedule_df[['App Name', 'Start', 'Duration']].itertuples(
+        index=False
+    ):
+        if pd.isna(start) or pd.isna(duration):
+            continue
+        hours, minutes = str(start).strip().split(':')[:2]
+        schedule[app.strip()] = RunWindow(int(hours) * 60 + int(minutes), int(duration))
+    return schedule
+
+def app_tables(store:ResultsStore) -> dict:
+    """Returns the ``(writes, reads)`` sets of the non-temp tables of every stored app"""
+    out = {}
+    for app, _file_name, _position, record in store.statements():
+        writes, reads = out.setdefault(app, (set(), set()))
+        target = statement_target(record)
+        if target is not None and parse_table_name(target).schema is not None:
+            writes.add(target)
+        reads.update(
+            table for table in statement_reads(record) if parse_table_name(table).schema is not None
+        )
+    return out
+
+class ContentionReport():
+    """Matches the tables of the apps whose run windows intersect
+
+    Attributes
+    ----------
+    tables : dict of str to tuple
+        The ``(writes, reads)`` sets of every app
+    schedule : dict of str to RunWindow()
+        The run window of the scheduled apps
+    """
+    def __init__(self, tables:dict, schedule:dict) -> None:
+        self.tables = tables
+        self.schedule = schedule
+
+    def concurrent(self, app:str, other:str) -> bool:
+        """Returns whether two apps can run at the same time"""
+        if app not in self.schedule or other not in self.schedule:
+            return True
+        return self.schedule[app].overlaps(self.schedule[other])
+
+    def conflicts(self) -> list:
+        """Returns the tables of every pair of concurrent apps, the most conflicts first"""
+        out = []
+        for app, other in combinations(sorted(self.tables), 2):
+            if not self.concurrent(app, other):
+                continue
+            (writes, reads), (other_writes, other_reads) = self.tables[app], self.tables[other]
+            write_write = sorted(writes & other_writes)
+            # The tables both apps write are only reported as ``write_write``.
+            write_read = [
+                {'table': table, 'writer': writer, 'reader': reader}
+                for writer, reader, tables in (
+                    (app, other, writes & other_reads), (other, app, other_writes & reads)
+                )
+                for table in sorted(tables - set(write_write))
+            ]
+            if write_write or write_read:
+                out.append({
+                    'apps': [app, other],
+                    'scheduled': app in self.schedule and other in self.schedule,
+                    'write_write': write_write,
+                    'write_read': write_read
+                })
+        return sorted(
+            out, key=lambda conflict: -len(conflict['write_write']) - len(conflict['write_read'])
+        )
+
+    def _start(self, app:str) -> int:
+        """Returns the minute an app starts, the unscheduled apps last"""
+        return self.schedule[app].start if app in self.schedule else DAY
+
+    def ordering(self, conflicts:list) -> list:
+        """Returns the conflicting apps in the order removing their conflicts
+
+        The writer of a table runs before its readers. Two writers of the same tables keep the
+        order they start in. A cycle of readers and writers is broken at the app starting first.
+        """
+        before = {}
+        for conflict in conflicts:
+            app, other = conflict['apps']
+            # The app writing more tables the other reads runs first.
+            reads_of_other = sum(entry['writer'] == app for entry in conflict['write_read'])
+            reads_of_app = len(conflict['write_read']) - reads_of_other
+            if reads_of_other == reads_of_app:
+                first, second = sorted((app, other), key=lambda _app: (self._start(_app), _app))
+            else:
+                first, second = (app, other) if reads_of_other > reads_of_app else (other, app)
+            before.setdefault(second, set()).add(first)
+            before.setdefault(first, set())
+        ordered = []
+        while before:
+            ready = [app for app, apps in before.items() if not apps] or list(before)
+            app = min(ready, key=lambda _app: (self._start(_app), _app))
+            ordered.append(app)
+            del before[app]
+            for apps in before.values():
+                apps.discard(app)
+        return ordered
+
+    def suggested_schedule(self, ordered:list, conflicts:list) -> list:
+        """Returns the start time of every ordered app, delayed until it overlaps none of the
+        apps before it that it conflicts with
+
+        The current start and the ends of the conflicting apps before it are tried in the order
+        they come after the current start, across midnight. An app that cannot run apart from
+        them within the day keeps the latest of these starts, with ``conflict_free`` false.
+        """
+        pairs = {frozenset(conflict['apps']) for conflict in conflicts}
+        windows = {}
+        out = []
+        for app in ordered:
+            window = self.schedule.get(app)
+            if window is None:
+                out.append({'app': app, 'current': None, 'start': None})
+                continue
+            before = [
+                _window for other, _window in windows.items() if frozenset((app, other)) in pairs
+            ]
+            candidates = sorted(
+                {window.start} | {_window.end % DAY for _window in before},
+                key=lambda start: (start - window.start) % DAY
+            )
+            suggested = next(
+                (
+                    _suggested
+                    for _suggested in (RunWindow(start, window.duration) for start in candidates)
+                    if not any(_suggested.overlaps(_window) for _window in before)
+                ),
+                None
+            )
+            conflict_free = suggested is not None
+            if suggested is None:
+                suggested = RunWindow(candidates[-1], window.duration)
+            windows[app] = suggested
+            out.append({
+                'app': app,
+                'current': repr(window),
+                'start': repr(suggested),
+                'conflict_free': conflict_free
+            })
+        return out
+
+    def report(self) -> dict:
+        """Returns the conflicts, the ordering removing them and the suggested start times"""
+        conflicts = self.conflicts()
+        ordered = self.ordering(conflicts)
+        return {
+            'unscheduled_apps': sorted(set(self.tables) - set(self.schedule)),
+            'conflicts': conflicts,
+            'ordering': ordered,
+            'suggested_schedule': self.suggested_schedule(ordered, conflicts)
+        }
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    arguments.add_argument(
+        '--schedule', default=SCHEDULE_FILE,
+        help='The CSV with the App Name, Start (HH:MM) and Duration (minutes) of every app'
+    )
+    options = arguments.parse_args()
+    results = open_results()
+    _report = ContentionReport(app_tables(results), load_schedule(options.schedule)).report()
+    results.close()
+    with open('contention.json', 'w', encoding='utf-8') as json_file:
+        json.dump(_report, json_file, indent=4)
+    print(
+        f'{len(_report["conflicts"])} pairs of concurrent apps conflict,'
+        + f' {len(_report["unscheduled_apps"])} apps have no run window'
+    )
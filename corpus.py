@@ -0,0 +1,148 @@
+"""Reads the apps, steps and '.sql' scripts of the ETL pipeline into per-statement records.
+
+The records use the same format as ``sql.json`` with the table each statement writes added as
+``target``.
+"""
+import os
+from typing import Union
+import yaml
+import sqlparse
+from sqlparse.sql import Identifier, Function
+from sqlparse.tokens import Keyword, DML, DDL, Name, Punctuation, String
+from sql_metadata import Parser
+from utils import table_key
+
+# The statement types recorded in ``sql.json``
+PARSED_TYPES = ('SELECT', 'CREATE', 'DELETE', 'INSERT')
+
+def app_sql_scripts(parse_path:str, app:str) -> list:
+    """Returns the ``(step name, '.sql' script)`` pairs used by the steps of an app
+
+    Parameters
+    ----------
+    parse_path : str
+        The directory holding the apps
+    app : str
+        The name of the app's directory
+
+    Returns
+    -------
+    list of tuple
+        The name of each step and the path to every '.sql' script it runs, in the order of the
+        steps in the app's ``app_config.yml``
+    """
+    config_file = os.path.join(parse_path, app, 'config', 'app_config.yml')
+    if not os.path.isfile(config_file):
+        return []
+    with open(config_file, encoding='utf-8') as _f:
+        app_config = yaml.load(_f.read(), Loader=yaml.FullLoader)
+    scripts = []
+    # Iterate over the different steps for the one group per app.
+    for index, step in enumerate(app_config['groups'][0]['steps']):
+        step_name = step.get('name', str(index))
+        for value in step.values():
+            if isinstance(value, str) and value.endswith('.sql') \
+            and os.path.isfile(os.path.join(parse_path, app, 'sql', value)):
+                scripts.append((step_name, os.path.join(parse_path, app, 'sql', value)))
+    return scripts
+
+def app_sql_files(parse_path:str, app:str) -> list:
+    """Returns every '.sql' file found in the ``./sql`` directory of an app"""
+    sql_directory = os.path.join(parse_path, app, 'sql')
+    if not os.path.isdir(sql_directory):
+        return []
+    return sorted(
+        os.path.join(sql_directory, file)
+        for file in os.listdir(sql_directory) if file.endswith('.sql')
+    )
+
+def identifier_name(identifier) -> str:
+    """Returns the dotted table name at the start of an identifier, without the column list of
+    ``INSERT INTO table (column, ...)``."""
+    name = ''
+    for _token in identifier.tokens:
+        if _token.ttype in (Name, String.Symbol) \
+        or (_token.ttype is Punctuation and _token.value == '.'):
+            name += _token.value
+        elif isinstance(_token, Identifier):
+            name += identifier_name(_token)
+        else:
+            break
+    return name
+
+def write_target(parsed) -> Union[str, None]:
+    """Returns the key of the table written by a parsed statement or ``None`` when the statement
+    does not write a table."""
+    if not parsed.tokens:
+        return None
+    first = parsed.token_first(skip_cm=True)
+    if first is None or first.ttype not in (DML, DDL, Keyword) \
+    or first.value.upper() not in ('CREATE', 'INSERT', 'DELETE', 'TRUNCATE', 'DROP', 'UPDATE'):
+        return None
+    for _token in parsed.tokens:
+        if isinstance(_token, (Identifier, Function)):
+            _name = identifier_name(_token)
+            return table_key(_name) if _name else None
+    return None
+
+def statement_record(sql_statement:str) -> Union[dict, None]:
+    """Parses a single SQL statement into its ``sql.json`` record
+
+    Parameters
+    ----------
+    sql_statement : str
+        A single SQL statement
+
+    Returns
+    -------
+    dict or None
+        The type, columns, tables, subqueries and target of the statement, or ``None`` when the
+        statement is not a ``SELECT``, ``CREATE``, ``DELETE`` or ``INSERT``
+    """
+    parsed = sqlparse.parse(sql_statement)[0]
+    sql_type = parsed.get_type()
+    if sql_type not in PARSED_TYPES:
+        return None
+    try:
+        metadata = Parser(parsed.value)
+        return {
+            'type': sql_type,
+            'columns': metadata.columns_dict,
+            'tables': metadata.tables,
+            'subqueries': metadata.subqueries,
+            'target': write_target(parsed),
+            'skipped': False,
+            'value': parsed.value
+        }
+    except Exception: #pylint: disable=W0703
+        return {
+            'type': sql_type,
+            'target': write_target(parsed),
+            'skipped': True,
+            'value': parsed.value
+        }
+
+def parse_sql_file(file_name:str) -> list:
+    """Returns the ``sql.json`` records of every statement in a '.sql' file"""
+    with open(file_name, encoding='utf-8') as _f:
+        sql_contents = _f.read()
+    records = []
+    for sql_statement in sqlparse.split(sql_contents):
+        record = statement_record(sql_statement)
+        if record is not None:
+            records.append(record)
+    return records
+
+def statement_target(record:dict) -> Union[str, None]:
+    """Returns the key of the table a ``sql.json`` record writes"""
+    if 'target' in record:
+        return record['target']
+    # Records written before ``target`` was recorded must be parsed again.
+    return write_target(sqlparse.parse(record['value'])[0])
+
+def statement_reads(record:dict) -> list:
+    """Returns the keys of the tables a ``sql.json`` record reads"""
+    if 'tables' not in record:
+        return []
+    target = statement_target(record)
+    return sorted({table_key(table) for table in record['tables'] if table_key(table) != target})
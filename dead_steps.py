@@ -0,0 +1,170 @@
+"""Finds the ``app_config.yml`` steps whose output tables no other step or app reads.
+
+The statements of every stored '.sql' file are grouped by the step running the file, as recorded
+from the apps' ``app_config.yml``, into the tables each step writes and reads. A table has a
+downstream reader when a statement of another step reads it; the statements of the step merging
+into the table, like the ``DELETE`` and ``INSERT`` of a delta load, do not count.
+
+A step is dead when none of the tables it writes has a downstream reader, and a step is dead as
+well when its tables are only read by dead steps. The tables read outside of the parsed corpus,
+like the ones sent by ``dm-optimove-export`` or ``dm-ga360-export`` or queried by dashboards, are
+listed in an allow-list of ``{"sink": ["schema.table", "schema.prefix_*"]}``.
+"""
+import os
+import json
+import argparse
+from fnmatch import fnmatchcase
+from corpus import statement_reads, statement_target
+from results_store import ResultsStore, open_results
+from utils import parse_table_name
+
+ALLOW_LIST_FILE = 'external_readers.json'
+
+def load_allow_list(file_name:str=ALLOW_LIST_FILE) -> dict:
+    """Reads the table patterns each external sink reads, an empty allow-list when the file is
+    missing"""
+    if not os.path.isfile(file_name):
+        return {}
+    with open(file_name, encoding='utf-8') as json_file:
+        return {
+            sink: [pattern.lower() for pattern in patterns]
+            for sink, patterns in json.load(json_file).items()
+        }
+
+class Step():
+    """The tables written and read by the '.sql' files of an ``app_config.yml`` step
+
+    Attributes
+    ----------
+    app : str
+        The app running the step
+    name : str
+        The name of the step
+    files : list of str
+        The '.sql' files run by the step
+    writes : set of str
+        The keys of the non-temp tables written by the step
+    reads : set of str
+        The keys of the tables read by the step, except the tables it writes
+    """
+    def __init__(self, app:str, name:str) -> None:
+        self.app = app
+        self.name = name
+        self.files = []
+        self.writes = set()
+        self.reads = set()
+
+    def __repr__(self) -> str:
+        return f'{self.app}:{self.name}'
+
+    def add(self, record:dict) -> None:
+        """Adds the tables written and read by a ``sql.json`` record"""
+        target = statement_target(record)
+        if target is not None and parse_table_name(target).schema is not None:
+            self.writes.add(target)
+        self.reads.update(statement_reads(record))
+
+class DeadStepReport():
+    """Matches the tables written by every step with the steps reading them
+
+    Attributes
+    ----------
+    steps : dict of tuple to Step()
+        Every step, keyed by ``(app, step name)``
+    allow_list : dict of str to list
+        The table patterns read by every external sink
+    """
+    def __init__(self, allow_list:dict=None) -> None:
+        self.steps = {}
+        self.allow_list = allow_list or {}
+
+    def add(self, app:str, step:str, file_name:str, record:dict) -> None:
+        """Adds a ``sql.json`` record of a '.sql' file to the step running it"""
+        # The files stored without ``app_config.yml`` are their own step.
+        _step = self.steps.setdefault((app, step or file_name), Step(app, step or file_name))
+        if file_name not in _step.files:
+            _step.files.append(file_name)
+        _step.add(record)
+
+    @classmethod
+    def from_store(cls, store:ResultsStore, allow_list:dict=None):
+        """Returns the steps of every app stored in the results database"""
+        report = cls(allow_list)
+        steps = store.file_steps()
+        for app, file_name, _position, record in store.statements():
+            if not record['skipped']:
+                report.add(app, steps.get((app, file_name)), file_name, record)
+        return report
+
+    def external_readers(self, table:str) -> list:
+        """Returns the sinks of the allow-list reading a table"""
+        return sorted(
+            sink for sink, patterns in self.allow_list.items()
+            if any(fnmatchcase(table, pattern) for pattern in patterns)
+        )
+
+    def readers(self) -> dict:
+        """Returns the steps reading every table, keyed by the table"""
+        out = {}
+        for step in self.steps.values():
+            for table in step.reads:
+                out.setdefault(table, []).append(step)
+        return out
+
+    def dead_steps(self) -> list:
+        """Returns the dead steps with their unread tables, the steps writing the most tables first
+
+        The steps only read by dead steps are found by removing the dead steps from the readers
+        until no other step becomes dead.
+        """
+        readers = self.readers()
+        dead = {}
+        while True:
+            found = False
+            for key, step in self.steps.items():
+                if key in dead or not step.writes:
+                    continue
+                live = [
+                    table for table in step.writes
+                    if self.external_readers(table) or any(
+                        reader is not step and (reader.app, reader.name) not in dead
+                        for reader in readers.get(table, [])
+                    )
+                ]
+                if not live:
+                    dead[key] = step
+                    found = True
+            if not found:
+                break
+        return sorted(
+            (
+                {
+                    'app': step.app,
+                    'step': step.name,
+                    'files': step.files,
+                    'tables': sorted(step.writes),
+                    # The dead steps reading the tables, when the step is dead through them
+                    'read_by_dead_steps': sorted({
+                        repr(reader) for table in step.writes
+                        for reader in readers.get(table, []) if reader is not step
+                    })
+                }
+                for step in dead.values()
+            ),
+            key=lambda entry: (-len(entry['tables']), entry['app'], entry['step'])
+        )
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    arguments.add_argument(
+        '--allow-list', default=ALLOW_LIST_FILE,
+        help='The JSON file of the tables read by external sinks, by sink'
+    )
+    options = arguments.parse_args()
+    results = open_results()
+    _report = DeadStepReport.from_store(results, load_allow_list(options.allow_list))
+    results.close()
+    _dead = _report.dead_steps()
+    with open('dead_steps.json', 'w', encoding='utf-8') as json_file:
+        json.dump(_dead, json_file, indent=4)
+    print(f'{len(_dead)} dead steps of {len(_report.steps)}')
@@ -0,0 +1,331 @@
+"""Checks the joins of every statement against the distribution of the joined tables.
+
+Redshift stores the rows of a ``DISTSTYLE KEY`` table on the slice picked by its distribution key,
+a copy of a ``DISTSTYLE ALL`` table on every node and ``DISTSTYLE EVEN`` rows round-robin. Every
+equality join is classified by the data it moves:
+
+- ``co_located``: both sides are joined on their distribution keys, or one side is ``ALL``
+- ``redistribute_one``: only one side is joined on its distribution key, so the other side is
+  redistributed on the join column
+- ``broadcast``: neither side is joined on its distribution key and the smaller side is copied to
+  every node
+- ``redistribute_both``: neither side is joined on its distribution key and both are redistributed
+
+The distribution of the tables is read from ``svv_table_info``, or from a local JSON snapshot of
+it. The joins are aggregated per pair of tables across the corpus and the distribution key
+changes are ranked by the number of rows they stop moving.
+"""
+import os
+import re
+import json
+import argparse
+from collections import namedtuple
+from typing import Union
+from utils import canonical_table_name
+
+CO_LOCATED = 'co_located'
+REDISTRIBUTE_ONE = 'redistribute_one'
+REDISTRIBUTE_BOTH = 'redistribute_both'
+BROADCAST = 'broadcast'
+# The tables Redshift usually broadcasts rather than redistributing both sides
+BROADCAST_ROWS = 1000000
+# The number of compute nodes a broadcast table is copied to
+NODES = 4
+SNAPSHOT_FILE = 'distribution_snapshot.json'
+
+# The ``svv_table_info.diststyle``: ``EVEN``, ``ALL``, ``KEY(column)`` or ``AUTO(KEY(column))``
+_DISTSTYLE = re.compile(r'(?:AUTO\()?(EVEN|ALL|KEY)(?:\(([^)]+)\))?\)?', re.IGNORECASE)
+
+JoinPair = namedtuple('JoinPair', 'left_table right_table columns')
+
+class TableDistribution():
+    """The distribution of a Redshift table
+
+    Attributes
+    ----------
+    table : str
+        The key of the table
+    style : str
+        ``KEY``, ``EVEN`` or ``ALL``
+    distkey : str or None
+        The distribution key of a ``KEY`` table
+    rows : int
+        The number of rows of the table
+    sortkey : list of str
+        The columns of the table's sort key, in order
+    """
+    def __init__( #pylint: disable=R0913
+        self, table:str, style:str, distkey:str=None, rows:int=0, sortkey:list=None
+    ) -> None:
+        self.table = canonical_table_name(table)
+        self.style = style.upper()
+        self.distkey = distkey.lower() if distkey is not None else None
+        self.rows = int(rows or 0)
+        self.sortkey = [column.lower() for column in sortkey or []]
+
+    def __iter__(self):
+        yield 'table', self.table
+        yield 'style', self.style
+        yield 'distkey', self.distkey
+        yield 'rows', self.rows
+        yield 'sortkey', self.sortkey
+
+    def __repr__(self) -> str:
+        if self.style == 'KEY':
+            return f'{self.table} DISTKEY({self.distkey})'
+        return f'{self.table} DISTSTYLE {self.style}'
+
+    @classmethod
+    def from_diststyle(cls, table:str, diststyle:str, rows:int=0):
+        """Returns the distribution of a table from its ``svv_table_info.diststyle``"""
+        match = _DISTSTYLE.match(diststyle.strip())
+        if match is None:
+            return cls(table, 'EVEN', None, rows)
+        return cls(table, match.group(1), match.group(2), rows)
+
+    def with_distkey(self, column:str):
+        """Returns the distribution the table would have with another distribution key"""
+        return TableDistribution(self.table, 'KEY', column, self.rows, self.sortkey)
+
+def query_distributions(redshift_cursor) -> dict:
+    """Returns the distribution and sort key of every table from ``svv_table_info`` and
+    ``pg_attribute``"""
+    redshift_cursor.execute(
+        'SELECT "schema", "table", diststyle, tbl_rows FROM svv_table_info;'
+    )
+    distributions = {
+        _distribution.table: _distribution
+        for _distribution in (
+            TableDistribution.from_diststyle(f'{schema}.{table}', diststyle or 'EVEN', rows)
+            for schema, table, diststyle, rows in redshift_cursor.fetchall()
+        )
+    }
+    # ``svv_table_info`` only has the first column of the sort key.
+    redshift_cursor.execute(
+        'SELECT' \
+            + ' n.nspname as schema,' \
+            + ' c.relname as table_name,' \
+            + ' a.attname as column_name' \
+        + ' FROM pg_attribute a' \
+        + ' JOIN pg_class c ON c.oid = a.attrelid' \
+        + ' JOIN pg_namespace n ON n.oid = c.relnamespace' \
+        + ' WHERE a.attsortkeyord > 0' \
+        + ' ORDER BY n.nspname, c.relname, a.attsortkeyord;'
+    )
+    for schema, table, column in redshift_cursor.fetchall():
+        key = canonical_table_name(f'{schema}.{table}')
+        if key in distributions:
+            distributions[key].sortkey.append(column.lower())
+    return distributions
+
+def save_snapshot(distributions:dict, file_name:str=SNAPSHOT_FILE) -> None:
+    """Writes the distributions to a local snapshot"""
+    with open(file_name, 'w', encoding='utf-8') as json_file:
+        json.dump(
+            [dict(_distribution) for _distribution in distributions.values()], json_file, indent=4
+        )
+
+def load_snapshot(file_name:str=SNAPSHOT_FILE) -> dict:
+    """Reads the distributions written by ``save_snapshot()``"""
+    with open(file_name, encoding='utf-8') as json_file:
+        return {
+            _distribution.table: _distribution
+            for _distribution in (TableDistribution(**row) for row in json.load(json_file))
+        }
+
+def statement_join_pairs(statement):
+    """Yields the tables and equality-compared columns of the joins of a single parsed statement,
+    without the joins of its subqueries and CTEs"""
+    for join in statement.joins:
+        # A join can compare the joined table with several of the tables before it.
+        pairs = {}
+        for comparison in join.comparisons:
+            if comparison.operator != '=' or comparison.left_str or comparison.right_str:
+                continue
+            left, right = comparison.left_table.key, comparison.right_table.key
+            columns = (
+                comparison.left_column.column_name.lower(),
+                comparison.right_column.column_name.lower()
+            )
+            if left > right:
+                left, right, columns = right, left, columns[::-1]
+            pairs.setdefault((left, right), []).append(columns)
+        for (left, right), columns in pairs.items():
+            yield JoinPair(left, right, tuple(sorted(columns)))
+
+def join_pairs(statements:list):
+    """Yields the tables and equality-compared columns of every join of parsed statements
+
+    Parameters
+    ----------
+    statements : list of new_join_parser.ParsedStatement()
+        The parsed statements, whose subqueries and CTEs are searched as well
+
+    Yields
+    ------
+    JoinPair
+        The two tables of a join and the ``(left column, right column)`` pairs they are compared on
+    """
+    for statement in (_statement for parsed in statements for _statement in parsed.walk()):
+        yield from statement_join_pairs(statement)
+
+def classify_join(
+    pair:JoinPair, left:TableDistribution, right:TableDistribution
+) -> Union[tuple, None]:
+    """Returns the classification of a join and the number of rows it moves
+
+    ``None`` is returned when the distribution of a side is unknown, like for temp tables.
+    """
+    if left is None or right is None:
+        return None
+    if 'ALL' in (left.style, right.style):
+        return CO_LOCATED, 0
+    left_on_key = any(column == left.distkey for column, _ in pair.columns)
+    right_on_key = any(column == right.distkey for _, column in pair.columns)
+    # Both sides are only co-located when the same comparison joins the distribution keys.
+    if (left.distkey, right.distkey) in pair.columns:
+        return CO_LOCATED, 0
+    if left_on_key and not right_on_key:
+        return REDISTRIBUTE_ONE, right.rows
+    if right_on_key and not left_on_key:
+        return REDISTRIBUTE_ONE, left.rows
+    smaller = min(left.rows, right.rows)
+    if smaller <= BROADCAST_ROWS:
+        return BROADCAST, smaller * NODES
+    return REDISTRIBUTE_BOTH, left.rows + right.rows
+
+class DistributionReport():
+    """Aggregates the joins of the corpus per pair of tables
+
+    Attributes
+    ----------
+    distributions : dict of str to TableDistribution()
+        The distribution of every table
+    pairs : dict of tuple to dict
+        The classifications and rows moved of the joins of every pair of tables
+    unknown : int
+        The number of joins with a side whose distribution is unknown
+    """
+    def __init__(self, distributions:dict) -> None:
+        self.distributions = distributions
+        self.pairs = {}
+        self.unknown = 0
+        self._joins = {}
+
+    def add(self, pair:JoinPair) -> None:
+        """Classifies a join and adds it to its pair of tables"""
+        classified = classify_join(
+            pair, self.distributions.get(pair.left_table), self.distributions.get(pair.right_table)
+        )
+        if classified is None:
+            self.unknown += 1
+            return
+        classification, rows = classified
+        entry = self.pairs.setdefault((pair.left_table, pair.right_table), {
+            'joins': 0, 'rows_moved': 0, CO_LOCATED: 0, REDISTRIBUTE_ONE: 0,
+            BROADCAST: 0, REDISTRIBUTE_BOTH: 0
+        })
+        entry['joins'] += 1
+        entry['rows_moved'] += rows
+        entry[classification] += 1
+        self._joins[pair] = self._joins.get(pair, 0) + 1
+
+    def add_statements(self, statements:list) -> None:
+        """Classifies every join of parsed statements"""
+        for pair in join_pairs(statements):
+            self.add(pair)
+
+    def _rows_moved(self, table:str, distribution:TableDistribution) -> int:
+        """Returns the rows moved by the joins of a table with a given distribution"""
+        distributions = {**self.distributions, table: distribution}
+        moved = 0
+        for pair, count in self._joins.items():
+            if table in (pair.left_table, pair.right_table):
+                moved += count * classify_join(
+                    pair, distributions[pair.left_table], distributions[pair.right_table]
+                )[1]
+        return moved
+
+    def recommendations(self) -> list:
+        """Returns the distribution key changes, the one removing the most data movement first
+
+        Every joined column of a ``KEY`` or ``EVEN`` table is tried as its distribution key, and
+        the rows moved by all the joins of the table are compared, including the joins that would
+        no longer be co-located.
+        """
+        candidates = {}
+        for pair in self._joins:
+            for column, other in pair.columns:
+                candidates.setdefault(pair.left_table, set()).add(column)
+                candidates.setdefault(pair.right_table, set()).add(other)
+        out = []
+        for table, columns in candidates.items():
+            distribution = self.distributions[table]
+            if distribution.style == 'ALL':
+                continue
+            current = self._rows_moved(table, distribution)
+            for column in columns - {distribution.distkey}:
+                saved = current - self._rows_moved(table, distribution.with_distkey(column))
+                if saved > 0:
+                    out.append({
+                        'table': table,
+                        'current': repr(distribution),
+                        'distkey': column,
+                        'rows_moved_before': current,
+                        'rows_saved': saved
+                    })
+        return sorted(out, key=lambda recommendation: -recommendation['rows_saved'])
+
+    def report(self) -> dict:
+        """Returns the pairs of tables, the most rows moved first, and the recommendations"""
+        return {
+            'unknown_joins': self.unknown,
+            'pairs': [
+                {'tables': list(tables), **entry}
+                for tables, entry in sorted(
+                    self.pairs.items(), key=lambda item: -item[1]['rows_moved']
+                )
+            ],
+            'recommendations': self.recommendations()
+        }
+
+if __name__ == '__main__':
+    #pylint: disable=C0415
+    from concurrency import UnparsedStatement
+    from new_join_parser import connect_to_redshift, parse_file
+    from results_store import open_results
+    arguments = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    arguments.add_argument(
+        '--snapshot', help='Read the distributions from a local snapshot instead of Redshift'
+    )
+    arguments.add_argument(
+        '--save-snapshot', action='store_true',
+        help=f'Write the distributions queried from Redshift to {SNAPSHOT_FILE}'
+    )
+    options = arguments.parse_args()
+    cursor = connect_to_redshift().cursor()
+    if options.snapshot is not None:
+        _distributions = load_snapshot(options.snapshot)
+    else:
+        _distributions = query_distributions(cursor)
+        if options.save_snapshot:
+            save_snapshot(_distributions)
+    _report = DistributionReport(_distributions)
+    results = open_results()
+    _catalog = {}
+    _unparsed = 0
+    for _file_name in {path for _app, path, _position, _record in results.statements()}:
+        if not os.path.isfile(_file_name):
+            continue
+        # The statements the parser rejects are skipped instead of stopping the report.
+        _statements = parse_file(_file_name, cursor, _catalog, keep_unparsed=True)
+        _parsed = [
+            _statement for _statement in _statements
+            if not isinstance(_statement, UnparsedStatement)
+        ]
+        _unparsed += len(_statements) - len(_parsed)
+        _report.add_statements(_parsed)
+    results.close()
+    with open('distribution_report.json', 'w', encoding='utf-8') as json_file:
+        json.dump(_report.report(), json_file, indent=4)
+    print(f'{_unparsed} statements were not parsed and are left out of the report')
@@ -0,0 +1,426 @@
+"""Normalized JSON output for parsed statements.
+
+``dict(ParsedStatement)`` repeats the full table, with every column, in each select and join
+comparison. The normalized format emits every table and column once in a symbol section and
+references them by id from the statements:
+
+    {
+        "version": 1,
+        "tables": [{"id": 0, "schema": "stg", "name": "orders", "is_temp": false}],
+        "columns": [{"id": 0, "table": 0, "name": "id", "data_type": "INTEGER", ...}],
+        "statements": [{"file_name": ..., "table": 0, "aliases": {"o": 0}, "selects": [...],
+                        "joins": [...], "subqueries": [{"alias": "ocs", "statement": 1}]}]
+    }
+
+Subqueries are statements of their own and are referenced by their index in ``statements``.
+The join comparisons keep the alias of each side, as a self-join references one table by two.
+Documents are written as compact JSON, or gzip-compressed when the file name ends with ``.gz``.
+``DumpSink`` batches the writes of many statements, either into one document per source '.sql'
+file or into one document per statement named by its content hash.
+"""
+import os
+import gzip
+import json
+import hashlib
+from typing import Union
+
+FORMAT_VERSION = 1
+
+class SymbolTable():
+    """Assigns an id to every distinct table and column of the dumped statements
+
+    Attributes
+    ----------
+    tables : list of dict
+        The tables, indexed by their id
+    columns : list of dict
+        The columns, indexed by their id
+    """
+    def __init__(self) -> None:
+        self.tables = []
+        self.columns = []
+        self._table_ids = {}
+        self._column_ids = {}
+
+    def table_id(self, table) -> int:
+        """Returns the id of a ``Table``, adding it and its columns the first time it is seen"""
+        key = table.key
+        if key not in self._table_ids:
+            self._table_ids[key] = len(self.tables)
+            self.tables.append({
+                'id': len(self.tables),
+                'schema': None if table.is_temp else table.schema,
+                'name': table.table_name,
+                'is_temp': table.is_temp
+            })
+        _id = self._table_ids[key]
+        # Add the catalog columns once, the first time they are known.
+        for column in table.columns:
+            self.column_id(column, _id)
+        return _id
+
+    def column_id(self, column, table_id:int=None) -> int:
+        """Returns the id of a ``Column``, adding it the first time it is seen"""
+        if table_id is None:
+            table_id = self.table_id(column.table)
+        key = (table_id, column.column_name)
+        if key not in self._column_ids:
+            self._column_ids[key] = len(self.columns)
+            self.columns.append({'id': len(self.columns), 'table': table_id, **dict(column)})
+        return self._column_ids[key]
+
+def _normalize_statement(statement, symbols:SymbolTable, statement_ids:dict) -> dict:
+    """Returns a statement whose tables, columns and subqueries are referenced by id"""
+    selects = []
+    for _select in statement.selects:
+        _normalized = {'column_name': _select['column_name']}
+        if 'table_alias' in _select:
+            _normalized['table_alias'] = _select['table_alias']
+        if 'operation' in _select:
+            _normalized['operation'] = _select['operation']
+        if _select.get('table') is not None:
+            _normalized['table'] = symbols.table_id(_select['table'])
+        if _select.get('column') is not None:
+            _normalized['column'] = symbols.column_id(_select['column'])
+        if _select.get('subquery') is not None:
+            _normalized['subquery'] = statement_ids[id(_select['subquery'].parsedStatement)]
+        selects.append(_normalized)
+    joins = []
+    for join in statement.joins:
+        comparisons = []
+        for comparison in join.comparisons:
+            _comparison = {}
+            for side in ('left', 'right'):
+                if getattr(comparison, f'{side}_str'):
+                    _comparison[side] = getattr(comparison, side)
+                    continue
+                _table = getattr(comparison, f'{side}_table')
+                _comparison[side] = symbols.column_id(
+                    getattr(comparison, f'{side}_column'), symbols.table_id(_table)
+                )
+                # A self-join references the same table id through several aliases.
+                if _table.alias is not None:
+                    _comparison[f'{side}_alias'] = _table.alias
+            _comparison['operator'] = comparison.operator
+            comparisons.append(_comparison)
+        joins.append({'type': join.join_type, 'comparisons': comparisons})
+    return {
+        'file_name': statement.file_name,
+        'table': None if statement.table is None else symbols.table_id(statement.table),
+        'aliases': {
+            _table.alias: symbols.table_id(_table)
+            for _table in statement.table_cache if _table.alias is not None
+        },
+        'selects': selects,
+        'joins': joins,
+        'subqueries': [
+            {'alias': _subquery.alias, 'statement': statement_ids[id(_subquery.parsedStatement)]}
+            for _subquery in statement.subqueries
+        ]
+    }
+
+def normalize(statements:list) -> dict:
+    """Returns the normalized document of parsed statements
+
+    Parameters
+    ----------
+    statements : list of new_join_parser.ParsedStatement()
+        The parsed statements to dump
+
+    Returns
+    -------
+    dict
+        The tables, columns and statements, where each table and column is emitted once
+    """
+    # Give every statement and subquery an index before any of them is normalized.
+    ordered = []
+    statement_ids = {}
+    stack = list(reversed(statements))
+    while stack:
+        statement = stack.pop()
+        if id(statement) in statement_ids:
+            continue
+        statement_ids[id(statement)] = len(ordered)
+        ordered.append(statement)
+        stack.extend(reversed([_subquery.parsedStatement for _subquery in statement.subqueries]))
+    symbols = SymbolTable()
+    _statements = [
+        _normalize_statement(statement, symbols, statement_ids) for statement in ordered
+    ]
+    return {
+        'version': FORMAT_VERSION,
+        'tables': symbols.tables,
+        'columns': symbols.columns,
+        'statements': _statements
+    }
+
+def dumps(document:dict, binary:bool=False) -> Union[str, bytes]:
+    """Encodes a normalized document as compact JSON, or gzip-compressed JSON bytes"""
+    encoded = json.dumps(document, ensure_ascii=False, separators=(',', ':'))
+    if binary:
+        return gzip.compress(encoded.encode('utf-8'))
+    return encoded
+
+def loads(data:Union[str, bytes]) -> dict:
+    """Decodes a normalized document written by ``dumps()``"""
+    if isinstance(data, bytes):
+        # gzip streams always start with the same two magic bytes.
+        if data[:2] == b'\x1f\x8b':
+            data = gzip.decompress(data)
+        data = data.decode('utf-8')
+    document = json.loads(data)
+    if document.get('version') != FORMAT_VERSION:
+        raise ValueError(f'Unsupported dump format version: {document.get("version")}')
+    return document
+
+def _write_file(file_name:str, encoded:Union[str, bytes]) -> None:
+    """Writes an encoded document"""
+    if isinstance(encoded, bytes):
+        with open(file_name, 'wb') as _f:
+            _f.write(encoded)
+    else:
+        with open(file_name, 'w', encoding='utf-8') as _f:
+            _f.write(encoded)
+
+def dump(document:dict, file_name:str) -> None:
+    """Writes a normalized document, gzip-compressed when the file name ends with ``.gz``"""
+    _write_file(file_name, dumps(document, file_name.endswith('.gz')))
+
+def load(file_name:str) -> dict:
+    """Reads a normalized document written by ``dump()``"""
+    with open(file_name, 'rb') as _f:
+        return loads(_f.read())
+
+def append(document:dict, other:dict) -> dict:
+    """Appends the statements of a normalized document to another one, reusing the ids of the
+    tables and columns both documents define"""
+    table_ids, column_ids = {}, {}
+    known_tables = {
+        (table['schema'], table['name'], table['is_temp']): table['id']
+        for table in document['tables']
+    }
+    for table in other['tables']:
+        key = (table['schema'], table['name'], table['is_temp'])
+        if key not in known_tables:
+            known_tables[key] = len(document['tables'])
+            document['tables'].append({**table, 'id': known_tables[key]})
+        table_ids[table['id']] = known_tables[key]
+    known_columns = {
+        (column['table'], column['name']): column['id'] for column in document['columns']
+    }
+    for column in other['columns']:
+        key = (table_ids[column['table']], column['name'])
+        if key not in known_columns:
+            known_columns[key] = len(document['columns'])
+            document['columns'].append({**column, 'id': known_columns[key], 'table': key[0]})
+        column_ids[column['id']] = known_columns[key]
+    # The subqueries are referenced by their index, after the statements already in the document.
+    offset = len(document['statements'])
+
+    def _side(reference:Union[int, str]) -> Union[int, str]:
+        return reference if isinstance(reference, str) else column_ids[reference]
+
+    for statement in other['statements']:
+        selects = []
+        for _select in statement['selects']:
+            _select = dict(_select)
+            if 'table' in _select:
+                _select['table'] = table_ids[_select['table']]
+            if 'column' in _select:
+                _select['column'] = column_ids[_select['column']]
+            if 'subquery' in _select:
+                _select['subquery'] += offset
+            selects.append(_select)
+        document['statements'].append({
+            **statement,
+            'table': None if statement['table'] is None else table_ids[statement['table']],
+            'aliases': {alias: table_ids[_id] for alias, _id in statement['aliases'].items()},
+            'selects': selects,
+            'joins': [
+                {
+                    'type': join['type'],
+                    'comparisons': [
+                        {
+                            **comparison,
+                            'left': _side(comparison['left']),
+                            'right': _side(comparison['right'])
+                        }
+                        for comparison in join['comparisons']
+                    ]
+                }
+                for join in statement['joins']
+            ],
+            'subqueries': [
+                {**_subquery, 'statement': _subquery['statement'] + offset}
+                for _subquery in statement['subqueries']
+            ]
+        })
+    return document
+
+def denormalize(document:dict) -> list:
+    """Expands a normalized document into the ``dict(ParsedStatement)`` format
+
+    Every reference is replaced by the full table or column it points to, for tools written
+    against the previous dump format.
+    """
+    columns_by_table = {}
+    for column in document['columns']:
+        columns_by_table.setdefault(column['table'], []).append(column)
+
+    def _table(table_id:int, alias:str=None) -> dict:
+        table = document['tables'][table_id]
+        return {
+            'schema': table['schema'] if table['schema'] is not None else table['name'],
+            'name': table['name'],
+            'alias': alias,
+            'columns': [_column(column) for column in columns_by_table.get(table_id, [])]
+        }
+
+    def _column(column:dict) -> dict:
+        return {key: value for key, value in column.items() if key not in ('id', 'table')}
+
+    def _side(reference:Union[int, str], alias:str, aliases:dict) -> Union[dict, str]:
+        if isinstance(reference, str):
+            return reference
+        column = document['columns'][reference]
+        # The documents written before the aliases of the sides were kept only have the
+        # statement's aliases.
+        if alias is None:
+            alias = aliases.get(column['table'])
+        return {'table': _table(column['table'], alias), 'column': _column(column)}
+
+    out = []
+    for statement in document['statements']:
+        aliases = {table_id: alias for alias, table_id in statement['aliases'].items()}
+        expanded = {}
+        if statement['table'] is not None:
+            expanded['table'] = _table(statement['table'], aliases.get(statement['table']))
+        selects = []
+        for _select in statement['selects']:
+            _expanded = {
+                key: value for key, value in _select.items()
+                if key not in ('table', 'column', 'subquery')
+            }
+            if 'table' in _select:
+                _expanded['table'] = _table(_select['table'], _select.get('table_alias'))
+            if 'column' in _select:
+                _expanded['column'] = _column(document['columns'][_select['column']])
+            if 'subquery' in _select:
+                _expanded['subquery'] = _select['subquery']
+            selects.append(_expanded)
+        expanded['selects'] = selects
+        expanded['file_name'] = statement['file_name']
+        expanded['joins'] = [
+            {
+                'type': join['type'],
+                'comparisons': [
+                    {
+                        'left': _side(
+                            comparison['left'], comparison.get('left_alias'), aliases
+                        ),
+                        'right': _side(
+                            comparison['right'], comparison.get('right_alias'), aliases
+                        ),
+                        'operator': comparison['operator']
+                    }
+                    for comparison in join['comparisons']
+                ]
+            }
+            for join in statement['joins']
+        ]
+        out.append(expanded)
+    return out
+
+class DumpSink():
+    """Buffers parsed statements and writes them as normalized documents in batches
+
+    Attributes
+    ----------
+    directory : str
+        The directory the documents are written to
+    binary : bool
+        Whether the documents are gzip-compressed
+    consolidate : bool
+        Whether the statements of a source '.sql' file are written to a single document named
+        after it and the hash of its path, instead of one document per statement named by its
+        content hash
+    batch_size : int
+        The number of statements buffered before they are written when not consolidating
+    written : list of str
+        The files written so far
+    """
+    def __init__(
+        self, directory:str, binary:bool=False, consolidate:bool=True, batch_size:int=256
+    ) -> None:
+        self.directory = directory
+        self.binary = binary
+        self.consolidate = consolidate
+        self.batch_size = batch_size
+        self.written = []
+        self._buffer = {}
+        self._buffered = 0
+        self._digests = set()
+        self._has_directory = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.flush()
+
+    @property
+    def extension(self) -> str:
+        """The extension of the documents written by the sink"""
+        return '.json.gz' if self.binary else '.json'
+
+    def add(self, statement) -> None:
+        """Buffers a parsed statement, writing the buffered ones when a batch is complete"""
+        # The statements of a file are parsed together, so the previous files are complete.
+        if self.consolidate and statement.file_name not in self._buffer:
+            self.flush()
+        self._buffer.setdefault(statement.file_name, []).append(statement)
+        self._buffered += 1
+        if not self.consolidate and self._buffered >= self.batch_size:
+            self.flush()
+
+    def _write(self, file_name:str, encoded:Union[str, bytes]) -> None:
+        """Writes an encoded document to the sink's directory"""
+        if not self._has_directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._has_directory = True
+        path = os.path.join(self.directory, file_name)
+        _write_file(path, encoded)
+        self.written.append(path)
+
+    def _write_source(self, source_file:str, document:dict) -> None:
+        """Writes the document of a source '.sql' file, appended to the statements of the file
+        the sink already wrote"""
+        # The scripts of different apps share names, so the name includes the hash of the path.
+        name = os.path.splitext(os.path.basename(source_file or 'statements'))[0]
+        digest = hashlib.sha1((source_file or '').encode('utf-8')).hexdigest()[:8]
+        path = os.path.join(self.directory, f'{name}.{digest}{self.extension}')
+        if path in self.written:
+            document = append(load(path), document)
+            self.written.remove(path)
+        self._write(os.path.basename(path), dumps(document, self.binary))
+
+    def flush(self) -> None:
+        """Writes every buffered statement"""
+        for source_file, statements in self._buffer.items():
+            if self.consolidate:
+                self._write_source(source_file, normalize(statements))
+                continue
+            for statement in statements:
+                encoded = dumps(normalize([statement]))
+                # Identical statements share a file instead of overwriting each other's.
+                digest = hashlib.sha1(encoded.encode('utf-8')).hexdigest()[:12]
+                name = statement.table.table_name if statement.table is not None else 'statement'
+                if f'{name}.{digest}' in self._digests:
+                    continue
+                self._digests.add(f'{name}.{digest}')
+                self._write(
+                    f'{name}.{digest}{self.extension}',
+                    gzip.compress(encoded.encode('utf-8')) if self.binary else encoded
+                )
+        self._buffer = {}
+        self._buffered = 0
@@ -1,22 +1,8 @@
 import json
-import pandas as pd
+from key_tables import statuses_from_known_tables, write_app_csvs
 
 with open('known_tables.json') as f:
   data = json.load(f)
 
-# out_df = pd.DataFrame( columns=['Source', 'Name', 'Found In Documentation'] )
-out_dict = {
-    'Source':[], 'Name':[], 'Found In Documentation':[]
-}
-for app in data.keys():
-    found_tables = data[app]['found'] + data[app]['unknown']
-    sources = [table.split('.')[0] for table in found_tables]
-    name = ['.'.join(table.split('.')[1:]) for table in found_tables]
-    found = [table in data[app]['found'] for table in found_tables]
-    print( 
-        pd.DataFrame( {
-            'Source': [table.split('.')[0] for table in found_tables], 
-            'Name': ['.'.join(table.split('.')[1:]) for table in found_tables], 
-            'Found In Documentation': [table in data[app]['found'] for table in found_tables]
-        } ).to_csv( f'{app}.csv' )
-    )
+# Write the source and name of every app's tables, and whether they are found in KeyTables
+write_app_csvs( statuses_from_known_tables( data ) )
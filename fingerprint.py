@@ -0,0 +1,144 @@
+"""Groups the statements of every app by query template to find duplicated warehouse work.
+
+A template is the statement with its comments removed, its literals and ``<start_date>``-style
+placeholders replaced by ``?``, its identifiers case-folded and its whitespace collapsed. Two
+statements with the same template run the same work on Redshift, even when they load different
+shops or dates.
+"""
+import re
+import json
+import hashlib
+from functools import lru_cache
+from sqlparse import lexer
+from sqlparse.tokens import Comment, Whitespace, Newline, String, Number
+from results_store import ResultsStore, open_results
+
+# The ``<start_date>``-style placeholders, with the quotes around them
+PLACEHOLDER = re.compile(r"'*<[a-z_][a-z0-9_]*>'*", re.IGNORECASE)
+# A list of literals, like ``IN ('US', 'AU', 'CA')``
+_LITERAL_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+# Literals written next to each other
+_LITERAL_RUN = re.compile(r'\?(?:[-+]?\?)+')
+# The keywords followed by a table the statement scans
+_SCAN = re.compile(r'\b(?:from|join|using)\s+[a-z_"]')
+
+@lru_cache(maxsize=4096)
+def template(sql:str) -> str:
+    """Returns the query template of a SQL statement"""
+    parts = []
+    for ttype, value in lexer.tokenize(PLACEHOLDER.sub('?', sql)):
+        if ttype in Comment:
+            continue
+        if ttype in Whitespace or ttype in Newline:
+            if parts and parts[-1] != ' ':
+                parts.append(' ')
+        elif ttype in String.Single or ttype in Number:
+            parts.append('?')
+        elif ttype in String.Symbol:
+            # Redshift case-folds quoted identifiers as well.
+            parts.append(value.strip('"').lower())
+        else:
+            parts.append(value.lower())
+    text = ''.join(parts).strip().rstrip(';').strip()
+    # The spaces around punctuation depend on the author, not on the query.
+    text = re.sub(r'\s*([,;=<>+*/-]|::)\s*', r'\1', text)
+    text = re.sub(r'\s*\(\s*', '(', text)
+    text = re.sub(r'\s+\)', ')', text)
+    # A quoted date, like ``''2021-01-05''``, is lexed as several literals.
+    text = _LITERAL_RUN.sub('?', text)
+    return _LITERAL_LIST.sub('(?)', text)
+
+def template_hash(sql:str) -> str:
+    """Returns the fingerprint of a SQL statement: the hash of its query template"""
+    return hashlib.sha1(template(sql).encode('utf-8')).hexdigest()[:16]
+
+def estimated_cost(template_text:str) -> int:
+    """Returns the number of tables a template scans, used as its cost when the query history is
+    not known"""
+    return max(1, len(_SCAN.findall(template_text)))
+
+class TemplateIndex():
+    """Maps every query template to the statements running it
+
+    Attributes
+    ----------
+    templates : dict of str to dict
+        The template, statement type and occurrences of every fingerprint
+    """
+    def __init__(self) -> None:
+        self.templates = {}
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def add(self, app:str, file_name:str, step:str, position:int, record:dict) -> str:
+        """Adds a ``sql.json`` record to the index and returns its fingerprint"""
+        fingerprint = template_hash(record['value'])
+        entry = self.templates.setdefault(fingerprint, {
+            'template': template(record['value']),
+            'type': record.get('type'),
+            'occurrences': []
+        })
+        entry['occurrences'].append({
+            'app': app,
+            'file': file_name,
+            'step': step,
+            'position': position,
+            'target': record.get('target')
+        })
+        return fingerprint
+
+    @classmethod
+    def from_store(cls, store:ResultsStore):
+        """Returns the index of every statement stored in the results database"""
+        index = cls()
+        steps = store.file_steps()
+        for app, file_name, position, record in store.statements():
+            index.add(app, file_name, steps.get((app, file_name)), position, record)
+        return index
+
+    def get(self, fingerprint:str) -> dict:
+        """Returns the template and occurrences of a fingerprint or ``None`` when it is unknown"""
+        return self.templates.get(fingerprint)
+
+    def clusters(self, min_occurrences:int=2) -> list:
+        """Returns the templates run by several statements, the most redundant work first
+
+        Returns
+        -------
+        list of dict
+            The fingerprint, template, occurrences, apps and estimated costs of each template.
+            ``redundant_cost`` is the cost of every occurrence after the first one.
+        """
+        out = []
+        for fingerprint, entry in self.templates.items():
+            occurrences = entry['occurrences']
+            if len(occurrences) < min_occurrences:
+                continue
+            cost = estimated_cost(entry['template'])
+            out.append({
+                'fingerprint': fingerprint,
+                'type': entry['type'],
+                'template': entry['template'],
+                'apps': sorted({occurrence['app'] for occurrence in occurrences}),
+                'occurrences': occurrences,
+                'estimated_cost': cost * len(occurrences),
+                'redundant_cost': cost * (len(occurrences) - 1)
+            })
+        return sorted(
+            out, key=lambda cluster: (-cluster['redundant_cost'], -cluster['estimated_cost'])
+        )
+
+if __name__ == '__main__':
+    results = open_results()
+    _index = TemplateIndex.from_store(results)
+    results.close()
+    _clusters = _index.clusters()
+    with open('query_templates.json', 'w', encoding='utf-8') as json_file:
+        json.dump(_clusters, json_file, indent=4)
+    print(f'{len(_index)} templates, {len(_clusters)} run more than once')
+    for _cluster in _clusters[:10]:
+        print(
+            f'{_cluster["redundant_cost"]:>4} {len(_cluster["occurrences"]):>3}x'
+            + f' {", ".join(_cluster["apps"])}: {_cluster["template"][:80]}'
+        )
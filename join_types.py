@@ -0,0 +1,172 @@
+"""Finds the join predicates comparing columns of different types across every parsed statement.
+
+Redshift casts one side of a join comparing ``varchar`` with ``integer``, or ``varchar(256)`` with
+``varchar(36)``, before comparing them, and the cast side is no longer joined on its distribution
+or sort key. Every equality join is checked for:
+
+- ``type``: the catalog columns of both sides have different data types
+- ``length``: both sides have the same data type but different lengths
+- ``cast``: a side is cast explicitly, like ``o.id::varchar`` or ``CAST(o.id AS varchar)``
+
+The findings are grouped by the pair of tables joined, the pairs joined the most first.
+"""
+import os
+import re
+import json
+from typing import Union
+
+# An explicit cast of a join key
+_CAST = re.compile(r'::|^\s*(?:cast|convert)\s*\(', re.IGNORECASE)
+# The ``alias.column`` cast by a join key
+_CAST_COLUMN = re.compile(r'([a-z_][a-z0-9_$]*)\s*\.\s*"?([a-z_][a-z0-9_$]*)"?', re.IGNORECASE)
+
+def _describe(table, column) -> str:
+    """Returns the table, column and type of a side of a join"""
+    data_type = column.data_type
+    # The length of the integer types is their fixed precision.
+    if column.data_length and data_type.startswith(('CHARACTER', 'NUMERIC')):
+        data_type += f'({column.data_length})'
+    return f'{table.key}.{column.column_name} {data_type}'
+
+def _cast_side(statement, text:str) -> Union[tuple, None]:
+    """Returns the table and column cast by a side of a join, or ``None`` when the side is not
+    a cast of a table's column"""
+    if not _CAST.search(text):
+        return None
+    match = _CAST_COLUMN.search(text)
+    if match is None:
+        return None
+    _table = statement.get_alias_in_cache(match.group(1))
+    # The columns of subqueries and CTEs have no catalog type.
+    if _table is None or not hasattr(_table, 'key'):
+        return None
+    return _table, _table.get_column(match.group(2).lower())
+
+def comparison_mismatch(statement, comparison) -> Union[dict, None]:
+    """Returns the mismatch of a join comparison, or ``None`` when both sides have the same type
+
+    Parameters
+    ----------
+    statement : new_join_parser.ParsedStatement()
+        The statement the comparison is found in, used to resolve the cast columns
+    comparison : parse_types.JoinComparison()
+        The comparison of a join
+    """
+    if comparison.operator != '=':
+        return None
+    sides = []
+    casts = []
+    for is_str, text, table, column in (
+        (comparison.left_str, getattr(comparison, 'left', None),
+            comparison.left_table, comparison.left_column),
+        (comparison.right_str, getattr(comparison, 'right', None),
+            comparison.right_table, comparison.right_column)
+    ):
+        if is_str:
+            cast = _cast_side(statement, text)
+            if cast is None:
+                return None
+            sides.append(cast)
+            casts.append(text.strip())
+        else:
+            sides.append((table, column))
+    (left_table, left_column), (right_table, right_column) = sides
+    # The columns of the temp tables the script did not create have no known type.
+    if 'UNKNOWN' in (left_column.data_type, right_column.data_type):
+        return None
+    if casts:
+        kind = 'cast'
+    elif left_column.data_type != right_column.data_type:
+        kind = 'type'
+    elif (left_column.data_length or 0) != (right_column.data_length or 0):
+        kind = 'length'
+    else:
+        return None
+    left, right = _describe(left_table, left_column), _describe(right_table, right_column)
+    tables = (left_table.key, right_table.key)
+    if tables[0] > tables[1]:
+        left, right, tables = right, left, tables[::-1]
+    return {'kind': kind, 'tables': tables, 'left': left, 'right': right, 'casts': casts}
+
+class JoinTypeReport():
+    """Groups the mismatched join predicates of the corpus by the pair of tables joined
+
+    Attributes
+    ----------
+    pairs : dict of tuple to dict
+        The number of mismatched predicates and the distinct mismatches of every pair of tables
+    """
+    def __init__(self) -> None:
+        self.pairs = {}
+
+    def add_statements(self, statements:list) -> None:
+        """Checks the joins of parsed statements, with their subqueries and CTEs"""
+        for parsed in statements:
+            for statement in parsed.walk():
+                for join in statement.joins:
+                    for comparison in join.comparisons:
+                        mismatch = comparison_mismatch(statement, comparison)
+                        if mismatch is not None:
+                            self._add(mismatch, statement.file_name)
+
+    def _add(self, mismatch:dict, file_name:str) -> None:
+        """Counts a mismatched predicate for its pair of tables"""
+        entry = self.pairs.setdefault(mismatch['tables'], {'occurrences': 0, 'mismatches': {}})
+        entry['occurrences'] += 1
+        key = (mismatch['kind'], mismatch['left'], mismatch['right'], tuple(mismatch['casts']))
+        found = entry['mismatches'].setdefault(key, {
+            'kind': mismatch['kind'],
+            'left': mismatch['left'],
+            'right': mismatch['right'],
+            'casts': mismatch['casts'],
+            'occurrences': 0,
+            'files': set()
+        })
+        found['occurrences'] += 1
+        if file_name is not None:
+            found['files'].add(os.path.basename(file_name))
+
+    def report(self) -> list:
+        """Returns the pairs of tables with mismatched joins, the most occurrences first"""
+        return [
+            {
+                'tables': list(tables),
+                'occurrences': entry['occurrences'],
+                'mismatches': sorted(
+                    (
+                        {**found, 'files': sorted(found['files'])}
+                        for found in entry['mismatches'].values()
+                    ),
+                    key=lambda found: -found['occurrences']
+                )
+            }
+            for tables, entry in sorted(
+                self.pairs.items(), key=lambda item: -item[1]['occurrences']
+            )
+        ]
+
+if __name__ == '__main__':
+    #pylint: disable=C0415
+    from concurrency import UnparsedStatement
+    from new_join_parser import connect_to_redshift, parse_file
+    from results_store import open_results
+    cursor = connect_to_redshift().cursor()
+    _report = JoinTypeReport()
+    results = open_results()
+    _catalog = {}
+    _unparsed = 0
+    for _file_name in {path for _app, path, _position, _record in results.statements()}:
+        if not os.path.isfile(_file_name):
+            continue
+        # The statements the parser rejects are skipped instead of stopping the report.
+        _statements = parse_file(_file_name, cursor, _catalog, keep_unparsed=True)
+        _parsed = [
+            _statement for _statement in _statements
+            if not isinstance(_statement, UnparsedStatement)
+        ]
+        _unparsed += len(_statements) - len(_parsed)
+        _report.add_statements(_parsed)
+    results.close()
+    with open('join_type_mismatches.json', 'w', encoding='utf-8') as json_file:
+        json.dump(_report.report(), json_file, indent=4)
+    print(f'{_unparsed} statements were not parsed and are left out of the report')
@@ -0,0 +1,131 @@
+"""Reconciles the tables used by each app with the KeyTables export from Google Sheets.
+
+Tables given by @sujay.kar
+https://docs.google.com/spreadsheets/d/1N6PS2BmfQNAkKvIeKOPCmCZaVXszkSuhDJOZXLCKSeY/edit?usp=sharing
+
+There are 3 possible outcomes for every table an app uses:
+1. ``found``: the table and its data source are found in KeyTables
+2. ``not found``: the table is found in KeyTables with another data source
+3. ``unknown``: the table is not found in KeyTables
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+from utils import canonical_table_name, table_name_cleaner
+
+# The columns of the Google Sheets export
+COLUMN_NAMES = [
+    'Table Name',
+    'Focus Area',
+    'Data Source',
+    'Business Critical',
+    'Business Purpose & Insights Driven',
+    'Key Metrics',
+    'Key Dimensions',
+    'Joins'
+]
+STATUSES = ('found', 'not found', 'unknown')
+
+def clean_table_names(table_names:pd.Series) -> pd.Series:
+    """Returns the canonical table names without the schemas KeyTables leaves out"""
+    return table_names.map(table_name_cleaner)
+
+def load_key_tables(file_name:str='KeyTables.csv') -> pd.DataFrame:
+    """Reads the KeyTables export once and adds the keys used to match the tables
+
+    Returns
+    -------
+    pd.DataFrame
+        The KeyTables rows with the lowercase ``name`` of the table and its ``full_name``
+        prefixed with its data source
+    """
+    table_df = pd.read_csv(file_name, names=COLUMN_NAMES, skiprows=[0, 1], index_col=False) \
+        .dropna(subset=['Table Name'])
+    for column in ('Table Name', 'Focus Area', 'Data Source'):
+        table_df[column] = table_df[column].str.strip()
+    table_df['name'] = clean_table_names(table_df['Table Name'])
+    table_df['full_name'] = table_df['Data Source'].str.lower() + '.' + table_df['name']
+    return table_df
+
+def reconcile(tables_by_app:dict, table_df:pd.DataFrame) -> pd.DataFrame:
+    """Classifies every table used by every app as ``found``, ``not found`` or ``unknown``
+
+    Parameters
+    ----------
+    tables_by_app : dict of str to list
+        The tables used by each app, as found in ``apps_modifying_tables.json``
+    table_df : pd.DataFrame
+        The KeyTables export read with ``load_key_tables()``
+
+    Returns
+    -------
+    pd.DataFrame
+        The ``app``, ``table`` and ``status`` of every table used by every app
+    """
+    discovered = pd.DataFrame(
+        [(app, table) for app, _tables in tables_by_app.items() for table in _tables],
+        columns=['app', 'table']
+    )
+    names = clean_table_names(discovered['table'])
+    full_names = discovered['table'].map(canonical_table_name)
+    # Both lookups are hash joins against the unique KeyTables keys.
+    found = full_names.isin(pd.Index(table_df['full_name'].unique()))
+    named = names.isin(pd.Index(table_df['name'].unique()))
+    discovered['status'] = np.select([found, named], STATUSES[:2], STATUSES[2])
+    return discovered
+
+def known_tables(statuses:pd.DataFrame, apps:list) -> dict:
+    """Returns the ``known_tables.json`` contents of the apps"""
+    out = {app: {status: [] for status in STATUSES} for app in apps}
+    for (app, status), group in statuses.groupby(['app', 'status'], sort=False):
+        if app in out:
+            out[app][status] = group['table'].to_list()
+    return out
+
+def statuses_from_known_tables(data:dict) -> pd.DataFrame:
+    """Returns the statuses stored in a ``known_tables.json`` file as a DataFrame"""
+    return pd.DataFrame(
+        [
+            (app, table, status)
+            for app, app_statuses in data.items()
+            for status, _tables in app_statuses.items()
+            for table in _tables
+        ],
+        columns=['app', 'table', 'status']
+    )
+
+def write_app_csvs(statuses:pd.DataFrame, directory:str='.') -> None:
+    """Writes a '.csv' per app with the source and name of its tables and whether the table is
+    found in KeyTables."""
+    split_names = statuses['table'].str.split('.', n=1)
+    out_df = pd.DataFrame({
+        'app': statuses['app'],
+        'Source': split_names.str[0],
+        'Name': split_names.str[1].fillna(''),
+        'Found In Documentation': statuses['status'] == 'found'
+    })
+    for app, group in out_df.groupby('app', sort=False):
+        group.drop(columns='app').reset_index(drop=True).to_csv(
+            os.path.join(directory, f'{app}.csv')
+        )
+
+def write_outputs(
+    statuses:pd.DataFrame, apps:list, known_tables_file:str='known_tables.json',
+    directory:str='.'
+) -> None:
+    """Writes ``known_tables.json`` and the per-app '.csv' files from a single reconciliation"""
+    with open(known_tables_file, 'w', encoding='utf-8') as json_file:
+        json.dump(known_tables(statuses, apps), json_file)
+    write_app_csvs(statuses[statuses['app'].isin(apps)], directory)
+
+def print_statuses(statuses:pd.DataFrame, apps:list) -> None:
+    """Prints the status of the tables of every app"""
+    marks = {'found': '[X]', 'not found': '[ ]', 'unknown': '[?]'}
+    by_app = {app: group for app, group in statuses.groupby('app', sort=False)}
+    for app in apps:
+        print(app)
+        if app not in by_app:
+            continue
+        for table, status in by_app[app][['table', 'status']].itertuples(index=False):
+            print(f'\t{marks[status]} {table}')
@@ -0,0 +1,295 @@
+"""Keeps the table graph of the ETL pipeline in memory and answers lineage queries.
+
+The daemon watches ``PARSE_PATH`` for changed '.sql' scripts and ``app_config.yml`` files, parses
+only the scripts that changed, and answers queries over HTTP on localhost:
+
+    GET /touches?table=stg.orders
+    GET /lineage?table=dmt.f_invoice&direction=upstream
+    GET /status
+"""
+import os
+import json
+import time
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from dotenv import load_dotenv
+from corpus import app_sql_files, app_sql_scripts, parse_sql_file, statement_reads
+from utils import table_key
+
+# Load the values found in the local ``.env`` file.
+load_dotenv()
+
+PARSE_PATH = os.getenv('PARSE_PATH')
+LINEAGE_PORT = int(os.getenv('LINEAGE_PORT', '8765'))
+# The number of seconds between two scans of ``PARSE_PATH``
+WATCH_INTERVAL = float(os.getenv('LINEAGE_WATCH_INTERVAL', '2'))
+
+class LineageIndex():
+    """The parse results and table graph of every app, kept up to date incrementally
+
+    Attributes
+    ----------
+    parse_path : str
+        The directory holding the apps
+    files : dict
+        The app, modification time and ``sql.json`` records of every parsed '.sql' file
+    steps : dict
+        The modification time of each app's ``app_config.yml`` and the step running each file
+    readers : dict of str to Counter
+        The files reading each table, counted per statement
+    writers : dict of str to Counter
+        The files writing each table, counted per statement
+    upstream : dict of str to Counter
+        The tables read by the statements writing each table
+    downstream : dict of str to Counter
+        The tables written by the statements reading each table
+    """
+    def __init__(self, parse_path:str) -> None:
+        self.parse_path = parse_path
+        self.files = {}
+        self.steps = {}
+        self.readers = {}
+        self.writers = {}
+        self.upstream = {}
+        self.downstream = {}
+        self.lock = threading.RLock()
+        self.last_refresh = None
+
+    def _edges(self, records:list):
+        """Yields the ``(reads, target)`` table keys of the records"""
+        for record in records:
+            if record.get('skipped', False):
+                continue
+            yield statement_reads(record), record.get('target')
+
+    def _apply(self, file_name:str, records:list, sign:int) -> None:
+        """Adds (``sign=1``) or removes (``sign=-1``) the edges of a file from the graph"""
+        def _update(index:dict, key:str, value:str):
+            counter = index.setdefault(key, Counter())
+            counter[value] += sign
+            if counter[value] <= 0:
+                del counter[value]
+            if not counter:
+                del index[key]
+        for reads, target in self._edges(records):
+            for _table in reads:
+                _update(self.readers, _table, file_name)
+            if target is None:
+                continue
+            _update(self.writers, target, file_name)
+            for _table in reads:
+                _update(self.upstream, target, _table)
+                _update(self.downstream, _table, target)
+
+    def _parse_file(self, file_name:str, mtimes:dict):
+        """Returns the modification time and ``sql.json`` records of a '.sql' file, or ``None``
+        when it did not change since it was last parsed"""
+        mtime = os.path.getmtime(file_name)
+        if mtimes.get(file_name) == mtime:
+            return None
+        return mtime, parse_sql_file(file_name)
+
+    def _read_steps(self, app:str, mtimes:dict):
+        """Returns the modification time of an app's ``app_config.yml`` and the step running
+        each file, or ``None`` when it did not change since it was last read"""
+        config_file = os.path.join(self.parse_path, app, 'config', 'app_config.yml')
+        mtime = os.path.getmtime(config_file) if os.path.isfile(config_file) else None
+        if app in mtimes and mtimes[app] == mtime:
+            return None
+        return {
+            'mtime': mtime,
+            'files': {
+                file_name: step_name
+                for step_name, file_name in app_sql_scripts(self.parse_path, app)
+            }
+        }
+
+    def refresh(self) -> list:
+        """Parses every '.sql' file and ``app_config.yml`` that changed since the last refresh
+
+        The files are parsed without holding the lock, so the queries are answered meanwhile, and
+        the parse results are swapped into the index under the lock. A file deleted while it is
+        parsed is left for the next refresh.
+
+        Returns
+        -------
+        list of str
+            The files that were parsed again or removed
+        """
+        with self.lock:
+            file_mtimes = {file_name: _file['mtime'] for file_name, _file in self.files.items()}
+            step_mtimes = {app: steps['mtime'] for app, steps in self.steps.items()}
+        apps = [
+            app for app in sorted(os.listdir(self.parse_path))
+            if os.path.isdir(os.path.join(self.parse_path, app))
+        ]
+        seen = set()
+        parsed_steps = {}
+        parsed_files = {}
+        for app in apps:
+            try:
+                steps = self._read_steps(app, step_mtimes)
+            except FileNotFoundError:
+                steps = None
+            if steps is not None:
+                parsed_steps[app] = steps
+            for file_name in app_sql_files(self.parse_path, app):
+                try:
+                    parsed = self._parse_file(file_name, file_mtimes)
+                except FileNotFoundError:
+                    continue
+                seen.add(file_name)
+                if parsed is not None:
+                    parsed_files[file_name] = (app, *parsed)
+        changed = []
+        with self.lock:
+            for app, steps in parsed_steps.items():
+                self.steps[app] = steps
+                if steps['mtime'] is not None:
+                    changed.append(os.path.join(self.parse_path, app, 'config', 'app_config.yml'))
+            for file_name, (app, mtime, records) in parsed_files.items():
+                if file_name in self.files:
+                    self._apply(file_name, self.files[file_name]['records'], -1)
+                self.files[file_name] = {'app': app, 'mtime': mtime, 'records': records}
+                self._apply(file_name, records, 1)
+                changed.append(file_name)
+            # Drop the files that were deleted since the last refresh.
+            for file_name in [file_name for file_name in self.files if file_name not in seen]:
+                self._apply(file_name, self.files.pop(file_name)['records'], -1)
+                changed.append(file_name)
+            for app in [app for app in self.steps if app not in apps]:
+                del self.steps[app]
+            self.last_refresh = time.time()
+        return changed
+
+    def _describe(self, file_name:str) -> dict:
+        """Returns the app and step running a '.sql' file"""
+        app = self.files[file_name]['app']
+        return {
+            'app': app,
+            'file': os.path.basename(file_name),
+            'step': self.steps.get(app, {}).get('files', {}).get(file_name)
+        }
+
+    def touches(self, table:str) -> dict:
+        """Returns the apps, files and steps reading and writing a table"""
+        table = table_key(table)
+        with self.lock:
+            return {
+                'table': table,
+                'readers': [
+                    self._describe(file_name)
+                    for file_name in sorted(self.readers.get(table, {}))
+                ],
+                'writers': [
+                    self._describe(file_name)
+                    for file_name in sorted(self.writers.get(table, {}))
+                ]
+            }
+
+    def lineage(self, table:str, direction:str='upstream') -> dict:
+        """Returns every table the given table is built from, or feeds into
+
+        Parameters
+        ----------
+        table : str
+            The name of the table
+        direction : str, default to 'upstream'
+            Either ``upstream`` for the tables it is built from or ``downstream`` for the tables
+            built from it
+
+        Returns
+        -------
+        dict
+            The tables found at each distance from the given table
+        """
+        if direction not in ('upstream', 'downstream'):
+            raise ValueError(f'Unknown lineage direction: {direction}')
+        graph = self.upstream if direction == 'upstream' else self.downstream
+        table = table_key(table)
+        with self.lock:
+            seen = {table}
+            levels = []
+            frontier = [table]
+            while frontier:
+                _next = sorted({
+                    neighbor for _table in frontier for neighbor in graph.get(_table, {})
+                    if neighbor not in seen
+                })
+                if _next:
+                    levels.append(_next)
+                seen.update(_next)
+                frontier = _next
+        return {'table': table, 'direction': direction, 'levels': levels}
+
+    def status(self) -> dict:
+        """Returns the size of the index and the time of the last refresh"""
+        with self.lock:
+            return {
+                'parse_path': self.parse_path,
+                'apps': len(self.steps),
+                'files': len(self.files),
+                'statements': sum(len(_file['records']) for _file in self.files.values()),
+                'tables': len(set(self.readers) | set(self.writers)),
+                'last_refresh': self.last_refresh
+            }
+
+class LineageRequestHandler(BaseHTTPRequestHandler):
+    """Answers the lineage queries using the server's ``LineageIndex``"""
+    def do_GET(self): #pylint: disable=C0103
+        """Routes a ``GET`` request to the index"""
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        index = self.server.index
+        try:
+            if url.path == '/touches' and 'table' in query:
+                self._send(200, index.touches(query['table']))
+            elif url.path == '/lineage' and 'table' in query:
+                self._send(200, index.lineage(query['table'], query.get('direction', 'upstream')))
+            elif url.path == '/status':
+                self._send(200, index.status())
+            else:
+                self._send(404, {'error': f'Unknown request: {self.path}'})
+        except ValueError as error:
+            self._send(400, {'error': str(error)})
+
+    def _send(self, code:int, body:dict) -> None:
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args): #pylint: disable=W0622
+        """Silences the per-request logging"""
+
+def watch(index:LineageIndex, interval:float) -> None:
+    """Refreshes the index every ``interval`` seconds
+
+    A refresh failing, like on an ``app_config.yml`` being edited, is logged and the index is
+    refreshed again after the next ``interval``.
+    """
+    while True:
+        try:
+            for file_name in index.refresh():
+                print(f'Parsed {file_name}')
+        except Exception as error: #pylint: disable=W0703
+            print(f'Refresh failed: {type(error).__name__}: {error}')
+        time.sleep(interval)
+
+def serve(parse_path:str, port:int, interval:float) -> None:
+    """Parses every app once, then watches for changes and answers queries on localhost"""
+    index = LineageIndex(parse_path)
+    index.refresh()
+    print(f'Indexed {index.status()["files"]} files')
+    threading.Thread(target=watch, args=(index, interval), daemon=True).start()
+    server = ThreadingHTTPServer(('127.0.0.1', port), LineageRequestHandler)
+    server.index = index
+    print(f'Answering lineage queries on http://127.0.0.1:{port}')
+    server.serve_forever()
+
+if __name__ == '__main__':
+    serve(PARSE_PATH, LINEAGE_PORT, WATCH_INTERVAL)
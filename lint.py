@@ -0,0 +1,315 @@
+"""Flags the SQL performance anti-patterns of the '.sql' scripts of the ETL.
+
+Every statement is walked once and each group of tokens is checked by every rule:
+
+- ``cross_join``: a ``CROSS JOIN``, or tables listed after ``FROM`` without a ``WHERE`` clause
+- ``missing_join_predicate``: a ``JOIN`` without an ``ON`` or ``USING`` clause
+- ``non_sargable``: a function or cast applied to a filtered column, which zone maps cannot prune
+- ``distinct_over_join``: a ``SELECT DISTINCT`` over joins, which can hide a fan-out of rows
+- ``order_by_in_load``: an ``ORDER BY`` in a ``CREATE TABLE AS`` or ``INSERT``, which sorts rows the
+  table does not keep in order
+- ``not_in_subquery``: a ``NOT IN (SELECT ...)``, which Redshift cannot run as an anti-join
+- ``correlated_subquery``: a subquery in the select list referencing the outer query, run per row
+- ``select_star``: a ``SELECT *`` from a table, or from a wide table when the column counts are
+  known
+
+The rules only use the tokens of the statements, so no Redshift connection is needed and the
+linter can run on every commit. Every finding has the file, line and column it is found at.
+"""
+import os
+import re
+import sys
+import json
+import bisect
+import argparse
+import sqlparse
+from sqlparse.sql import (
+    Statement, Where, Comparison, Function, Identifier, IdentifierList, Parenthesis
+)
+from sqlparse.tokens import Keyword, DML, Wildcard, Name, Comment, Operator
+from utils import table_key, parse_table_name
+
+# The alias qualifying a column, like the ``o`` of ``o.id``
+_QUALIFIER = re.compile(r'\b([a-z_][a-z0-9_$]*)\s*\.', re.IGNORECASE)
+# The number of columns a table needs for ``SELECT *`` to be flagged, when the counts are known
+WIDE_COLUMNS = 30
+
+def _significant(children:list) -> list:
+    """Returns the ``(token, offset)`` children that are not whitespace or comments"""
+    return [
+        (token, offset) for token, offset in children
+        if not token.is_whitespace and token.ttype not in Comment
+        and not isinstance(token, sqlparse.sql.Comment)
+    ]
+
+def _has_select(token) -> bool:
+    """Returns whether a group is a query, holding a ``SELECT``"""
+    return token.is_group and any(
+        item.ttype is DML and item.value.upper() == 'SELECT' for item in token.tokens
+    )
+
+def _has_column(token) -> bool:
+    """Returns whether a token references a column"""
+    if token.ttype is Name:
+        return True
+    # The name of a function is not a column, only its arguments can be.
+    if isinstance(token, Function):
+        return any(_has_column(item) for item in token.tokens if isinstance(item, Parenthesis))
+    return token.is_group and any(_has_column(item) for item in token.tokens)
+
+def _keyword(token) -> str:
+    """Returns the upper-case value of a keyword, or an empty string for any other token"""
+    if token.ttype is not None and token.ttype in Keyword:
+        return ' '.join(token.value.upper().split())
+    return ''
+
+def _tables_after_from(children:list) -> list:
+    """Returns the identifiers of the tables after ``FROM`` and ``JOIN`` of a query"""
+    tables = []
+    expect_table = False
+    for token, _offset in children:
+        keyword = _keyword(token)
+        if keyword:
+            expect_table = keyword == 'FROM' or keyword.endswith('JOIN')
+            continue
+        if expect_table:
+            identifiers = token.get_identifiers() if isinstance(token, IdentifierList) else [token]
+            tables.extend(
+                identifier for identifier in identifiers if isinstance(identifier, Identifier)
+            )
+            expect_table = False
+    return tables
+
+def _select_list(children:list) -> list:
+    """Returns the children between ``SELECT`` and ``FROM``"""
+    selected = []
+    in_select = False
+    for token, offset in children:
+        keyword = _keyword(token)
+        if keyword == 'SELECT':
+            in_select = True
+        elif keyword == 'FROM':
+            break
+        elif in_select and keyword not in ('DISTINCT', 'ALL'):
+            selected.append((token, offset))
+    return selected
+
+def rule_joins(group, children:list, context:dict):
+    """Flags the cross joins and the joins without a join predicate"""
+    significant = context['significant']
+    for index, (token, offset) in enumerate(significant):
+        keyword = _keyword(token)
+        if keyword == 'CROSS JOIN':
+            yield 'cross_join', 'CROSS JOIN multiplies the rows of both tables', offset
+        elif keyword.endswith('JOIN') and not keyword.startswith('NATURAL'):
+            following = [_keyword(item) for item, _ in significant[index + 2:index + 3]]
+            if following not in (['ON'], ['USING']):
+                yield 'missing_join_predicate', f'{keyword} without ON or USING', offset
+        elif keyword == 'FROM' and index + 1 < len(significant):
+            listed = significant[index + 1][0]
+            if isinstance(listed, IdentifierList) \
+            and len([_ for _ in listed.get_identifiers() if isinstance(_, Identifier)]) > 1 \
+            and not any(isinstance(item, Where) for item, _ in significant):
+                yield 'cross_join', 'tables listed after FROM without a WHERE clause', offset
+
+def rule_non_sargable(group, children:list, context:dict):
+    """Flags the filters applying a function or a cast to a column"""
+    if not context['in_where'] and not isinstance(group, Where):
+        return
+    # ``sqlparse`` splits ``date(column) >= ...`` into the name of the function and a comparison
+    # starting with its arguments.
+    for (name, offset), (comparison, start) in zip(children, children[1:]):
+        if isinstance(name, Identifier) and start == offset + len(name.value) \
+        and isinstance(comparison, Comparison) and isinstance(comparison.left, Parenthesis) \
+        and _has_column(comparison.left) and not _has_column(comparison.right):
+            yield 'non_sargable', \
+                f'`{name.value}{comparison.left.value}` applies a function to a filtered column', \
+                offset
+    if not isinstance(group, Comparison):
+        return
+    sides = [group.left, group.right]
+    for side, other in (sides, sides[::-1]):
+        wrapped = isinstance(side, Function) or (
+            isinstance(side, Identifier) and '::' in side.value
+        )
+        if wrapped and _has_column(side) and not _has_column(other):
+            yield 'non_sargable', \
+                f'`{side.value}` applies a function or cast to a filtered column', children[0][1]
+            return
+
+def rule_distinct(group, children:list, context:dict):
+    """Flags ``SELECT DISTINCT`` over joins"""
+    keywords = [_keyword(token) for token, _ in context['significant']]
+    if 'SELECT' in keywords and 'DISTINCT' in keywords \
+    and any(keyword.endswith('JOIN') for keyword in keywords):
+        offset = next(offset for token, offset in children if _keyword(token) == 'DISTINCT')
+        yield 'distinct_over_join', 'SELECT DISTINCT over joins can hide a fan-out of rows', offset
+
+def rule_order_by(group, children:list, context:dict):
+    """Flags the ``ORDER BY`` of the queries loading a table"""
+    if not isinstance(group, Statement) or group.get_type() not in ('CREATE', 'INSERT'):
+        return
+    for token, offset in children:
+        if _keyword(token) == 'ORDER BY':
+            yield 'order_by_in_load', \
+                f'ORDER BY in {group.get_type()} sorts rows the table does not keep', offset
+
+def rule_not_in(group, children:list, context:dict):
+    """Flags ``NOT IN (SELECT ...)``"""
+    significant = context['significant']
+    message = 'NOT IN (SELECT ...) cannot run as an anti-join, use NOT EXISTS'
+    for index, (token, offset) in enumerate(significant):
+        following = [item for item, _ in significant[index + 1:index + 3]]
+        # ``sqlparse`` reads ``NOT IN`` as one comparison operator or as two keywords.
+        if token.ttype is Operator.Comparison and ' '.join(token.value.upper().split()) == 'NOT IN':
+            subquery = following[:1]
+        elif _keyword(token) == 'NOT' and following and _keyword(following[0]) == 'IN':
+            subquery = following[1:]
+        else:
+            continue
+        if subquery and isinstance(subquery[0], Parenthesis) and _has_select(subquery[0]):
+            yield 'not_in_subquery', message, offset
+
+def rule_correlated(group, children:list, context:dict):
+    """Flags the subqueries of the select list referencing the tables of the outer query"""
+    if not _has_select(group):
+        return
+    outer = {
+        (identifier.get_alias() or identifier.get_real_name() or '').lower()
+        for identifier in _tables_after_from(context['significant'])
+    } - {''}
+    if not outer:
+        return
+    stack = [(token, offset) for token, offset in _select_list(children)]
+    while stack:
+        token, offset = stack.pop()
+        if isinstance(token, Parenthesis) and _has_select(token):
+            inner = {
+                (identifier.get_alias() or identifier.get_real_name() or '').lower()
+                for identifier in _tables_after_from([(item, 0) for item in token.tokens])
+            }
+            referenced = {alias.lower() for alias in _QUALIFIER.findall(token.value)}
+            if (referenced & outer) - inner:
+                yield 'correlated_subquery', \
+                    'subquery in the select list references the outer query, run once per row', \
+                    offset
+        elif token.is_group:
+            position = offset
+            for item in token.tokens:
+                stack.append((item, position))
+                position += len(item.value)
+
+def rule_select_star(group, children:list, context:dict):
+    """Flags ``SELECT *`` from the tables of the catalog, or from the wide ones when the column
+    counts are known"""
+    if not _has_select(group):
+        return
+    stars = []
+    for token, offset in _select_list(children):
+        items = token.get_identifiers() if isinstance(token, IdentifierList) else [token]
+        if any(
+            item.ttype is Wildcard
+            or (isinstance(item, Identifier) and item.tokens[-1].ttype is Wildcard)
+            for item in items
+        ):
+            stars.append(offset)
+    if not stars:
+        return
+    counts = context['column_counts']
+    for identifier in _tables_after_from(context['significant']):
+        if identifier.get_real_name() is None or _has_select(identifier):
+            continue
+        name = identifier.value.split()[0]
+        # The temp tables are created by the script and their width is not known.
+        if parse_table_name(name).schema is None:
+            continue
+        columns = counts.get(table_key(name)) if counts else None
+        if counts and (columns is None or columns < WIDE_COLUMNS):
+            continue
+        width = f' with {columns} columns' if columns is not None else ''
+        yield 'select_star', f'SELECT * from {table_key(name)}{width}', stars[0]
+
+RULES = (
+    rule_joins, rule_non_sargable, rule_distinct, rule_order_by, rule_not_in, rule_correlated,
+    rule_select_star
+)
+
+def lint_statement(statement:Statement, offset:int=0, column_counts:dict=None):
+    """Yields the ``(rule, message, offset)`` findings of a statement in one walk of its tokens
+
+    Parameters
+    ----------
+    statement : sqlparse.sql.Statement
+        The parsed statement
+    offset : int, default to 0
+        The offset of the statement in its file
+    column_counts : dict of str to int, default to None
+        The number of columns of the tables, to only flag ``SELECT *`` from wide tables
+    """
+    stack = [(statement, offset, False)]
+    while stack:
+        group, start, in_where = stack.pop()
+        children = []
+        position = start
+        for token in group.tokens:
+            children.append((token, position))
+            position += len(token.value)
+        context = {
+            'in_where': in_where,
+            'column_counts': column_counts,
+            'significant': _significant(children)
+        }
+        for rule in RULES:
+            yield from rule(group, children, context)
+        in_where = in_where or isinstance(group, Where)
+        stack.extend(
+            (token, position, in_where) for token, position in reversed(children) if token.is_group
+        )
+
+def lint_file(file_name:str, column_counts:dict=None) -> list:
+    """Returns the findings of every statement of a '.sql' file, in the order they are found"""
+    with open(file_name, encoding='utf-8') as _f:
+        sql_contents = _f.read()
+    newlines = [index for index, character in enumerate(sql_contents) if character == '\n']
+    findings = []
+    offset = 0
+    # The statements parsed together cover the whole file, so their offsets add up.
+    for index, statement in enumerate(sqlparse.parse(sql_contents)):
+        for rule, message, position in lint_statement(statement, offset, column_counts):
+            line = bisect.bisect_left(newlines, position)
+            findings.append({
+                'file': file_name,
+                'line': line + 1,
+                'column': position - (newlines[line - 1] + 1 if line > 0 else 0) + 1,
+                'statement': index,
+                'rule': rule,
+                'message': message
+            })
+        offset += len(statement.value)
+    return sorted(findings, key=lambda finding: (finding['line'], finding['column']))
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    arguments.add_argument('files', nargs='+', help='The .sql files to lint')
+    arguments.add_argument('--json', action='store_true', help='Print the findings as JSON')
+    arguments.add_argument(
+        '--columns', help='A JSON file of the number of columns of every table'
+    )
+    options = arguments.parse_args()
+    _counts = None
+    if options.columns is not None:
+        with open(options.columns, encoding='utf-8') as json_file:
+            _counts = {table_key(table): count for table, count in json.load(json_file).items()}
+    _findings = []
+    for sql_file in options.files:
+        if os.path.isfile(sql_file):
+            _findings.extend(lint_file(sql_file, _counts))
+    if options.json:
+        json.dump(_findings, sys.stdout, indent=4)
+    else:
+        for _finding in _findings:
+            print(
+                f'{_finding["file"]}:{_finding["line"]}:{_finding["column"]}:'
+                + f' {_finding["rule"]} {_finding["message"]}'
+            )
+    sys.exit(1 if _findings else 0)
@@ -0,0 +1,261 @@
+"""Classifies how the statements of every app load their target tables.
+
+Each table written by a '.sql' script is loaded with one of three strategies:
+
+- ``full_refresh``: the table is rebuilt every run, with ``TRUNCATE``, ``DELETE`` without a
+  ``WHERE`` clause or ``DROP``/``CREATE`` before it is filled again
+- ``windowed_delta``: only a window of rows is loaded, like the ``dm_delta`` of ``f_invoice`` built
+  from ``dsc_processed_at >= '<start_date>'::timestamp - interval '1 day'``, or the rows deleted by a
+  ``DELETE ... WHERE`` are replaced
+- ``append``: rows are inserted without removing any
+
+A temp table built from a time window passes its window to the statements reading it. For the full
+refreshes, the date and timestamp columns of their sources are listed from the Redshift catalog,
+as the columns that could drive an incremental load instead.
+"""
+import os
+import re
+import json
+import argparse
+import sqlparse
+from corpus import write_target
+from concurrency import referenced_tables
+from results_store import open_results
+from type_inference import DATE_TYPES
+from Table import Table
+from utils import parse_table_name
+
+FULL_REFRESH = 'full_refresh'
+WINDOWED_DELTA = 'windowed_delta'
+APPEND = 'append'
+# The strategies, from the one loading the most rows
+STRATEGIES = (FULL_REFRESH, WINDOWED_DELTA, APPEND)
+
+# A column compared with the start of a window: ``column >= <value>`` or ``column BETWEEN <value>``
+_LOWER_BOUND = re.compile(
+    r'([a-z_][a-z0-9_$]*(?:\.[a-z_][a-z0-9_$]*)?)\s*(?:>=|>|\bbetween\b)\s*'
+    + r'(.*?)(?=\band\b|\bor\b|\bgroup\b|\border\b|\blimit\b|\)|;|$)',
+    re.IGNORECASE | re.DOTALL
+)
+# The values a window starts from: a run placeholder, the current time or the loaded maximum
+_WINDOW_START = re.compile(
+    r"<[a-z_][a-z0-9_]*>|\b(?:getdate|sysdate|current_date|current_timestamp|dateadd|interval)\b"
+    + r"|\(\s*select\s+max\s*\(",
+    re.IGNORECASE
+)
+# The names of the columns that usually record when a row changed
+_CHANGE_COLUMN = re.compile(r'(?:updated|modified|processed|loaded|changed|created)', re.IGNORECASE)
+
+def window_columns(sql:str) -> list:
+    """Returns the columns a statement filters on the start of a time window"""
+    _where = re.split(r'\bwhere\b', sql, maxsplit=1, flags=re.IGNORECASE)
+    if len(_where) < 2:
+        return []
+    return sorted({
+        column.lower() for column, value in _LOWER_BOUND.findall(_where[1])
+        if _WINDOW_START.search(value)
+    })
+
+def _is_temp(sql:str, target:str) -> bool:
+    """Returns whether a ``CREATE`` statement creates a temp table"""
+    return re.match(r'\s*create\s+(?:local\s+)?temp(?:orary)?\b', sql, re.IGNORECASE) is not None \
+        or parse_table_name(target).schema is None
+
+class Load():
+    """A statement filling a target table
+
+    Attributes
+    ----------
+    target : str
+        The key of the loaded table
+    strategy : str
+        One of ``STRATEGIES``
+    file_name : str
+        The '.sql' file of the statement
+    position : int
+        The position of the statement in the file
+    window_columns : list of str
+        The columns the loaded rows are filtered on, including the ones of the temp tables read
+    sources : list of str
+        The tables the rows are read from, with the temp tables replaced by their own sources
+    """
+    def __init__( #pylint: disable=R0913
+        self, target:str, strategy:str, file_name:str, position:int, window:list, sources:list
+    ) -> None:
+        self.target = target
+        self.strategy = strategy
+        self.file_name = file_name
+        self.position = position
+        self.window_columns = window
+        self.sources = sources
+
+    def __iter__(self):
+        yield 'target', self.target
+        yield 'strategy', self.strategy
+        yield 'file_name', self.file_name
+        yield 'position', self.position
+        yield 'window_columns', self.window_columns
+        yield 'sources', self.sources
+
+    def __repr__(self) -> str:
+        return f'{self.strategy} load of {self.target}'
+
+def file_loads(file_name:str, sql_statements:list) -> list:
+    """Returns the loads of the statements of a single '.sql' script
+
+    Parameters
+    ----------
+    file_name : str
+        The name of the '.sql' script
+    sql_statements : list of str
+        The statements of the script, in order
+
+    Returns
+    -------
+    list of Load()
+        A load for every ``CREATE ... AS`` and ``INSERT`` writing a table that is not a temp table
+    """
+    loads = []
+    # Whether each target was emptied, ``all`` of it or a ``window`` of it, before it is loaded
+    cleared = {}
+    # The windows and sources of the temp tables created by the script
+    temp_windows, temp_sources = {}, {}
+    for position, sql in enumerate(sql_statements):
+        parsed = sqlparse.parse(sql)[0]
+        first = parsed.token_first(skip_cm=True)
+        target = write_target(parsed)
+        if first is None or target is None:
+            continue
+        keyword = first.value.upper()
+        reads = referenced_tables(parsed) - {target}
+        window = set(window_columns(sql))
+        sources = set()
+        for table in reads:
+            window.update(temp_windows.get(table, ()))
+            sources.update(temp_sources.get(table, {table}))
+        if keyword in ('DROP', 'TRUNCATE'):
+            cleared[target] = 'all'
+        elif keyword == 'DELETE':
+            cleared[target] = 'window' \
+                if re.search(r'\b(?:where|using)\b', sql, re.IGNORECASE) else 'all'
+        elif keyword == 'CREATE' and _is_temp(sql, target):
+            temp_windows[target], temp_sources[target] = window, sources
+        # The rows inserted into a temp table add to the window and sources it passes on.
+        elif keyword == 'INSERT' \
+        and (target in temp_windows or parse_table_name(target).schema is None):
+            temp_windows.setdefault(target, set()).update(window)
+            temp_sources.setdefault(target, set()).update(sources)
+        elif keyword in ('CREATE', 'INSERT'):
+            # ``CREATE TABLE`` without ``AS`` only defines the table filled by the next statements.
+            if keyword == 'CREATE' and not reads:
+                continue
+            # ``CREATE TABLE ... AS`` rebuilds the table, unless it only runs when it is missing.
+            if keyword == 'CREATE' and not re.search(r'\bif\s+not\s+exists\b', sql, re.IGNORECASE):
+                cleared[target] = 'all'
+            if cleared.get(target) == 'all':
+                strategy = FULL_REFRESH
+            elif window or cleared.get(target) == 'window':
+                strategy = WINDOWED_DELTA
+            else:
+                strategy = APPEND
+            loads.append(
+                Load(target, strategy, file_name, position, sorted(window), sorted(sources))
+            )
+    return loads
+
+def source_timestamp_columns(table:str, redshift_cursor, catalog:dict) -> list:
+    """Returns the date and timestamp columns of a source table, the columns named like they
+    record changes first
+
+    Parameters
+    ----------
+    table : str
+        The key of the table
+    redshift_cursor : sqlparse.connection()
+        The ``sqlparse`` database session
+    catalog : dict of str to Table()
+        The tables already queried from Redshift
+    """
+    _name = parse_table_name(table)
+    if _name.schema is None:
+        return []
+    if table not in catalog:
+        catalog[table] = Table(_name.schema, _name.table, redshift_cursor).query_data()
+    columns = [
+        column.column_name for column in catalog[table].columns if column.data_type in DATE_TYPES
+    ]
+    return sorted(columns, key=lambda column: _CHANGE_COLUMN.search(column) is None)
+
+def classify(loads:list, redshift_cursor=None) -> dict:
+    """Returns the load strategy of every target table
+
+    A table loaded in several ways is classified by the load that loads the most rows.
+
+    Parameters
+    ----------
+    loads : list of Load()
+        The loads of every script
+    redshift_cursor : sqlparse.connection(), default to None
+        The ``sqlparse`` database session used to find the timestamp columns of the sources of
+        the full refreshes, which are not listed without it
+
+    Returns
+    -------
+    dict of str to dict
+        The strategy, loads and, for the full refreshes, the timestamp columns of every source
+    """
+    out = {}
+    for load in loads:
+        entry = out.setdefault(load.target, {'strategy': APPEND, 'loads': []})
+        entry['loads'].append(dict(load))
+        if STRATEGIES.index(load.strategy) < STRATEGIES.index(entry['strategy']):
+            entry['strategy'] = load.strategy
+    if redshift_cursor is not None:
+        catalog = {}
+        for entry in out.values():
+            if entry['strategy'] != FULL_REFRESH:
+                continue
+            sources = sorted({source for load in entry['loads'] for source in load['sources']})
+            entry['timestamp_columns'] = {
+                source: source_timestamp_columns(source, redshift_cursor, catalog)
+                for source in sources
+            }
+    return dict(sorted(out.items(), key=lambda item: STRATEGIES.index(item[1]['strategy'])))
+
+def store_loads(app:str=None) -> list:
+    """Returns the loads of the scripts stored in the results database
+
+    The scripts found on disk are read again, because the stored statements do not include
+    ``DROP`` and ``TRUNCATE``.
+    """
+    results = open_results()
+    statements = {}
+    # The scripts imported from ``sql.json`` are stored by name, shared by the scripts of apps.
+    for _app, file_name, _position, record in results.statements(app):
+        statements.setdefault((_app, file_name), []).append(record['value'])
+    results.close()
+    loads = []
+    for (_app, file_name), sql_statements in statements.items():
+        if os.path.isfile(file_name):
+            with open(file_name, encoding='utf-8') as _f:
+                sql_statements = sqlparse.split(_f.read())
+        loads.extend(file_loads(file_name, sql_statements))
+    return loads
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    arguments.add_argument('--app', help='Only classify the tables of this app')
+    arguments.add_argument(
+        '--catalog', action='store_true',
+        help='List the timestamp columns of the sources of the full refreshes from Redshift'
+    )
+    options = arguments.parse_args()
+    cursor = None
+    if options.catalog:
+        from new_join_parser import connect_to_redshift #pylint: disable=C0415
+        cursor = connect_to_redshift().cursor()
+    strategies = classify(store_loads(options.app), cursor)
+    with open('load_strategies.json', 'w', encoding='utf-8') as json_file:
+        json.dump(strategies, json_file, indent=4)
+    for strategy in STRATEGIES:
+        print(f'{strategy}: {sum(entry["strategy"] == strategy for entry in strategies.values())}')
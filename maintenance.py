@@ -0,0 +1,296 @@
+"""Recommends where ``VACUUM`` and ``ANALYZE`` should run from how often every table is written.
+
+Every ETL run, each app runs its '.sql' scripts once, so the statements writing a table across
+the corpus are the writes of a run. A ``DELETE`` or ``UPDATE`` leaves deleted rows behind until
+the table is vacuumed, while ``TRUNCATE`` and ``DROP``/``CREATE`` rewrite the table without any.
+Every write leaves the statistics of the planner stale until the table is analyzed, except
+``CREATE TABLE ... AS``, which Redshift analyzes itself, along with the writes before it in its
+script, like the ``DROP`` of a rebuilt table.
+
+For every table written by the ETL, the deletes, inserts, updates and rewrites of a run are
+counted and compared with the ``VACUUM`` and ``ANALYZE`` statements of the scripts:
+
+- ``add``: the table is left with deleted rows or stale statistics and nothing vacuums or
+  analyzes it
+- ``keep``: a single statement vacuums or analyzes the table after its last write in its script
+- ``move``: the table is vacuumed or analyzed, but before its last write in the same script
+- ``drop_redundant``: several statements vacuum or analyze the table in a run, only the one after
+  its last write is needed
+- ``sort_only``: the table is vacuumed but only ever inserted into, so ``VACUUM SORT ONLY`` is
+  enough
+- ``drop``: the table is vacuumed but rewritten without any deleted rows, or analyzed but only
+  rebuilt with ``CREATE TABLE ... AS``
+
+The ``VACUUM`` and ``ANALYZE`` statements of tables that no statement modifies are listed as well.
+"""
+import os
+import re
+import json
+import argparse
+import sqlparse
+from corpus import write_target
+from results_store import open_results
+from utils import parse_table_name, table_key
+
+# ``VACUUM [FULL | SORT ONLY | DELETE ONLY | REINDEX | RECLUSTER] [table]``
+_VACUUM = re.compile(
+    r'vacuum\b(?:\s+(full|sort\s+only|delete\s+only|reindex|recluster)\b)?\s*([a-z_"][\w."$]*)?',
+    re.IGNORECASE
+)
+# ``ANALYZE [VERBOSE] [table]``, but not ``ANALYZE COMPRESSION``, which changes nothing
+_ANALYZE = re.compile(
+    r'analyze\b(?!\s+compression\b)(?:\s+verbose\b)?\s*([a-z_"][\w."$]*)?', re.IGNORECASE
+)
+# The keywords of the statements writing a table, by the operation counted for it
+OPERATIONS = {
+    'DELETE': 'deletes',
+    'INSERT': 'inserts',
+    'UPDATE': 'updates',
+    'TRUNCATE': 'rewrites',
+    'DROP': 'rewrites',
+    'CREATE': 'creates'
+}
+# The ``AS`` of a ``CREATE TABLE ... AS`` before its query
+_CTAS = re.compile(r'\bas\s*\(?\s*(?:select|with)\b', re.IGNORECASE)
+# The placeholder of a ``VACUUM`` or ``ANALYZE`` of every table of the database
+ALL_TABLES = '*'
+
+def maintenance_target(sql:str):
+    """Returns the operation and table of a ``VACUUM`` or ``ANALYZE`` statement, or ``None``
+
+    ``ALL_TABLES`` is returned when the statement runs on the whole database.
+    """
+    sql = sqlparse.format(sql, strip_comments=True).strip()
+    for operation, pattern in (('vacuum', _VACUUM), ('analyze', _ANALYZE)):
+        match = pattern.match(sql)
+        if match is None:
+            continue
+        name = match.groups()[-1]
+        # The table is named before ``TO 100 PERCENT`` and ``PREDICATE COLUMNS``.
+        if name is None or name.upper() in ('TO', 'PREDICATE', 'ALL'):
+            return operation, ALL_TABLES
+        return operation, table_key(name.replace('"', ''))
+    return None
+
+class TableMaintenance():
+    """The writes, ``VACUUM`` and ``ANALYZE`` of a table in a run
+
+    Attributes
+    ----------
+    table : str
+        The key of the table
+    counts : dict of str to int
+        The number of statements of every operation of ``OPERATIONS``, with the ``DELETE``
+        statements without a ``WHERE`` or ``USING`` also counted as ``deletes_all``
+    apps : set of str
+        The apps writing the table
+    writes : list of dict
+        The app, file, position and operation of every statement writing the table, with whether
+        it is a ``CREATE TABLE ... AS``
+    vacuums : list of dict
+        The ``VACUUM`` statements of the table
+    analyzes : list of dict
+        The ``ANALYZE`` statements of the table
+    """
+    def __init__(self, table:str) -> None:
+        self.table = table
+        self.counts = dict.fromkeys(sorted(set(OPERATIONS.values())) + ['deletes_all'], 0)
+        self.apps = set()
+        self.writes = []
+        self.vacuums = []
+        self.analyzes = []
+
+    @property
+    def leaves_deleted_rows(self) -> bool:
+        """Whether the writes of the table leave deleted rows behind"""
+        return self.counts['deletes'] + self.counts['updates'] > 0
+
+    @property
+    def is_modified(self) -> bool:
+        """Whether any statement writes the table"""
+        return any(self.counts.values())
+
+    @staticmethod
+    def _same_file(found:dict, other:dict) -> bool:
+        """Returns whether two statements are in the same script"""
+        return (found['app'], found['file_name']) == (other['app'], other['file_name'])
+
+    def has_stale_statistics(self) -> bool:
+        """Whether a write leaves the statistics stale, as it is not followed by a
+        ``CREATE TABLE ... AS`` of its script, which Redshift analyzes itself"""
+        ctas = [write for write in self.writes if write['ctas']]
+        return any(
+            not write['ctas'] and not any(
+                self._same_file(write, _ctas) and _ctas['position'] > write['position']
+                for _ctas in ctas
+            )
+            for write in self.writes
+        )
+
+    def after_last_write(self, found:dict) -> bool:
+        """Whether a ``VACUUM`` or ``ANALYZE`` runs after the last write of the table in its
+        script"""
+        return not any(
+            self._same_file(found, write) and write['position'] > found['position']
+            for write in self.writes
+        )
+
+    def _action(self, statements:list, needed:bool) -> str:
+        """Returns what to do with the ``VACUUM`` or ``ANALYZE`` statements of the table"""
+        if not needed:
+            return 'drop' if statements else 'none'
+        if not statements:
+            return 'add'
+        if not any(self.after_last_write(found) for found in statements):
+            return 'move'
+        return 'drop_redundant' if len(statements) > 1 else 'keep'
+
+    def vacuum_action(self) -> str:
+        """Returns what to do with the ``VACUUM`` of the table"""
+        action = self._action(self.vacuums, self.leaves_deleted_rows)
+        # The inserted rows are appended to the unsorted region of the table.
+        if action == 'drop' and self.counts['inserts']:
+            return 'sort_only'
+        return action
+
+    def analyze_action(self) -> str:
+        """Returns what to do with the ``ANALYZE`` of the table"""
+        return self._action(self.analyzes, self.has_stale_statistics())
+
+    def recommendation(self) -> dict:
+        """Returns the writes of the table and the actions on its ``VACUUM`` and ``ANALYZE``"""
+        out = {
+            'table': self.table,
+            'apps': sorted(self.apps),
+            **self.counts,
+            'vacuum': self.vacuum_action(),
+            'analyze': self.analyze_action(),
+            'vacuums': [
+                {**found, 'after_last_write': self.after_last_write(found)}
+                for found in self.vacuums
+            ],
+            'analyzes': [
+                {**found, 'after_last_write': self.after_last_write(found)}
+                for found in self.analyzes
+            ]
+        }
+        if self.counts['deletes_all']:
+            out['note'] = '``DELETE`` without ``WHERE`` leaves every row deleted,' \
+                + ' ``TRUNCATE`` would not need a ``VACUUM``'
+        return out
+
+class MaintenanceReport():
+    """Counts the writes, ``VACUUM`` and ``ANALYZE`` of every table across the scripts
+
+    Attributes
+    ----------
+    tables : dict of str to TableMaintenance()
+        The tables written, vacuumed or analyzed, keyed by their key
+    database : list of dict
+        The ``VACUUM`` and ``ANALYZE`` statements running on the whole database
+    """
+    def __init__(self) -> None:
+        self.tables = {}
+        self.database = []
+
+    def _table(self, table:str) -> TableMaintenance:
+        """Returns the maintenance of a table, added the first time it is found"""
+        if table not in self.tables:
+            self.tables[table] = TableMaintenance(table)
+        return self.tables[table]
+
+    def add_file(self, app:str, file_name:str, sql_statements:list) -> None:
+        """Counts the statements of a '.sql' script run by an app"""
+        for position, sql in enumerate(sql_statements):
+            maintenance = maintenance_target(sql)
+            if maintenance is not None:
+                operation, table = maintenance
+                found = {'app': app, 'file_name': file_name, 'position': position}
+                if table == ALL_TABLES:
+                    self.database.append({**found, 'operation': operation})
+                elif parse_table_name(table).schema is not None:
+                    getattr(self._table(table), f'{operation}s').append(found)
+                continue
+            parsed = sqlparse.parse(sql)[0]
+            target = write_target(parsed)
+            # The temp tables only live as long as the session of the script.
+            if target is None or parse_table_name(target).schema is None:
+                continue
+            keyword = parsed.token_first(skip_cm=True).value.upper()
+            _table = self._table(target)
+            _table.counts[OPERATIONS[keyword]] += 1
+            _table.writes.append({
+                'app': app,
+                'file_name': file_name,
+                'position': position,
+                'operation': OPERATIONS[keyword],
+                'ctas': keyword == 'CREATE' and _CTAS.search(sql) is not None
+            })
+            if keyword == 'DELETE' and not re.search(r'\b(?:where|using)\b', sql, re.IGNORECASE):
+                _table.counts['deletes_all'] += 1
+            _table.apps.add(app)
+
+    def recommendations(self) -> list:
+        """Returns the tables written by the ETL, the tables to change first and the most
+        written first"""
+        return sorted(
+            (
+                _table.recommendation()
+                for _table in self.tables.values() if _table.is_modified
+            ),
+            key=lambda entry: (
+                {entry['vacuum'], entry['analyze']} <= {'keep', 'none'},
+                -sum(entry[operation] for operation in set(OPERATIONS.values()))
+            )
+        )
+
+    def unmodified(self) -> list:
+        """Returns the ``VACUUM`` and ``ANALYZE`` statements of the tables no statement writes"""
+        return [
+            {'table': _table.table, 'operation': operation, **found}
+            for _table in self.tables.values() if not _table.is_modified
+            for operation, statements in (('vacuum', _table.vacuums), ('analyze', _table.analyzes))
+            for found in statements
+        ]
+
+    def report(self) -> dict:
+        """Returns the recommendations, the maintenance of unmodified tables and of the database"""
+        return {
+            'recommendations': self.recommendations(),
+            'unmodified_tables': self.unmodified(),
+            'database': self.database
+        }
+
+def store_maintenance(app:str=None) -> MaintenanceReport:
+    """Returns the maintenance report of the scripts stored in the results database
+
+    The scripts found on disk are read again, because the stored statements do not include
+    ``TRUNCATE``, ``VACUUM`` and ``ANALYZE``.
+    """
+    results = open_results()
+    statements = {}
+    for _app, file_name, _position, record in results.statements(app):
+        statements.setdefault((_app, file_name), []).append(record['value'])
+    results.close()
+    report = MaintenanceReport()
+    for (_app, file_name), sql_statements in statements.items():
+        if os.path.isfile(file_name):
+            with open(file_name, encoding='utf-8') as _f:
+                sql_statements = sqlparse.split(_f.read())
+        report.add_file(_app, file_name, sql_statements)
+    return report
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    arguments.add_argument('--app', help='Only count the scripts of this app')
+    options = arguments.parse_args()
+    _report = store_maintenance(options.app).report()
+    with open('maintenance.json', 'w', encoding='utf-8') as json_file:
+        json.dump(_report, json_file, indent=4)
+    for action in ('add', 'move', 'drop_redundant', 'sort_only', 'drop'):
+        print(
+            f'{action}: {sum(entry["vacuum"] == action for entry in _report["recommendations"])}'
+            + f' VACUUM, {sum(entry["analyze"] == action for entry in _report["recommendations"])}'
+            + ' ANALYZE'
+        )
+    print(f'{len(_report["unmodified_tables"])} statements on unmodified tables')
@@ -4,17 +4,23 @@ import re
 import json
 import os
 import sys
-from time import gmtime, strftime
 from typing import Union, Tuple
 from collections import namedtuple
 from dotenv import load_dotenv
 import sqlparse
-from sqlparse.sql import IdentifierList, Identifier, Comparison, Token
-from sqlparse.tokens import Keyword, DML, Punctuation
+from sqlparse.sql import (
+    IdentifierList, Identifier, Comparison, Token, Parenthesis, Statement, Function
+)
+from sqlparse.tokens import Keyword, DML, Punctuation, CTE
 import psycopg2
 from pprint import pprint
 from parse_types import Table, JoinComparison, Join
 from Column import Column
+from Session import Session
+from utils import canonical_table_name, parse_table_name
+import dump_format
+from concurrency import UnparsedStatement
+import type_inference
 
 # TODO Use SELECT object to represent selects and subqueries requested in the query
 
@@ -28,29 +34,153 @@ DATABASE = os.getenv("DATABASE")
 USER = os.getenv("REDSHIFT_USER")
 PASSWORD = os.getenv("PASSWORD")
 
-try:
-    connection = psycopg2.connect(
-        user=USER,
-        password=PASSWORD,
-        host=HOST,
-        port=PORT,
-        database=DATABASE,
-        connect_timeout=1
-    )
-except psycopg2.OperationalError:
-    print('Could not connect to Redshift. Bad credentials or not on VPN?')
-    sys.exit(1)
-cursor = connection.cursor()
 tables = []
 
+def connect_to_redshift():
+    """Returns a connection to the Redshift cluster configured in the ``.env`` file"""
+    try:
+        return psycopg2.connect(
+            user=USER,
+            password=PASSWORD,
+            host=HOST,
+            port=PORT,
+            database=DATABASE,
+            connect_timeout=1
+        )
+    except psycopg2.OperationalError:
+        print('Could not connect to Redshift. Bad credentials or not on VPN?')
+        sys.exit(1)
+
 def found_table(schema:str, table_name:str) -> bool:
     """Returns whether the given table is found in the list of cached tables"""
-    return len(
-        [
-            table for table in tables
-            if table.table_name == table_name and table.schema == schema
-        ]
-    ) == 1
+    key = canonical_table_name(f'{schema}.{table_name}')
+    return len([table for table in tables if table.key == key]) == 1
+
+def table_from_identifier(identifier:Identifier, session:Session) -> Table:
+    """Returns the table referenced by an identifier with the columns known to the session"""
+    return session.get_table(identifier.value, identifier.get_name())
+
+def subquery_statement(identifier:Identifier) -> Union[Statement, None]:
+    """Returns the statement inside the parenthesis of a derived table, like ``(SELECT ...) sub``
+
+    The statement reuses the tokens of the ``Parenthesis`` subtree instead of parsing its text
+    again. ``None`` is returned when the identifier is not a derived table.
+    """
+    parenthesis = identifier.token_first(skip_ws=True, skip_cm=True)
+    if not isinstance(parenthesis, Parenthesis):
+        return None
+    # Leave out the opening and closing paranthesis.
+    return Statement(parenthesis.tokens[1:-1])
+
+def cte_definitions(tokens) -> list:
+    """Returns the name and body of every CTE defined in the ``WITH`` clause of a statement
+
+    The bodies reuse the tokens of their ``Parenthesis`` subtrees, like ``subquery_statement()``.
+    """
+    definitions = []
+    with_seen = False
+    for _token in tokens.tokens:
+        if _token.ttype is CTE:
+            with_seen = True
+            continue
+        if not with_seen or _token.is_whitespace:
+            continue
+        identifiers = list(_token.get_identifiers()) if isinstance(_token, IdentifierList) \
+            else [_token]
+        for identifier in identifiers:
+            if not isinstance(identifier, Identifier):
+                continue
+            # The body is the last parenthesis, after the optional column list.
+            bodies = [__token for __token in identifier.tokens if isinstance(__token, Parenthesis)]
+            if bodies:
+                definitions.append((
+                    canonical_table_name(identifier.get_real_name()),
+                    Statement(bodies[-1].tokens[1:-1])
+                ))
+        with_seen = False
+    return definitions
+
+# The keywords that start a table constraint or end the data type of a column definition
+_COLUMN_TYPE_END = re.compile(
+    r'\s+(?:not|null|default|encode|distkey|sortkey|primary|unique|references|identity|'
+    + r'generated|collate)\b.*$',
+    re.IGNORECASE|re.DOTALL
+)
+# A column referenced as ``alias.column``, without a cast or function around it
+_COLUMN_REFERENCE = re.compile(
+    r'^\s*[a-z_][a-z0-9_$]*\s*\.\s*"?[a-z_][a-z0-9_$]*"?\s*$', re.IGNORECASE
+)
+_CONSTRAINTS = ('PRIMARY', 'UNIQUE', 'FOREIGN', 'CONSTRAINT', 'DISTKEY', 'SORTKEY', 'LIKE')
+
+def column_definitions(tokens) -> Union[list, None]:
+    """Returns the name, data type and length of the columns defined by a ``CREATE TABLE name
+    (column type, ...)`` statement, or ``None`` when the statement does not define its columns."""
+    if tokens.get_type() != 'CREATE' \
+    or any(_token.ttype is DML or _token.ttype is CTE for _token in tokens.tokens):
+        return None
+    index = next(
+        (
+            index for index, _token in enumerate(tokens.tokens)
+            if isinstance(_token, (Identifier, Function))
+        ),
+        None
+    )
+    if index is None:
+        return None
+    # The definitions are the first parenthesis after the table's name. It is grouped with the
+    # name, like ``s.t (id int)``, or follows it, like after ``CREATE TABLE IF NOT EXISTS s.t``.
+    stack = list(reversed(tokens.tokens[index:]))
+    parenthesis = None
+    while stack:
+        _token = stack.pop()
+        if isinstance(_token, Parenthesis):
+            parenthesis = _token
+            break
+        if _token.is_group:
+            stack.extend(reversed(_token.tokens))
+    # ``CREATE TABLE name AS (SELECT ...)`` defines its columns with the query.
+    if parenthesis is None or any(
+        _token.ttype is DML or _token.ttype is CTE for _token in parenthesis.flatten()
+    ):
+        return None
+    # Split the definitions on the commas outside of a type's parenthesis, like ``numeric(10,2)``.
+    definitions = []
+    depth = 0
+    current = ''
+    for character in parenthesis.value[1:-1]:
+        depth += {'(': 1, ')': -1}.get(character, 0)
+        if character == ',' and depth == 0:
+            definitions.append(current)
+            current = ''
+        else:
+            current += character
+    definitions.append(current)
+    columns = []
+    for definition in definitions:
+        parts = definition.strip().split(None, 1)
+        if len(parts) != 2 or parts[0].upper() in _CONSTRAINTS:
+            continue
+        columns.append((
+            parts[0].strip('"').lower(),
+            *type_inference.normalize_type(_COLUMN_TYPE_END.sub('', parts[1]).strip())
+        ))
+    return columns
+
+# A ``CREATE TABLE name AS (query)`` with its query in parenthesis
+_CREATE_AS_PARENTHESIS = re.compile(
+    r'(.*?\bcreate\b[^(]*?\bas\s*)\((\s*(?:select|with)\b.*)\)(\s*;?\s*)$',
+    re.IGNORECASE|re.DOTALL
+)
+
+def unwrap_create_query(tokens):
+    """Returns a ``CREATE TABLE name AS (query)`` statement as ``CREATE TABLE name AS query``, the
+    way the created table's query is usually written, and any other statement unchanged"""
+    if tokens.get_type() != 'CREATE':
+        return tokens
+    match = _CREATE_AS_PARENTHESIS.match(tokens.value)
+    if match is None:
+        return tokens
+    return sqlparse.parse(''.join(match.groups()))[0]
 
 Subquery = namedtuple('Subquery', 'alias parsedStatement')
 
@@ -74,9 +204,17 @@ class ParsedStatement():
         The subqueries used in the ``JOIN`` statements
     joins: list of parse_types.JoinComparison()
         The table comparisons used the statement
+    ctes : dict of str to ParsedStatement()
+        The CTEs the statement can reference by name, including the ones of enclosing statements
+    has_parsed : bool
+        Whether the statement has been parsed
+    session : Session()
+        The tables created by the previous statements of the script and queried from Redshift
     """
-    def __init__(self, tokens, file_name:str, redshift_cursor) -> None:
-        self.tokens = tokens
+    def __init__( #pylint: disable=R0913
+        self, tokens, file_name:str, redshift_cursor, ctes:dict=None, session:Session=None
+    ) -> None:
+        self.tokens = unwrap_create_query(tokens)
         self.table = None
         self.file_name = file_name
         self.cursor = redshift_cursor
@@ -85,11 +223,14 @@ class ParsedStatement():
         self.subqueries = []
         self.joins = []
         self.destination_table = None
+        self.ctes = dict(ctes) if ctes is not None else {}
+        self.has_parsed = False
+        self.session = session if session is not None else Session(redshift_cursor)
 
     def __str__(self) -> str:
-        if self.table is None:
+        if not self.has_parsed:
             return 'Still need to parse'
-        return f'''{self.table.table_name} depends on {len([
+        return f'''{self.table.table_name if self.table is not None else 'SELECT'} depends on {len([
             _table.alias for _table in self.table_cache
         ] + [
             _subquery.alias for _subquery in self.subqueries
@@ -107,27 +248,18 @@ class ParsedStatement():
         # yield 'froms', [dict(_from) for _from in self.froms]
         yield 'joins', [dict(_join) for _join in self.joins]
 
-    def dump(self, directory:str):
-        """Dumps the parsed statement as a JSON file"""
-        print(dict(self))
-        print([dict(_select) for _select in self.selects])
-        if not os.path.exists(directory):
-            os.mkdir(directory)
-        time_fmt = "%Y-%m-%d %H:%M:%S"
-        if self.table is not None:
-            with open(
-                os.path.join(directory, f'{self.table.table_name}.json'),
-                'w',
-                encoding='utf-8'
-            ) as _f:
-                json.dump(dict(self), _f, ensure_ascii=False, indent=4)
-        else:
-            with open(
-                os.path.join(directory, f'TEMP_{strftime(time_fmt, gmtime())}.json'),
-                'w',
-                encoding='utf-8'
-            ) as _f:
-                json.dump(dict(self), _f, ensure_ascii=False, indent=4)
+    def dump(self, directory:str, binary:bool=False):
+        """Dumps the parsed statement and its subqueries as a normalized JSON file
+
+        Parameters
+        ----------
+        directory : str
+            The directory the file is written to
+        binary : bool, default to False
+            Whether to write the gzip-compressed '.json.gz' encoding
+        """
+        with dump_format.DumpSink(directory, binary, consolidate=False) as sink:
+            sink.add(self)
 
     def has_alias_in_cache(self, alias:str):
         """Returns whether the given table alias is found in the cached tables"""
@@ -145,8 +277,8 @@ class ParsedStatement():
             return [_subquery for _subquery in self.subqueries if _subquery.alias == alias][0]
 
     def _parse_selects(self):
-        # Remove the comments from the token.
-        sql_no_comments = remove_comments(self.tokens.value.strip())
+        # Remove the comments from the token. The CTEs select their own columns.
+        sql_no_comments = remove_comments(self._query_value().strip())
         # Search for all of the ``select`` and ``from`` in this token.
         select_matches = list(re.finditer(r'select\s', sql_no_comments, re.MULTILINE|re.IGNORECASE))
         from_matches = list(re.finditer(r'from\s', sql_no_comments, re.MULTILINE|re.IGNORECASE))
@@ -215,7 +347,8 @@ class ParsedStatement():
                 _table_or_subquery = self.get_alias_in_cache(table_alias)
                 # Save the table
                 if isinstance(_table_or_subquery, Table):
-                    if not _table_or_subquery.has_column(column_name):
+                    if not _table_or_subquery.has_column(column_name) \
+                    and not _table_or_subquery.is_temp:
                         raise Exception(
                             f'{_table_or_subquery.table_name} does not have {column_name} as a' \
                                 + ' column'
@@ -271,77 +404,33 @@ class ParsedStatement():
                     #     'table_alias': table_alias
                     # }
             elif rename_match_with_as or rename_match_without_as:
-                if rename_match_without_as:
-                    # rename_without_as
-                    table_alias = rename_match_without_as.groups()[0]
-                    column_from = rename_match_without_as.groups()[1]
-                    column_name = rename_match_without_as.groups()[2]
-                    _table_or_subquery = self.get_alias_in_cache(table_alias)
-                    # Set the
-                    # print(self.has_alias_in_cache(table_alias))
-                    # Yield the column name and the alias's name when referencing a subquery.
-                    # if aliases[table_alias]['schema'][0] == '(':
-                    #     yield {
-                    #         'column_name': column_name,
-                    #         'table_alias': table_alias
-                    #     }
-                    # else:
-                    #     self.selects.append({
-                    #         'schema': _table.schema,
-                    #         'table_name': _table.table_name,
-                    #         'column_name': column_name,
-                    #         'column_from': column_from,
-                    #         'table_alias': table_alias
-                    #     })
-                    #     yield {
-                    #         'schema': aliases[table_alias]['schema'],
-                    #         'table_name': aliases[table_alias]['table_name'],
-                    #         'column_name': column_name,
-                    #         'column_from': column_from,
-                    #         'table_alias': table_alias
-                    #     }
+                rename_match = rename_match_without_as or rename_match_with_as
+                table_alias = rename_match.groups()[0]
+                column_from = rename_match.groups()[1]
+                column_name = rename_match.groups()[2]
+                _table_or_subquery = self.get_alias_in_cache(table_alias)
+                # Save the table
+                if isinstance(_table_or_subquery, Table):
+                    if not _table_or_subquery.has_column(column_from) \
+                    and not _table_or_subquery.is_temp:
+                        raise Exception(
+                            f'{_table_or_subquery.table_name} does not have {column_from} ' \
+                                + 'as a column'
+                        )
+                    self.selects.append({
+                        'column_name': column_name,
+                        'column': _table_or_subquery.get_column(column_from),
+                        'table_alias': table_alias,
+                        'table': _table_or_subquery
+                    })
+                # Save the subquery
                 else:
-                    # rename_as
-                    table_alias = rename_match_with_as.groups()[0]
-                    column_from = rename_match_with_as.groups()[1]
-                    column_name = rename_match_with_as.groups()[2]
-                    _table_or_subquery = self.get_alias_in_cache(table_alias)
-                    # Save the table
-                    if isinstance(_table_or_subquery, Table):
-                        if not _table_or_subquery.has_column(column_from):
-                            raise Exception(
-                                f'{_table_or_subquery.table_name} does not have {column_from} ' \
-                                    + 'as a column'
-                            )
-                        self.selects.append({
-                            'column_name': column_name,
-                            'column': _table_or_subquery.get_column(column_from),
-                            'table_alias': table_alias,
-                            'table': _table_or_subquery
-                        })
-                    # Save the subquery
-                    else:
-                        self.selects.append({
-                            'column_name': column_name,
-                            'table_alias': table_alias,
-                            'subquery': _table_or_subquery
-                        })
-                    print(self.has_alias_in_cache(table_alias))
-                    # Yield the subquery and the column name when referencing a subquery
-                    # if 'subquery' in aliases[table_alias].keys():
-                    #     yield {
-                    #         'column_name': column_name,
-                    #         'table_alias': table_alias,
-                    #         'subquery': list(aliases[table_alias]['subquery'].values())[0]
-                    #     }
-                    # else:
-                    #     yield {
-                    #         'schema': aliases[table_alias]['schema'],
-                    #         'table_name': aliases[table_alias]['table_name'],
-                    #         'column_name': column_name,
-                    #         'column_from': column_from,
-                    #         'table_alias': table_alias
-                    #     }
+                    self.selects.append({
+                        'column_name': column_name,
+                        'column_from': column_from,
+                        'table_alias': table_alias,
+                        'subquery': _table_or_subquery
+                    })
             # Add the function's call to the select statement
             elif function_match:
                 operation = function_match.groups()[0]
@@ -357,6 +446,12 @@ class ParsedStatement():
                 operation = ' '.join(select_statement.split(' ')[:-1])
                 column_name = select_statement.split(' ')[-1]
                 print(operation)
+                # Keep the expression, or the bare column, so the column's type can be inferred.
+                if re.match(r'[a-zA-Z0-9_]+$', column_name):
+                    self.selects.append({
+                        'operation': operation if operation else column_name,
+                        'column_name': column_name
+                    })
                 # Add the table and schema when a single table/schema is being selected from
                 # if cast_match:
                 #     yield {
@@ -377,30 +472,55 @@ class ParsedStatement():
                 #         'column_name': column_name
                 #     }
 
+    def _parse_ctes(self):
+        """Adds the CTEs defined by the statement's ``WITH`` clause to its scope"""
+        for name, body in cte_definitions(self.tokens):
+            # A CTE can reference the CTEs defined before it.
+            self.ctes[name] = ParsedStatement(
+                body, self.file_name, self.cursor, self.ctes, self.session
+            )
+
+    def _cte_reference(self, identifier:Identifier):
+        """Returns the CTE referenced by an identifier or ``None`` when it references a table"""
+        _name = parse_table_name(identifier.value)
+        if _name.schema is None:
+            return self.ctes.get(_name.table)
+        return None
+
+    def _query_value(self) -> str:
+        """Returns the SQL of the statement without its ``WITH`` clause"""
+        values = []
+        with_seen = False
+        for _token in self.tokens.tokens:
+            if _token.ttype is CTE:
+                with_seen = True
+                continue
+            if with_seen and not _token.is_whitespace:
+                with_seen = False
+                continue
+            if not with_seen:
+                values.append(_token.value)
+        return ''.join(values)
+
     def _parse_table(self):
+        # A subquery or CTE does not write to a table.
+        if self.tokens.get_type() == 'SELECT':
+            return
         # Get the name of the table being created
         _table_name = next(token.value for token in self.tokens if isinstance(token, Identifier))
-        # Add the table metadata to the cached tables to access later.
-        if len(_table_name.split('.')) == 2 \
-            and not found_table(_table_name.split('.')[0], _table_name.split('.')[1]):
+        _name = parse_table_name(_table_name)
+        # A created table is registered with the session once its columns are known. Any other
+        # statement writes to a table created earlier in the script or found in Redshift.
+        if self.tokens.get_type() == 'CREATE':
             _table = Table(
-                _table_name.split('.')[0], _table_name.split('.')[1], self.cursor
-            ).query_data()
-            self.table = _table
-            self.table_cache.append(_table)
-            self.destination_table = _table
-        elif len(_table_name.split('.')) == 3 \
-            and not found_table(_table_name.split('.')[1], _table_name.split('.')[2]):
-            _table = Table(
-                _table_name.split('.')[1], _table_name.split('.')[2], self.cursor
-            ).query_data()
-            self.table = _table
-            self.table_cache.append(_table)
-            self.destination_table = _table
+                _name.table if _name.schema is None else _name.schema, _name.table, self.cursor
+            )
         else:
-            _table = Table(_table_name, _table_name, self.cursor)
-            self.table = _table
-            self.table_cache.append(_table)
+            _table = self.session.get_table(_table_name)
+        self.table = _table
+        self.table_cache.append(_table)
+        if not _table.is_temp:
+            self.destination_table = _table
 
     def _parse_froms(self, token):
         """Yields the ``FROM`` portion of a query"""
@@ -416,7 +536,8 @@ class ParsedStatement():
                     # for __token in extract_from_part(_token, self.cursor):
                         # yield __token
                 elif _token.ttype is Keyword or _token.ttype is Punctuation:
-                    from_seen = False
+                    # A ``DELETE ... USING`` statement also reads from the tables after ``USING``.
+                    from_seen = _token.value.upper() == 'USING'
                     continue
                 else:
                     # The alias used to reference the table in the query
@@ -426,26 +547,19 @@ class ParsedStatement():
                     if alias is None:
                         # return
                         continue
-                    # The full table name without the schema
-                    table_real_name = _token.get_real_name()
-                    # The Redshift schema where the table is accessed from
-                    schema = _token.value.replace(f".{table_real_name}", '').split(' ')[0]
-                    # When the schema starts with an opening paranthesis, ``(``, there is a subquery
-                    # used in this FROM statement. It must be recursively iterated upon.
-                    if schema[0] == '(':
-                        _subquery = ParsedStatement(
-                            sqlparse.parse(
-                                re.sub(r'\)\s+' + table_real_name, '', _token.value)[1:]
-                            )[0],
-                            self.file_name,
-                            self.cursor
-                        )
-                        _subquery.parse()
-                        self.subqueries.append(Subquery(table_real_name, _subquery))
+                    # A derived table, ``(SELECT ...) alias``, is parsed as a subquery of this
+                    # statement.
+                    subquery_tokens = subquery_statement(_token)
+                    if subquery_tokens is not None:
+                        self.subqueries.append(Subquery(alias, ParsedStatement(
+                            subquery_tokens, self.file_name, self.cursor, self.ctes, self.session
+                        )))
+                    # A CTE is referenced like a table but was already parsed with the statement.
+                    elif self._cte_reference(_token) is not None:
+                        self.subqueries.append(Subquery(alias, self._cte_reference(_token)))
                     # Otherwise, the FROM portion of this statement is referencing another table.
                     else:
-                        _table = Table(schema, table_real_name, self.cursor, alias)
-                        _table.query_data()
+                        _table = table_from_identifier(_token, self.session)
                         self.table_cache.append(_table)
                         # self.froms.append(_table)
             if _token.ttype is Keyword and _token.value.upper() == 'FROM':
@@ -475,26 +589,31 @@ class ParsedStatement():
                     _table for _table in self.table_cache
                     if _table.alias == str(_token_no_comments.right).split('.')[0]
                 ]
-                if len(left_tables) == 1:
-                    left_table = left_tables[0]
-                    left_column = left_table.get_column(
-                        str(_token_no_comments.left).split('.')[1]
+                # Columns of subqueries, CTEs, literals and casts are compared by their text.
+                left = str(_token_no_comments.left)
+                right = str(_token_no_comments.right)
+                if len(left_tables) == 1 and _COLUMN_REFERENCE.match(left):
+                    left = (
+                        left_tables[0].get_column(left.split('.')[1].strip().strip('"')),
+                        left_tables[0]
                     )
-                if len(right_tables) == 1:
-                    right_table = right_tables[0]
-                    right_column = right_table.get_column(
-                        str(_token_no_comments.right).split('.')[1]
+                if len(right_tables) == 1 and _COLUMN_REFERENCE.match(right):
+                    right = (
+                        right_tables[0].get_column(right.split('.')[1].strip().strip('"')),
+                        right_tables[0]
                     )
                 comparison = JoinComparison(
-                    (left_column, left_table),
-                    (right_column, right_table),
+                    left,
+                    right,
                     _token_no_comments.value
                         .replace(str(_token_no_comments.left), '')
                         .replace(str(_token_no_comments.right), '')
                         .strip()
                 )
                 join.add_comparison(comparison)
-                self.joins.append(join)
+                # A join is added once, with all of its comparisons.
+                if join not in self.joins:
+                    self.joins.append(join)
             if join_type:
                 # TODO: Implement subquery match with pythonic objects
                 # Find the different comparisons used in this join. The join type is now known and the
@@ -503,53 +622,26 @@ class ParsedStatement():
                     comparisons = True
                     join_type = None
                     continue
-                # Match the value found to see if there is a JOIN using a subquery
-                subquery_match = re.match(
-                    r"\(([\w\W]+)\)", _token.value[:-len(_token.get_name())], re.MULTILINE
-                )
-                # Yield the subquery output when necessary
-                if subquery_match:
-                    print('MATCHED SUBQUERY!!!')
-                    # subquery = parse_statement(
-                    #     sqlparse.parse(subquery_match.groups()[0])[0],
-                    #     {}
-                    # )
-                    # print(sqlparse.parse(subquery_match.groups()[0])[0])
-                    # print('subquery')
-                    # print(subquery)
-                    _subquery = ParsedStatement(
-                        sqlparse.parse(subquery_match.groups()[0])[0],
-                        self.file_name,
-                        self.cursor
-                    )
-                    _subquery.parse()
+                # A JOIN on a derived table, ``(SELECT ...) alias``, is parsed as a subquery of
+                # this statement.
+                subquery_tokens = subquery_statement(_token)
+                if subquery_tokens is not None:
                     # The alias used to reference the table in the query
                     alias = _token.get_name()
                     if not self.has_alias_in_cache(alias):
-                        self.subqueries.append(Subquery(alias, _subquery))
-                    # The full table name without the schema
-                    table_real_name = _token.get_real_name()
-                    # yield {
-                    #     alias: {
-                    #         'join_type': join_type,
-                    #         'subquery': subquery,
-                    #         'table_name': table_real_name,
-                    #         'token': _token
-                    #     }
-                    # }
+                        self.subqueries.append(Subquery(alias, ParsedStatement(
+                            subquery_tokens, self.file_name, self.cursor, self.ctes, self.session
+                        )))
                 # Just the alias of the table is given in this token. Store the table and the alias
                 # in the object's ``table_cache``.
                 else:
                     # The alias used to reference the table in the query
                     alias = _token.get_name()
-                    # The full table name without the schema
-                    table_real_name = _token.get_real_name()
-                    # The Redshift schema where the table is accessed from
-                    redshift_schema = _token.value.replace(f".{table_real_name}", '').split(' ')[0]
-                    if not self.has_alias_in_cache(alias):
+                    if not self.has_alias_in_cache(alias) and self._cte_reference(_token) is not None:
+                        self.subqueries.append(Subquery(alias, self._cte_reference(_token)))
+                    elif not self.has_alias_in_cache(alias):
                     # if not alias in [table.alias for table in tables]:
-                        _table = Table(redshift_schema, table_real_name, self.cursor, alias)
-                        _table.query_data()
+                        _table = table_from_identifier(_token, self.session)
                         self.table_cache.append(_table)
                         print(f'Appending this table ({_table.alias}):')
                         # print(this_table)
@@ -574,12 +666,107 @@ class ParsedStatement():
                 join_type = _token.value.upper()
                 join = Join(_token.value.upper())
 
-    def parse(self) -> None:
-        """Parses the SQL statement for dependencies"""
+    def _parse_statement(self) -> None:
+        """Parses this statement, leaving its subqueries and CTEs to be parsed"""
+        self.has_parsed = True
+        # A ``CREATE TABLE name (column type, ...)`` statement only defines the table's columns.
+        definitions = column_definitions(self.tokens)
+        if definitions is not None:
+            self._parse_table()
+            self.session.register_table(self.table, definitions)
+            return
+        self._parse_ctes()
         self._parse_table()
         self._parse_froms(self.tokens)
         self._parse_joins(self.tokens)
-        self._parse_selects()
+        # A ``DELETE`` statement does not select any columns.
+        if self.tokens.get_type() != 'DELETE':
+            self._parse_selects()
+
+    def parse(self) -> None:
+        """Parses the SQL statement and its subqueries for dependencies"""
+        # Nested subqueries are parsed from a worklist instead of recursively. A CTE referenced
+        # many times is the same statement and is only parsed once.
+        pending = [self]
+        while pending:
+            statement = pending.pop()
+            if statement.has_parsed:
+                continue
+            statement._parse_statement() #pylint: disable=W0212
+            pending.extend(_subquery.parsedStatement for _subquery in statement.subqueries)
+            pending.extend(statement.ctes.values())
+        # The columns of a created table are known once its subqueries are parsed.
+        if self.tokens.get_type() == 'CREATE' and self.table is not None \
+        and not self.table.has_queried:
+            self.session.register_table(self.table, self.derived_columns())
+
+    def walk(self):
+        """Yields the statement, its subqueries and the CTEs it references, each once"""
+        pending = [self]
+        seen = set()
+        while pending:
+            statement = pending.pop()
+            if id(statement) in seen:
+                continue
+            seen.add(id(statement))
+            yield statement
+            pending.extend(_subquery.parsedStatement for _subquery in statement.subqueries)
+            pending.extend(statement.ctes.values())
+
+    def column_type(self, reference:str) -> Union[Tuple[str, int], None]:
+        """Returns the data type and length of a column referenced as ``alias.column`` or
+        ``column``, or ``None`` when its type is not known"""
+        parts = reference.lower().split('.')
+        if len(parts) == 2:
+            sources = [self.get_alias_in_cache(parts[0])]
+        else:
+            # The statement's target table is not one of its sources.
+            sources = [_table for _table in self.table_cache if _table is not self.table] \
+                + self.subqueries
+        for source in sources:
+            if isinstance(source, Table) and source.has_column(parts[-1]):
+                column = source.get_column(parts[-1])
+                if column.data_type != 'UNKNOWN':
+                    return (column.data_type, column.data_length)
+            elif source is not None and not isinstance(source, Table):
+                _type = source.parsedStatement.output_type(parts[-1])
+                if _type is not None:
+                    return _type
+        return None
+
+    def output_type(self, column_name:str) -> Union[Tuple[str, int], None]:
+        """Returns the data type and length of a column selected by the statement"""
+        _select = next(
+            (_select for _select in self.selects if _select['column_name'] == column_name), None
+        )
+        if _select is None:
+            return None
+        _type = self.select_type(_select)
+        return None if _type == type_inference.UNKNOWN else _type
+
+    def select_type(self, _select:dict) -> Tuple[str, int]:
+        """Returns the data type and length of a selected column
+
+        The types of the catalog columns are propagated through subqueries, CTEs, casts,
+        functions and ``CASE`` expressions.
+        """
+        column = _select.get('column')
+        if column is not None and column.data_type != 'UNKNOWN':
+            return (column.data_type, column.data_length)
+        if 'subquery' in _select:
+            _type = _select['subquery'].parsedStatement.output_type(
+                _select.get('column_from', _select['column_name'])
+            )
+            return _type if _type is not None else type_inference.UNKNOWN
+        if 'operation' in _select:
+            return type_inference.infer_type(_select['operation'], self.column_type)
+        return type_inference.UNKNOWN
+
+    def derived_columns(self) -> list:
+        """Returns the name, data type and length of every column selected by the statement"""
+        return [
+            (_select['column_name'], *self.select_type(_select)) for _select in self.selects
+        ]
 
 def remove_comments(sql_string:str) -> None:
     """Removes all comments from the given SQL string"""
@@ -784,12 +971,7 @@ def extract_from_part(token, redshift_cursor):
                 # When the schema starts with an opening paranthesis, ``(``, there is a subquery
                 # used in this FROM statement. It must be recursively iterated upon.
                 if schema[0] == '(':
-                    sub_query = parse_statement(
-                        sqlparse.parse(
-                            re.sub(r'\)\s+' + table_real_name, '', _token.value)[1:]
-                        )[0],
-                        {}
-                    )
+                    sub_query = parse_statement(subquery_statement(_token), {}, redshift_cursor)
                     # When there are more than 1 values found in this recursive step, the parsing
                     # failed.
                     if len(sub_query.values()) > 1:
@@ -875,16 +1057,11 @@ def extract_join_part(token, redshift_cursor):
                 join_type = None
                 continue
             # Match the value found to see if there is a JOIN using a subquery
-            subquery_match = re.match(
-                r"\(([\w\W]+)\)", _token.value[:-len(_token.get_name())], re.MULTILINE
-            )
+            subquery_tokens = subquery_statement(_token)
             # Yield the subquery output when necessary
-            if subquery_match:
+            if subquery_tokens is not None:
                 print('MATCHED SUBQUERY!!!')
-                subquery = parse_statement(
-                    sqlparse.parse(subquery_match.groups()[0])[0],
-                    {}
-                )
+                subquery = parse_statement(subquery_tokens, {}, redshift_cursor)
                 print('subquery')
                 print(subquery)
                 # The alias used to reference the table in the query
@@ -1099,36 +1276,26 @@ def encode_table(joins, froms, table_name, selects, comparisons, output):
             raise Exception('Could not parse Join')
     return output
 
-def parse_statement(parsed, output):
-    """Parses a tokenized sql_parse token and returns an encoded table."""
+def parse_statement(parsed, output, redshift_cursor):
+    """Parses a tokenized sql_parse token and returns an encoded table, querying the metadata of
+    its tables with ``redshift_cursor``."""
     # Get the name of the table being created
     table_name = next(token.value for token in parsed.tokens if isinstance(token, Identifier))
+    _name = parse_table_name(table_name)
     # Add the table metadata to the cached tables to access later.
-    if len(table_name.split('.')) == 2\
-        and not found_table(table_name.split('.')[0], table_name.split('.')[1]):
-        this_table = Table(
-            table_name.split('.')[0], table_name.split('.')[1], cursor
-        )
+    if _name.schema is not None and not found_table(_name.schema, _name.table):
+        this_table = Table(_name.schema, _name.table, redshift_cursor)
         print(f'Appending this table ({this_table.alias}):')
         print(this_table)
         this_table.query_data()
         tables.append(this_table)
-    elif len(table_name.split('.')) == 3 \
-        and not found_table(table_name.split('.')[1], table_name.split('.')[2]):
-        this_table = Table(
-            table_name.split('.')[1], table_name.split('.')[2], cursor
-        )
-        print('Appending this table')
-        print(this_table)
-        this_table.query_data()
-        tables.append(this_table)
     # print(this_table)
     # Get all the FROM statements's metadata
-    froms = {k: v for d in extract_from_part(parsed, cursor) for k, v in d.items()}
+    froms = {k: v for d in extract_from_part(parsed, redshift_cursor) for k, v in d.items()}
     print('Tables:')
     print([table for table in tables])
     # Get all the JOIN statements's metadata
-    joins = list(extract_join_part(parsed, cursor))
+    joins = list(extract_join_part(parsed, redshift_cursor))
     # Get all of the comparisons to compare the number of comparisons to the number of JOIN
     # statements
     comparisons = list(extract_comparisons(parsed))
@@ -1143,49 +1310,83 @@ def parse_statement(parsed, output):
         raise Exception('Parsing messed up!')
     return encode_table(joins, froms, table_name, selects, comparisons, output)
 
-sql_contents = open(
-    # "/Users/tnorlund/etl_aws_copy/apps/dm-tmp-transform-prod/sql/transform.tmp.daily_active_subs_and_frequency_poc.sql"
-    "/Users/tnorlund/etl_aws_copy/apps/dm-transform/sql/transform.dmt.f_invoice.sql"
-    # "/Users/tnorlund/etl_aws_copy/apps/dm-extract/sql/load.stg.erp_invoices.sql"
-    # "/Users/tnorlund/etl_aws_copy/apps/dm-erp-transform/sql/transform.spectrum.erp_invoices.sql"
-).read()
-# sql_contents = """
-# CREATE TEMP TABLE dm_delta AS
-# select distinct i.customer_id as customer_id
-# from stg.erp_invoices i
-#   inner join stg.orders o
-#     on i.order_id = o.id
-#   left outer join stg.erp_shipments s
-#     on i.order_id = s.order_id
-# where (
-#          i.dsc_processed_at >= '<start_date>'::timestamp  -  interval '1 day'
-#          OR o.updated_at >= '<start_date>'::timestamp -  interval '1 day'
-#          OR s.dsc_processed_at >= '<start_date>'::timestamp -  interval '1 day'
-#        )
-# ;
-# """
-out = {}
+def parse_file(
+    file_name:str, redshift_cursor, catalog:dict=None, keep_unparsed:bool=False
+) -> list:
+    """Parses every ``CREATE``, ``INSERT`` and ``DELETE`` statement found in a '.sql' file
 
-for sql_statement in sqlparse.split(sql_contents):
-    # Tokenize the SQL statement
-    parsed_sql = sqlparse.parse( sql_statement )[0]
-    if isinstance(parsed_sql.tokens[0], Token) \
-    and (
-        parsed_sql.tokens[0].value.upper() == 'CREATE'
-        or parsed_sql.tokens[0].value.upper() == 'INSERT'
-    ):
-        _statement = ParsedStatement(
-            parsed_sql,
-            '/Users/tnorlund/etl_aws_copy/apps/dm-transform/sql/transform.dmt.f_invoice.sql',
-            cursor
-        )
-        _statement.parse()
-        _statement.dump('dump/')
-        # print(type(parsed_sql))
-        # out = parse_statement(parsed_sql, out)
-    print('FINISHED STATEMENT')
-    tables = []
+    The statements share a ``Session``, so the tables created by a statement are known to the
+    statements after it.
+
+    Parameters
+    ----------
+    file_name : str
+        The path to the '.sql' file
+    redshift_cursor : sqlparse.connection()
+        The ``sqlparse`` database session
+    catalog : dict of str to Table(), default to None
+        The tables already queried from Redshift while parsing other files
+    keep_unparsed : bool, default to False
+        Whether the statements reading or writing tables that are not parsed, like ``UPDATE``,
+        ``TRUNCATE``, ``DROP`` or a statement ``ParsedStatement`` fails on, are returned as
+        ``concurrency.UnparsedStatement()`` with their read and write sets
+
+    Returns
+    -------
+    list of ParsedStatement()
+        The parsed statements in the order they are found in the file
+    """
+    with open(file_name, encoding='utf-8') as _f:
+        sql_contents = _f.read()
+    session = Session(redshift_cursor, catalog)
+    statements = []
+    for sql_statement in sqlparse.split(sql_contents):
+        # Tokenize the SQL statement
+        parsed_sql = sqlparse.parse(sql_statement)[0]
+        # The comments before a statement are not its type.
+        first = parsed_sql.token_first(skip_cm=True)
+        if first is None:
+            continue
+        keyword = first.value.upper()
+        if keyword in ('CREATE', 'INSERT', 'DELETE'):
+            _statement = ParsedStatement(
+                parsed_sql, file_name, redshift_cursor, session=session
+            )
+            try:
+                _statement.parse()
+            except Exception: #pylint: disable=W0703
+                if not keep_unparsed:
+                    raise
+                _statement = UnparsedStatement(parsed_sql, file_name)
+            statements.append(_statement)
+            continue
+        # A dropped table is no longer known to the statements after it.
+        if keyword == 'DROP':
+            _dropped = next(
+                (_token for _token in parsed_sql.tokens if isinstance(_token, Identifier)), None
+            )
+            if _dropped is not None:
+                session.drop_table(_dropped.value)
+        if keep_unparsed:
+            _statement = UnparsedStatement(parsed_sql, file_name)
+            if _statement.reads or _statement.writes:
+                statements.append(_statement)
+    return statements
+
+if __name__ == '__main__':
+    cursor = connect_to_redshift().cursor()
+    FILE_NAME = (
+        # "/Users/tnorlund/etl_aws_copy/apps/dm-tmp-transform-prod/sql/transform.tmp.daily_active_subs_and_frequency_poc.sql"
+        "/Users/tnorlund/etl_aws_copy/apps/dm-transform/sql/transform.dmt.f_invoice.sql"
+        # "/Users/tnorlund/etl_aws_copy/apps/dm-extract/sql/load.stg.erp_invoices.sql"
+        # "/Users/tnorlund/etl_aws_copy/apps/dm-erp-transform/sql/transform.spectrum.erp_invoices.sql"
+    )
+    out = {}
+    with dump_format.DumpSink('dump/') as sink:
+        for _statement in parse_file(FILE_NAME, cursor):
+            sink.add(_statement)
+            print('FINISHED STATEMENT')
 
-# print(out)
-with open('dmt_f_invoice.json', 'w') as json_file:
-    json.dump(out, json_file)
+    # print(out)
+    with open('dmt_f_invoice.json', 'w') as json_file:
+        json.dump(out, json_file)
@@ -2,8 +2,8 @@
 import os
 import json
 import pandas as pd
-import sqlparse
-from sql_metadata import Parser
+from corpus import parse_sql_file
+from utils import table_name_cleaner
 
 
 these_tables = [
@@ -26,21 +26,6 @@ these_tables = [
     "dmt.d_bundle_discounted_value"
 ]
 
-def table_name_cleaner( table_name: str ) -> str:
-    if ( table_name.startswith('dmt.') ):
-        return table_name.replace('dmt.', '')
-    if ( table_name.startswith('stg.') ):
-        return table_name.replace('stg.', '')
-    if ( table_name.startswith('map.') ):
-        return table_name.replace('map.', '')
-    if ( table_name.startswith('extract.') ):
-        return table_name.replace('extract.', '')
-    if ( table_name.startswith('tmp.') ):
-        return table_name.replace('tmp.', '')
-    if ( table_name.startswith('spectrum.') ):
-        return table_name.replace('spectrum.', '')
-    return table_name
-
 # Read the current tables used by the SA team
 column_names = [
     'Table Name',
@@ -87,35 +72,15 @@ for app in apps:
     for sql_file in [ file for file in app_sql_files if file.endswith( '.sql' ) ]:
         data[app][sql_file] = []
         table_data[app][sql_file] = []
-        # Read the SQL query contents in order to parse each statement
-        sql_contents = open( 
-            os.path.join( os.path.join( PARSE_PATH, app + '/sql' ), sql_file ) 
-        ).read()
-        for sql_statement in sqlparse.split( sql_contents ):
-            parsed = sqlparse.parse( sql_statement )[0]
-            sql_type = parsed.get_type()
-            # Record the changed table when there is a SELECT, INSERT, CREATE, or DELETE
-            if sql_type == 'SELECT' or sql_type == 'CREATE' \
-            or sql_type == 'DELETE' or sql_type == 'INSERT':
-                try:
-                    metadata = Parser( parsed.value )
-                    if sql_type == 'CREATE' or sql_type == 'INSERT' or sql_type == 'DELETE' and \
-                    len([table_name for table_name in metadata.tables if table_name in these_tables]) > 0:
-                        table_data[app][sql_file] = [table_name for table_name in metadata.tables if table_name in these_tables]
-                    data[app][sql_file].append( {
-                        'type':sql_type,
-                        'columns':metadata.columns_dict,
-                        'tables':metadata.tables,
-                        'subqueries':metadata.subqueries,
-                        'skipped': False,
-                        'value': parsed.value
-                    } )
-                except:
-                    not_parsed_statements += 1
-                    data[app][sql_file].append( {
-                        'skipped': True,
-                        'value': parsed.value
-                    } )
+        # Parse each statement of the script into its 'sql.json' record
+        for record in parse_sql_file( os.path.join( PARSE_PATH, app, 'sql', sql_file ) ):
+            sql_type = record['type']
+            if record['skipped']:
+                not_parsed_statements += 1
+            elif sql_type == 'CREATE' or sql_type == 'INSERT' or sql_type == 'DELETE' and \
+            len([table_name for table_name in record['tables'] if table_name in these_tables]) > 0:
+                table_data[app][sql_file] = [table_name for table_name in record['tables'] if table_name in these_tables]
+            data[app][sql_file].append( record )
 
 with open('tables_for_kyle.json', 'w') as json_file:
   json.dump(table_data, json_file)
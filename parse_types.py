@@ -73,11 +73,11 @@ class JoinComparison():
         return str(self)
 
     def __iter__(self):
-        if isinstance(self.left_str, str):
+        if self.left_str:
             yield 'left', self.left
         else:
             yield 'left', {'table': dict(self.left_table), 'column':dict(self.left_column)}
-        if isinstance(self.right_str, str):
+        if self.right_str:
             yield 'right', self.right
         else:
             yield 'right', {'table': dict(self.right_table), 'column':dict(self.right_column)}
@@ -0,0 +1,334 @@
+"""A common interface to the strategies used to parse the SQL statements of the apps.
+
+Every backend returns a ``ParseResult`` holding the tables, columns, join columns and subqueries of
+a statement:
+
+- ``sql_metadata``: ``sql_metadata.Parser``, used by ``main.py``, ``parse.py`` and ``corpus.py``
+- ``sqlparse``: the ``sqlparse`` token walking of ``new_join_parser.ParsedStatement``, which needs
+  a Redshift connection for the columns of the tables
+- ``extract_tables``: the ``FROM``/``JOIN`` extractors of ``test.py``, which only find tables
+
+A backend is chosen per run with ``--backend``. ``--compare`` runs several backends on the same
+statements and reports their statements per second, failure rate and how often they disagree
+with the first backend, so the fastest backend that is correct enough can be used for a report.
+"""
+import sys
+import json
+import time
+import argparse
+from abc import ABC, abstractmethod
+from typing import Union
+import sqlparse
+from sqlparse.sql import IdentifierList, Identifier
+from sqlparse.tokens import Keyword, DML, DDL
+from sql_metadata import Parser
+from new_join_parser import ParsedStatement, connect_to_redshift
+from Session import Session
+from results_store import open_results
+from utils import table_key
+
+# The fields of a ParseResult compared between backends
+FIELDS = ('tables', 'columns', 'joins', 'subqueries')
+
+def _column_name(column:str) -> str:
+    """Returns the case-folded name of a column without its table"""
+    return column.rsplit('.', 1)[-1].strip('"').lower()
+
+class ParseResult():
+    """The tables and columns a backend found in a statement
+
+    A field a backend cannot find is ``None`` and is not compared with the other backends.
+
+    Attributes
+    ----------
+    tables : set of str
+        The keys of the tables read or written
+    columns : set of str
+        The names of the columns used, without their table
+    joins : set of str
+        The names of the columns compared in the join conditions
+    subqueries : set of str
+        The aliases of the subqueries
+    """
+    def __init__(
+        self, tables:set, columns:set=None, joins:set=None, subqueries:set=None
+    ) -> None:
+        self.tables = tables
+        self.columns = columns
+        self.joins = joins
+        self.subqueries = subqueries
+
+    def __iter__(self):
+        for field in FIELDS:
+            value = getattr(self, field)
+            yield field, sorted(value) if value is not None else None
+
+    def __repr__(self) -> str:
+        return f'ParseResult({dict(self)})'
+
+    def disagreements(self, other) -> list:
+        """Returns the fields both results found with different values"""
+        return [
+            field for field in FIELDS
+            if getattr(self, field) is not None and getattr(other, field) is not None
+            and getattr(self, field) != getattr(other, field)
+        ]
+
+class ParserBackend(ABC):
+    """The interface of a parser backend
+
+    Attributes
+    ----------
+    name : str
+        The name the backend is selected with
+    """
+    name = None
+
+    @abstractmethod
+    def parse(self, sql:str, file_name:str=None) -> ParseResult:
+        """Parses a single SQL statement
+
+        Parameters
+        ----------
+        sql : str
+            The SQL statement
+        file_name : str, default to None
+            The '.sql' file of the statement, for the backends that follow the temp tables
+            created by the previous statements of the file
+        """
+
+class SqlMetadataBackend(ParserBackend):
+    """Parses statements with ``sql_metadata.Parser``"""
+    name = 'sql_metadata'
+
+    def parse(self, sql:str, file_name:str=None) -> ParseResult:
+        metadata = Parser(sql)
+        columns_dict = metadata.columns_dict or {}
+        return ParseResult(
+            {table_key(table) for table in metadata.tables},
+            {_column_name(column) for column in metadata.columns},
+            {_column_name(column) for column in columns_dict.get('join', [])},
+            set(metadata.subqueries_names)
+        )
+
+class SqlparseBackend(ParserBackend):
+    """Parses statements with ``new_join_parser.ParsedStatement``
+
+    The statements of a file share a ``Session``, so the temp tables a statement creates are known
+    to the statements after it, and the catalog is queried once per table for every file.
+
+    Attributes
+    ----------
+    redshift_cursor : sqlparse.connection()
+        The ``sqlparse`` database session
+    """
+    name = 'sqlparse'
+
+    def __init__(self, redshift_cursor=None) -> None:
+        self.redshift_cursor = redshift_cursor if redshift_cursor is not None \
+            else connect_to_redshift().cursor()
+        self._catalog = {}
+        self._sessions = {}
+
+    def _session(self, file_name:str) -> Session:
+        """Returns the session shared by the statements of a file"""
+        if file_name not in self._sessions:
+            self._sessions[file_name] = Session(self.redshift_cursor, self._catalog)
+        return self._sessions[file_name]
+
+    def parse(self, sql:str, file_name:str=None) -> ParseResult:
+        statement = ParsedStatement(
+            sqlparse.parse(sql)[0], file_name, self.redshift_cursor,
+            session=self._session(file_name)
+        )
+        statement.parse()
+        tables, columns, joins, subqueries = set(), set(), set(), set()
+        # The subqueries are parsed with the statement and found in its result.
+        stack = [statement]
+        while stack:
+            _statement = stack.pop()
+            if _statement.table is not None:
+                tables.add(_statement.table.key)
+            tables.update(_table.key for _table in _statement.table_cache)
+            columns.update(_column_name(_select['column_name']) for _select in _statement.selects)
+            for join in _statement.joins:
+                for comparison in join.comparisons:
+                    if not comparison.left_str:
+                        joins.add(comparison.left_column.column_name.lower())
+                    if not comparison.right_str:
+                        joins.add(comparison.right_column.column_name.lower())
+            subqueries.update(_subquery.alias for _subquery in _statement.subqueries)
+            stack.extend(_subquery.parsedStatement for _subquery in _statement.subqueries)
+        # CTEs are referenced like tables but are not tables.
+        tables.difference_update(statement.ctes)
+        return ParseResult(tables, columns | joins, joins, subqueries)
+
+def _is_subselect(parsed) -> bool:
+    """Returns whether a token is a group holding a ``SELECT``"""
+    if not parsed.is_group:
+        return False
+    return any(item.ttype is DML and item.value.upper() == 'SELECT' for item in parsed.tokens)
+
+def _from_part(parsed):
+    """Yields the tokens after every ``FROM`` of a statement and of its subqueries"""
+    from_seen = False
+    for item in parsed.tokens:
+        if from_seen:
+            if _is_subselect(item):
+                yield from _from_part(item)
+            elif item.ttype is Keyword:
+                from_seen = False
+            else:
+                yield item
+        elif item.ttype is Keyword and item.value.upper() == 'FROM':
+            from_seen = True
+
+def _join_part(parsed):
+    """Yields the tokens after every ``JOIN`` of a statement"""
+    join_seen = False
+    for item in parsed.tokens:
+        if join_seen:
+            if item.ttype is Keyword:
+                join_seen = False
+                continue
+            yield item
+        if item.ttype is Keyword and item.value.upper().endswith('JOIN'):
+            join_seen = True
+
+class ExtractTablesBackend(ParserBackend):
+    """Finds the tables after the ``FROM`` and ``JOIN`` keywords, like the extractors of
+    ``test.py``"""
+    name = 'extract_tables'
+
+    def parse(self, sql:str, file_name:str=None) -> ParseResult:
+        parsed = sqlparse.parse(sql)[0]
+        tables = set()
+        for item in list(_from_part(parsed)) + list(_join_part(parsed)):
+            identifiers = item.get_identifiers() if isinstance(item, IdentifierList) else [item]
+            for identifier in identifiers:
+                if isinstance(identifier, Identifier) and not _is_subselect(identifier) \
+                and identifier.get_real_name() is not None:
+                    name = identifier.get_real_name()
+                    if identifier.get_parent_name() is not None:
+                        name = f'{identifier.get_parent_name()}.{name}'
+                    tables.add(table_key(name))
+        # The written table follows ``INTO``, ``TABLE`` or ``FROM`` of a ``DELETE``.
+        for index, item in enumerate(parsed.tokens):
+            if item.ttype in (Keyword, DDL) and item.value.upper() in ('INTO', 'TABLE'):
+                _next = parsed.token_next(index)[1]
+                if isinstance(_next, Identifier):
+                    tables.add(table_key(_next.value))
+                break
+        return ParseResult(tables)
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (SqlMetadataBackend, SqlparseBackend, ExtractTablesBackend)
+}
+
+def get_backend(name:str, **kwargs) -> ParserBackend:
+    """Returns the backend with the given name"""
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown parser backend {name!r}, expected one of {sorted(BACKENDS)}')
+    return BACKENDS[name](**kwargs)
+
+def parse_all(backend:ParserBackend, statements) -> tuple:
+    """Parses statements with a backend
+
+    Parameters
+    ----------
+    backend : ParserBackend()
+        The backend used to parse the statements
+    statements : iterable of tuple
+        The ``(file name, SQL)`` of every statement
+
+    Returns
+    -------
+    tuple
+        The ParseResult, or ``None`` when the backend failed, of every statement and the seconds
+        spent parsing them
+    """
+    results = []
+    start = time.perf_counter()
+    for file_name, sql in statements:
+        try:
+            results.append(backend.parse(sql, file_name))
+        except Exception: #pylint: disable=W0703
+            results.append(None)
+    return results, time.perf_counter() - start
+
+def compare(backends:list, statements:list) -> dict:
+    """Runs backends on the same statements and compares them with the first backend
+
+    Returns
+    -------
+    dict
+        The statements per second and failure rate of every backend, and the share of the
+        statements both backends parsed where a field differs from the first backend
+    """
+    report = {}
+    reference = None
+    for backend in backends:
+        results, seconds = parse_all(backend, statements)
+        failures = sum(result is None for result in results)
+        _report = {
+            'statements': len(statements),
+            'seconds': round(seconds, 3),
+            'statements_per_second': round(len(statements) / seconds, 1) if seconds else None,
+            'failure_rate': round(failures / len(statements), 4) if statements else 0.0
+        }
+        if reference is None:
+            reference = results
+        else:
+            compared = {field: 0 for field in FIELDS}
+            disagreements = {field: 0 for field in FIELDS}
+            for _reference, result in zip(reference, results):
+                if _reference is None or result is None:
+                    continue
+                for field in FIELDS:
+                    if getattr(_reference, field) is not None and getattr(result, field) is not None:
+                        compared[field] += 1
+                for field in _reference.disagreements(result):
+                    disagreements[field] += 1
+            _report['disagreement'] = {
+                field: round(disagreements[field] / compared[field], 4)
+                for field in FIELDS if compared[field]
+            }
+        report[backend.name] = _report
+    return report
+
+def store_statements(app:str=None) -> list:
+    """Returns the ``(file name, SQL)`` of the statements stored in the results database"""
+    results = open_results()
+    statements = [
+        (file_name, record['value'])
+        for _app, file_name, _position, record in results.statements(app)
+    ]
+    results.close()
+    return statements
+
+def _result_json(result:Union[ParseResult, None]) -> Union[dict, None]:
+    return dict(result) if result is not None else None
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    arguments.add_argument(
+        '--backend', action='append', choices=sorted(BACKENDS),
+        help='The backend to parse with. Repeat it to compare several backends.'
+    )
+    arguments.add_argument('--compare', action='store_true', help='Compare the backends')
+    arguments.add_argument('--app', help='Only parse the statements of this app')
+    options = arguments.parse_args()
+    _statements = store_statements(options.app)
+    _backends = [get_backend(name) for name in options.backend or ['sql_metadata']]
+    if options.compare:
+        json.dump(compare(_backends, _statements), sys.stdout, indent=4)
+    else:
+        _results, _seconds = parse_all(_backends[0], _statements)
+        json.dump(
+            [
+                {'file_name': file_name, **(_result_json(result) or {'failed': True})}
+                for (file_name, _sql), result in zip(_statements, _results)
+            ],
+            sys.stdout, indent=4
+        )
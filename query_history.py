@@ -0,0 +1,205 @@
+"""Attributes the cost of the queries Redshift ran to the apps, files and statements running them.
+
+The query history is read from a local export of ``STL_QUERY`` or ``SYS_QUERY_HISTORY``, as a
+'.csv' or '.parquet' file. The export is streamed, so its size does not matter. Each query is
+matched to the parsed statements by its fingerprint. Its elapsed time, queue time and bytes scanned
+are added to the app, file, statement and target table running it.
+
+Redshift truncates the query text to 4000 characters. A truncated query is matched to the
+templates starting with its own template.
+"""
+import os
+import csv
+import sys
+import json
+import bisect
+from datetime import datetime
+from typing import Union
+from fingerprint import TemplateIndex, template, template_hash
+from results_store import open_results
+
+# The columns of the exports holding each value, in order of preference
+COLUMN_NAMES = {
+    'text': ('query_text', 'querytxt', 'text'),
+    'label': ('label', 'query_label', 'query_group'),
+    'elapsed': ('elapsed_time', 'elapsed', 'total_exec_time'),
+    'queue': ('queue_time', 'total_queue_time'),
+    'bytes': ('bytes_scanned', 'scanned_bytes', 'input_bytes'),
+    'start_time': ('start_time', 'starttime'),
+    'end_time': ('end_time', 'endtime')
+}
+# Redshift stores the times in microseconds.
+MICROSECONDS = 1000000
+# The length Redshift truncates the query text to
+TRUNCATED_LENGTH = 3999
+
+def _column(row:dict, key:str) -> Union[str, None]:
+    """Returns the value of the first column of the row holding a value"""
+    for name in COLUMN_NAMES[key]:
+        if name in row and row[name] not in (None, ''):
+            return row[name]
+    return None
+
+def _number(value) -> float:
+    """Returns an exported number, or 0 when it is missing"""
+    try:
+        return float(value) if value is not None else 0.0
+    except ValueError:
+        return 0.0
+
+def read_csv(file_name:str):
+    """Yields the rows of a '.csv' export one at a time"""
+    with open(file_name, encoding='utf-8', newline='') as _f:
+        for row in csv.DictReader(_f):
+            yield {key.strip().lower(): value for key, value in row.items() if key is not None}
+
+def read_parquet(file_name:str, batch_size:int=65536):
+    """Yields the rows of a '.parquet' export, reading a batch of rows at a time"""
+    try:
+        import pyarrow.parquet #pylint: disable=C0415
+    except ImportError as error:
+        raise ImportError('Reading a \'.parquet\' export requires pyarrow') from error
+    for batch in pyarrow.parquet.ParquetFile(file_name).iter_batches(batch_size=batch_size):
+        for row in batch.to_pylist():
+            yield {key.lower(): value for key, value in row.items()}
+
+def read_history(file_name:str):
+    """Yields the rows of a query history export"""
+    if file_name.endswith('.parquet'):
+        return read_parquet(file_name)
+    return read_csv(file_name)
+
+def query_costs(row:dict) -> tuple:
+    """Returns the elapsed seconds, queue seconds and bytes scanned of an exported query"""
+    elapsed = _column(row, 'elapsed')
+    if elapsed is not None:
+        elapsed = _number(elapsed) / MICROSECONDS
+    else:
+        # ``STL_QUERY`` only has the start and end of the query.
+        start, end = _column(row, 'start_time'), _column(row, 'end_time')
+        try:
+            elapsed = (
+                datetime.fromisoformat(str(end)) - datetime.fromisoformat(str(start))
+            ).total_seconds()
+        except ValueError:
+            elapsed = 0.0
+    return elapsed, _number(_column(row, 'queue')) / MICROSECONDS, _number(_column(row, 'bytes'))
+
+class CostAttribution():
+    """Matches the queries of a query history export to the parsed statements
+
+    Attributes
+    ----------
+    index : fingerprint.TemplateIndex
+        The templates of the parsed statements
+    totals : dict of str to dict
+        The number of queries, elapsed seconds, queue seconds and bytes scanned of every app,
+        file, statement and target table
+    unmatched : dict
+        The queries that could not be matched to a statement
+    """
+    def __init__(self, index:TemplateIndex) -> None:
+        self.index = index
+        self.totals = {'apps': {}, 'files': {}, 'statements': {}, 'tables': {}}
+        self.unmatched = {'queries': 0, 'elapsed_seconds': 0.0}
+        self.matched = 0
+        # The sorted templates, to find the template a truncated query starts
+        self._templates = sorted(
+            (entry['template'], fingerprint) for fingerprint, entry in index.templates.items()
+        )
+        self._fingerprints = {}
+
+    def match(self, query_text:str) -> list:
+        """Returns the fingerprints of the statements that may have run a query
+
+        A truncated query can match several templates starting the same way.
+        """
+        fingerprint = template_hash(query_text)
+        if self.index.get(fingerprint) is not None:
+            return [fingerprint]
+        if len(query_text) < TRUNCATED_LENGTH:
+            return []
+        # Leave out the last token, which may have been cut in the middle.
+        prefix = template(query_text).rsplit(' ', 1)[0]
+        matches = []
+        position = bisect.bisect_left(self._templates, (prefix,))
+        while position < len(self._templates) and self._templates[position][0].startswith(prefix):
+            matches.append(self._templates[position][1])
+            position += 1
+        return matches
+
+    def _add(self, section:str, key:str, costs:tuple, share:float) -> None:
+        """Adds a share of the costs of a query to an app, file, statement or table"""
+        total = self.totals[section].setdefault(key, {
+            'queries': 0.0, 'elapsed_seconds': 0.0, 'queue_seconds': 0.0, 'bytes_scanned': 0.0
+        })
+        total['queries'] += share
+        total['elapsed_seconds'] += costs[0] * share
+        total['queue_seconds'] += costs[1] * share
+        total['bytes_scanned'] += costs[2] * share
+
+    def add(self, row:dict) -> bool:
+        """Attributes the costs of an exported query and returns whether it was matched"""
+        query_text = _column(row, 'text')
+        if query_text is None:
+            return False
+        costs = query_costs(row)
+        # The same text is run every day, so the fingerprints are kept per text.
+        if query_text not in self._fingerprints:
+            self._fingerprints[query_text] = self.match(query_text)
+        fingerprints = self._fingerprints[query_text]
+        if not fingerprints:
+            self.unmatched['queries'] += 1
+            self.unmatched['elapsed_seconds'] += costs[0]
+            return False
+        occurrences = [
+            occurrence for fingerprint in fingerprints
+            for occurrence in self.index.get(fingerprint)['occurrences']
+        ]
+        # A query labelled with an app is run by that app's statements.
+        label = _column(row, 'label')
+        labelled = [occurrence for occurrence in occurrences if occurrence['app'] == label]
+        if labelled:
+            occurrences = labelled
+        # Otherwise the statements running the same template share its costs.
+        share = 1 / len(occurrences)
+        for occurrence in occurrences:
+            file_key = f'{occurrence["app"]}:{os.path.basename(occurrence["file"])}'
+            self._add('apps', occurrence['app'], costs, share)
+            self._add('files', file_key, costs, share)
+            self._add('statements', f'{file_key}:{occurrence["position"]}', costs, share)
+            if occurrence['target'] is not None:
+                self._add('tables', occurrence['target'], costs, share)
+        self.matched += 1
+        return True
+
+    def add_history(self, file_name:str) -> None:
+        """Attributes the costs of every query of an export"""
+        for row in read_history(file_name):
+            self.add(row)
+            # Bound the memory used by the fingerprints of one-off queries.
+            if len(self._fingerprints) > 100000:
+                self._fingerprints.clear()
+
+    def report(self) -> dict:
+        """Returns the totals of every section, the most expensive first"""
+        return {
+            'matched': self.matched,
+            'unmatched': self.unmatched,
+            **{
+                section: dict(sorted(
+                    totals.items(), key=lambda item: -item[1]['elapsed_seconds']
+                ))
+                for section, totals in self.totals.items()
+            }
+        }
+
+if __name__ == '__main__':
+    results = open_results()
+    attribution = CostAttribution(TemplateIndex.from_store(results))
+    results.close()
+    for history_file in sys.argv[1:]:
+        attribution.add_history(history_file)
+    with open('query_costs.json', 'w', encoding='utf-8') as json_file:
+        json.dump(attribution.report(), json_file, indent=4)
+    print(f'Matched {attribution.matched} queries, {attribution.unmatched["queries"]} unmatched')
@@ -0,0 +1,163 @@
+"""Parses the queries Redshift ran, as found in an export of ``STL_QUERYTEXT``, into the results
+database.
+
+``STL_QUERYTEXT`` stores the text of every query in 200-character chunks, one row per
+``(query, sequence)``. The chunks are read from a local '.csv' or '.parquet' export and reassembled
+one query at a time. An export that is not ordered by ``query`` and ``sequence`` is first spooled
+to a temporary SQLite file and sorted there, so the memory used does not depend on the size of the
+export. Identical texts are parsed once, and the unique texts are parsed in parallel.
+
+The statements are stored as the files of the ``query_history`` app, ``results_store.HISTORY_APP``,
+so the reads of ad-hoc and BI queries can be added to the table graph built from the
+``apps/*/sql`` scripts. The ETL reports leave the app out unless they are asked to include it.
+"""
+import os
+import sys
+import json
+import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import sqlparse
+from corpus import statement_record
+from query_history import read_history
+from results_store import HISTORY_APP, ResultsStore, open_results, text_hash
+
+# The length of the chunks ``STL_QUERYTEXT`` splits the query text into
+CHUNK_LENGTH = 200
+
+def read_chunks(file_name:str):
+    """Yields the ``(query, sequence, text)`` chunks of a ``STL_QUERYTEXT`` export"""
+    for row in read_history(file_name):
+        if row.get('query') in (None, '') or row.get('text') is None:
+            continue
+        yield int(row['query']), int(row.get('sequence') or 0), row['text']
+
+def sort_chunks(chunks, directory:str=None, batch_size:int=10000):
+    """Yields the chunks ordered by query and sequence, sorted in a temporary SQLite file
+
+    Parameters
+    ----------
+    chunks : iterable of tuple
+        The ``(query, sequence, text)`` chunks, in any order
+    directory : str, default to None
+        The directory of the temporary file, the system's temporary directory by default
+    batch_size : int, default to 10000
+        The number of chunks inserted at a time
+    """
+    _fd, database = tempfile.mkstemp(suffix='.db', dir=directory)
+    os.close(_fd)
+    connection = sqlite3.connect(database)
+    try:
+        connection.execute('CREATE TABLE chunks (query INTEGER, sequence INTEGER, text TEXT)')
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                connection.executemany('INSERT INTO chunks VALUES (?, ?, ?)', batch)
+                batch = []
+        connection.executemany('INSERT INTO chunks VALUES (?, ?, ?)', batch)
+        connection.commit()
+        yield from connection.execute('SELECT * FROM chunks ORDER BY query, sequence')
+    finally:
+        connection.close()
+        os.remove(database)
+
+def join_chunks(texts:list) -> str:
+    """Returns the query text of its chunks, ordered by sequence"""
+    # The exports trim the spaces a chunk ends with, which are part of the query.
+    text = ''.join(
+        [_text.ljust(CHUNK_LENGTH) for _text in texts[:-1]] + texts[-1:]
+    )
+    return text.replace('\\n', '\n').strip()
+
+def reassemble(chunks):
+    """Yields the ``(query, text)`` of every query, from its chunks grouped by query
+
+    Only the chunks of the current query are held in memory.
+    """
+    current, texts = None, {}
+    for query, sequence, text in chunks:
+        if query != current:
+            if texts:
+                yield current, join_chunks([texts[key] for key in sorted(texts)])
+            current, texts = query, {}
+        texts[sequence] = text
+    if texts:
+        yield current, join_chunks([texts[key] for key in sorted(texts)])
+
+def parse_query(text:str) -> list:
+    """Returns the ``sql.json`` records of the statements of a query"""
+    records = []
+    for sql_statement in sqlparse.split(text):
+        record = statement_record(sql_statement)
+        if record is not None:
+            # ``sql_metadata`` lists cannot be sent back from the parsing processes.
+            records.append(json.loads(json.dumps(record)))
+    return records
+
+def ingest(
+    file_name:str, store:ResultsStore, presorted:bool=False, workers:int=None,
+    batch_size:int=512
+) -> dict:
+    """Parses the queries of a ``STL_QUERYTEXT`` export and stores their statements
+
+    Parameters
+    ----------
+    file_name : str
+        The path to the '.csv' or '.parquet' export
+    store : ResultsStore()
+        The results database the statements are added to
+    presorted : bool, default to False
+        Whether the export is already ordered by query and sequence, which skips sorting it
+    workers : int, default to None
+        The number of parsing processes, the number of CPUs by default
+    batch_size : int, default to 512
+        The number of unique queries parsed and stored at a time
+
+    Returns
+    -------
+    dict
+        The number of queries read, of unique queries and of statements stored
+    """
+    path = os.path.basename(file_name)
+    chunks = read_chunks(file_name)
+    if not presorted:
+        chunks = sort_chunks(chunks)
+    # The texts stored by a previous run of the same export are not parsed again.
+    seen = store.file_text_hashes(HISTORY_APP, path)
+    counts = {'queries': 0, 'unique': 0, 'statements': 0}
+    pending = []
+
+    def _store(executor:ProcessPoolExecutor) -> None:
+        records = [
+            record for _records in executor.map(parse_query, pending, chunksize=16)
+            for record in _records
+        ]
+        store.append_statements(HISTORY_APP, path, records)
+        counts['statements'] += len(records)
+        pending.clear()
+
+    with ProcessPoolExecutor(workers) as executor:
+        for _query, text in reassemble(chunks):
+            counts['queries'] += 1
+            _hash = text_hash(text)
+            if _hash in seen:
+                continue
+            seen.add(_hash)
+            counts['unique'] += 1
+            pending.append(text)
+            if len(pending) >= batch_size:
+                _store(executor)
+        if pending:
+            _store(executor)
+    return counts
+
+if __name__ == '__main__':
+    results = open_results()
+    for export_file in sys.argv[1:]:
+        _counts = ingest(export_file, results)
+        print(
+            f'{export_file}: {_counts["queries"]} queries, {_counts["unique"]} unique,'
+            + f' {_counts["statements"]} statements stored'
+        )
+    results.close()
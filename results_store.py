@@ -0,0 +1,611 @@
+"""Stores the parse results of every app in one indexed SQLite database.
+
+The database replaces the whole-file JSON artifacts (``sql.json``, ``sql_scripts.json``,
+``apps_modifying_tables.json``, ``common_tables_between_apps.json`` and ``known_tables.json``).
+Each app is stored on its own, so adding or re-parsing an app only rewrites that app's rows, and
+the reports built from those artifacts are indexed queries.
+
+The queries Redshift ran, stored under the ``HISTORY_APP`` app by ``query_text.py``, are not ETL
+scripts: the reports over the apps leave them out unless ``include_history`` is set.
+
+The join comparisons need the columns of the joined tables, so the ``joins`` table is filled by
+``import_joins()`` with a Redshift cursor, or by ``python results_store.py --joins``.
+"""
+import os
+import json
+import sqlite3
+import hashlib
+import argparse
+from typing import Union
+import sqlparse
+from corpus import app_sql_scripts, parse_sql_file, statement_target
+from utils import table_key
+
+RESULTS_DATABASE = 'results.db'
+# The app the queries of ``STL_QUERYTEXT`` are stored under
+HISTORY_APP = 'query_history'
+# Numbers the table references in the order of the file, statement and position they are found in
+FIRST_SEEN = 'ROW_NUMBER() OVER (ORDER BY files.id, statements.position, table_refs.position)'
+# The table references of every app, numbered by ``FIRST_SEEN``, for an ``apps.name`` condition
+_TABLE_REFS = 'SELECT files.app_id, table_refs.table_name, ' + FIRST_SEEN + ' AS seen' \
+    + ' FROM table_refs' \
+    + ' JOIN statements ON statements.id = table_refs.statement_id' \
+    + ' JOIN files ON files.id = statements.file_id' \
+    + ' JOIN apps ON apps.id = files.app_id' \
+    + ' WHERE 1=1'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS apps (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    app_id INTEGER NOT NULL REFERENCES apps(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    step TEXT,
+    position INTEGER,
+    UNIQUE (app_id, path)
+);
+CREATE TABLE IF NOT EXISTS statement_texts (
+    hash TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS statements (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    type TEXT,
+    target TEXT,
+    skipped INTEGER NOT NULL,
+    text_hash TEXT NOT NULL REFERENCES statement_texts(hash)
+);
+CREATE TABLE IF NOT EXISTS table_refs (
+    statement_id INTEGER NOT NULL REFERENCES statements(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    table_name TEXT NOT NULL,
+    table_key TEXT NOT NULL,
+    role TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS columns (
+    statement_id INTEGER NOT NULL REFERENCES statements(id) ON DELETE CASCADE,
+    section TEXT NOT NULL,
+    column_name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subqueries (
+    statement_id INTEGER NOT NULL REFERENCES statements(id) ON DELETE CASCADE,
+    alias TEXT NOT NULL,
+    text_hash TEXT NOT NULL REFERENCES statement_texts(hash)
+);
+CREATE TABLE IF NOT EXISTS joins (
+    statement_id INTEGER NOT NULL REFERENCES statements(id) ON DELETE CASCADE,
+    join_type TEXT NOT NULL,
+    left_table TEXT,
+    left_column TEXT,
+    operator TEXT,
+    right_table TEXT,
+    right_column TEXT
+);
+CREATE TABLE IF NOT EXISTS key_tables (
+    app_id INTEGER NOT NULL REFERENCES apps(id) ON DELETE CASCADE,
+    table_name TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_app ON files (app_id);
+CREATE INDEX IF NOT EXISTS statements_file ON statements (file_id);
+CREATE INDEX IF NOT EXISTS statements_type ON statements (type);
+CREATE INDEX IF NOT EXISTS statements_target ON statements (target);
+CREATE INDEX IF NOT EXISTS statements_text ON statements (text_hash);
+CREATE INDEX IF NOT EXISTS table_refs_statement ON table_refs (statement_id);
+CREATE INDEX IF NOT EXISTS table_refs_key ON table_refs (table_key, role);
+CREATE INDEX IF NOT EXISTS table_refs_name ON table_refs (table_name);
+CREATE INDEX IF NOT EXISTS columns_statement ON columns (statement_id);
+CREATE INDEX IF NOT EXISTS columns_name ON columns (column_name);
+CREATE INDEX IF NOT EXISTS subqueries_statement ON subqueries (statement_id);
+CREATE INDEX IF NOT EXISTS joins_statement ON joins (statement_id);
+CREATE INDEX IF NOT EXISTS joins_tables ON joins (left_table, right_table);
+CREATE INDEX IF NOT EXISTS key_tables_app ON key_tables (app_id, status);
+'''
+
+def text_hash(value:str) -> str:
+    """Returns the content hash used to deduplicate statement text"""
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+def _flatten(values:list):
+    """Yields the values of arbitrarily nested lists"""
+    for value in values:
+        if isinstance(value, list):
+            yield from _flatten(value)
+        else:
+            yield value
+
+class ResultsStore():
+    """The SQLite database holding the parse results of every app
+
+    Attributes
+    ----------
+    database : str
+        The path to the SQLite database
+    connection : sqlite3.Connection
+        The connection to the database
+    """
+    def __init__(self, database:str=RESULTS_DATABASE) -> None:
+        self.database = database
+        self.connection = sqlite3.connect(database)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Commits and closes the connection to the database"""
+        self.connection.commit()
+        self.connection.close()
+
+    def app_id(self, app:str) -> int:
+        """Returns the id of an app, adding the app when it is not stored yet"""
+        self.connection.execute('INSERT OR IGNORE INTO apps (name) VALUES (?)', (app,))
+        return self.connection.execute('SELECT id FROM apps WHERE name = ?', (app,)).fetchone()[0]
+
+    def has_app(self, app:str) -> bool:
+        """Returns whether the results of an app are stored"""
+        return self.connection.execute(
+            'SELECT 1 FROM apps WHERE name = ?', (app,)
+        ).fetchone() is not None
+
+    def remove_app(self, app:str) -> None:
+        """Removes every file, statement and key table result of an app"""
+        with self.connection:
+            self.connection.execute('DELETE FROM apps WHERE name = ?', (app,))
+
+    def _add_text(self, value:str) -> str:
+        _hash = text_hash(value)
+        self.connection.execute(
+            'INSERT OR IGNORE INTO statement_texts (hash, value) VALUES (?, ?)', (_hash, value)
+        )
+        return _hash
+
+    def add_file(
+        self, app:str, path:str, records:list, step:Union[str, None]=None, position:int=None
+    ) -> int:
+        """Replaces the stored results of a '.sql' file
+
+        Parameters
+        ----------
+        app : str
+            The name of the app running the file
+        path : str
+            The path to, or the name of, the '.sql' file
+        records : list of dict
+            The ``sql.json`` records of the statements found in the file
+        step : str, default to None
+            The ``app_config.yml`` step running the file
+        position : int, default to None
+            The order in which the app runs the file
+
+        Returns
+        -------
+        int
+            The id of the stored file
+        """
+        with self.connection:
+            _app_id = self.app_id(app)
+            self.connection.execute(
+                'DELETE FROM files WHERE app_id = ? AND path = ?', (_app_id, path)
+            )
+            file_id = self.connection.execute(
+                'INSERT INTO files (app_id, path, step, position) VALUES (?, ?, ?, ?)',
+                (_app_id, path, step, position)
+            ).lastrowid
+            for index, record in enumerate(records):
+                self._add_statement(file_id, index, record)
+        return file_id
+
+    def append_statements(self, app:str, path:str, records:list) -> int:
+        """Adds statements after the ones already stored for a file, adding the file when it is
+        not stored yet
+
+        Unlike ``add_file()``, the stored statements are kept, so a file can be stored in batches.
+
+        Returns
+        -------
+        int
+            The id of the file
+        """
+        with self.connection:
+            _app_id = self.app_id(app)
+            row = self.connection.execute(
+                'SELECT id FROM files WHERE app_id = ? AND path = ?', (_app_id, path)
+            ).fetchone()
+            if row is None:
+                file_id = self.connection.execute(
+                    'INSERT INTO files (app_id, path) VALUES (?, ?)', (_app_id, path)
+                ).lastrowid
+            else:
+                file_id = row[0]
+            position = self.connection.execute(
+                'SELECT COALESCE(MAX(position) + 1, 0) FROM statements WHERE file_id = ?',
+                (file_id,)
+            ).fetchone()[0]
+            for index, record in enumerate(records):
+                self._add_statement(file_id, position + index, record)
+        return file_id
+
+    def file_text_hashes(self, app:str, path:str) -> set:
+        """Returns the text hashes of the statements stored for a file"""
+        return {
+            row[0] for row in self.connection.execute(
+                'SELECT statements.text_hash FROM statements'
+                + ' JOIN files ON files.id = statements.file_id'
+                + ' JOIN apps ON apps.id = files.app_id'
+                + ' WHERE apps.name = ? AND files.path = ?', (app, path)
+            )
+        }
+
+    def _add_statement(self, file_id:int, position:int, record:dict) -> int:
+        target = statement_target(record) if 'type' in record else None
+        statement_id = self.connection.execute(
+            'INSERT INTO statements (file_id, position, type, target, skipped, text_hash)'
+            + ' VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                file_id, position, record.get('type'), target,
+                int(record.get('skipped', False)), self._add_text(record['value'])
+            )
+        ).lastrowid
+        self.connection.executemany(
+            'INSERT INTO table_refs (statement_id, position, table_name, table_key, role)'
+            + ' VALUES (?, ?, ?, ?, ?)',
+            [
+                (
+                    statement_id, index, table, table_key(table),
+                    'write' if table_key(table) == target else 'read'
+                )
+                for index, table in enumerate(record.get('tables') or [])
+            ]
+        )
+        self.connection.executemany(
+            'INSERT INTO columns (statement_id, section, column_name) VALUES (?, ?, ?)',
+            [
+                (statement_id, section, column)
+                for section, columns in (record.get('columns') or {}).items()
+                # ``sql_metadata`` nests the columns combined in a single expression.
+                for column in _flatten(columns)
+            ]
+        )
+        self.connection.executemany(
+            'INSERT INTO subqueries (statement_id, alias, text_hash) VALUES (?, ?, ?)',
+            [
+                (statement_id, alias, self._add_text(value))
+                for alias, value in (record.get('subqueries') or {}).items()
+            ]
+        )
+        return statement_id
+
+    def add_joins(self, statement_id:int, joins:list) -> None:
+        """Stores the joins of a ``ParsedStatement``, with the joins of its subqueries and CTEs,
+        for a stored statement
+
+        Parameters
+        ----------
+        statement_id : int
+            The id of the stored statement
+        joins : list of parse_types.Join()
+            The joins found when parsing the statement
+        """
+        rows = []
+        for join in joins:
+            for comparison in join.comparisons:
+                rows.append((
+                    statement_id,
+                    join.join_type,
+                    None if comparison.left_str else table_key(
+                        f'{comparison.left_table.schema}.{comparison.left_table.table_name}'
+                    ),
+                    comparison.left if comparison.left_str else comparison.left_column.column_name,
+                    comparison.operator,
+                    None if comparison.right_str else table_key(
+                        f'{comparison.right_table.schema}.{comparison.right_table.table_name}'
+                    ),
+                    comparison.right if comparison.right_str \
+                        else comparison.right_column.column_name
+                ))
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO joins (statement_id, join_type, left_table, left_column, operator,'
+                + ' right_table, right_column) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+
+    def import_joins(self, redshift_cursor, app:str=None) -> int:
+        """Parses the stored '.sql' files found on disk with ``new_join_parser`` and replaces the
+        joins of their statements
+
+        The join comparisons need the columns of the joined tables, so unlike the other results
+        they are only stored when a Redshift cursor is given. The statements the parser rejects
+        keep no joins.
+
+        Parameters
+        ----------
+        redshift_cursor : sqlparse.connection()
+            The ``sqlparse`` database session
+        app : str, default to None
+            Only parse the files of this app
+
+        Returns
+        -------
+        int
+            The number of statements whose joins were stored
+        """
+        #pylint: disable=C0415
+        from new_join_parser import ParsedStatement, parse_file, unwrap_create_query
+        query = 'SELECT files.path, statements.id, statement_texts.value FROM statements' \
+            + ' JOIN files ON files.id = statements.file_id' \
+            + ' JOIN apps ON apps.id = files.app_id' \
+            + ' JOIN statement_texts ON statement_texts.hash = statements.text_hash'
+        parameters = []
+        if app is not None:
+            query += ' WHERE apps.name = ?'
+            parameters.append(app)
+        files = {}
+        for path, statement_id, value in self.connection.execute(query, parameters).fetchall():
+            if path not in files:
+                if not os.path.isfile(path):
+                    continue
+                files[path] = {}
+            # ``ParsedStatement`` parses ``CREATE TABLE name AS (query)`` without the parenthesis.
+            key = text_hash(str(unwrap_create_query(sqlparse.parse(value)[0])))
+            files[path].setdefault(key, []).append(statement_id)
+        stored = 0
+        catalog = {}
+        for path, statement_ids in files.items():
+            for parsed in parse_file(path, redshift_cursor, catalog, keep_unparsed=True):
+                if not isinstance(parsed, ParsedStatement):
+                    continue
+                joins = [join for _statement in parsed.walk() for join in _statement.joins]
+                for statement_id in statement_ids.get(text_hash(str(parsed.tokens)), []):
+                    with self.connection:
+                        self.connection.execute(
+                            'DELETE FROM joins WHERE statement_id = ?', (statement_id,)
+                        )
+                    self.add_joins(statement_id, joins)
+                    stored += 1
+        return stored
+
+    def set_key_tables(self, app:str, statuses:dict) -> None:
+        """Replaces the ``known_tables.json`` results of an app
+
+        Parameters
+        ----------
+        app : str
+            The name of the app
+        statuses : dict of str to list
+            The tables of the app that are ``found``, ``not found`` or ``unknown`` in the
+            KeyTables export
+        """
+        with self.connection:
+            _app_id = self.app_id(app)
+            self.connection.execute('DELETE FROM key_tables WHERE app_id = ?', (_app_id,))
+            self.connection.executemany(
+                'INSERT INTO key_tables (app_id, table_name, status) VALUES (?, ?, ?)',
+                [(_app_id, table, status) for status, _tables in statuses.items() for table in _tables]
+            )
+
+    def import_sql_json(self, sql_json:str='sql.json', sql_scripts:str=None) -> None:
+        """Imports the ``sql.json`` results, and the file order from ``sql_scripts.json``"""
+        with open(sql_json, encoding='utf-8') as _f:
+            data = json.load(_f)
+        scripts = {}
+        if sql_scripts is not None:
+            with open(sql_scripts, encoding='utf-8') as _f:
+                scripts = json.load(_f)
+        for app, files in data.items():
+            # ``sql.json`` uses the file name and ``sql_scripts.json`` uses the full path.
+            order = {os.path.basename(path): index for index, path in enumerate(scripts.get(app, []))}
+            for file_name, records in files.items():
+                self.add_file(
+                    app, file_name, records, position=order.get(os.path.basename(file_name))
+                )
+
+    def import_app(self, parse_path:str, app:str, redshift_cursor=None) -> None:
+        """Parses the '.sql' scripts run by the steps of an app and replaces its stored results
+
+        Only the rows of this app are rewritten, so new apps can be added without touching the
+        results of the others. The joins are stored as well when a Redshift cursor is given.
+        """
+        self.remove_app(app)
+        seen = set()
+        for position, (step, file_name) in enumerate(app_sql_scripts(parse_path, app)):
+            # A script run by several steps is stored once, with the first step running it.
+            if file_name in seen:
+                continue
+            seen.add(file_name)
+            self.add_file(app, file_name, parse_sql_file(file_name), step, position)
+        if redshift_cursor is not None:
+            self.import_joins(redshift_cursor, app)
+
+    def import_known_tables(self, known_tables:str='known_tables.json') -> None:
+        """Imports the ``known_tables.json`` results"""
+        with open(known_tables, encoding='utf-8') as _f:
+            for app, statuses in json.load(_f).items():
+                self.set_key_tables(app, statuses)
+
+    def apps(self) -> list:
+        """Returns the names of the stored apps"""
+        return [row[0] for row in self.connection.execute('SELECT name FROM apps ORDER BY id')]
+
+    @staticmethod
+    def _etl_filter(include_history:bool) -> tuple:
+        """Returns the condition on ``apps.name`` leaving out the query history, and its
+        parameters"""
+        if include_history:
+            return '', []
+        return ' AND apps.name != ?', [HISTORY_APP]
+
+    def _etl_apps(self, include_history:bool) -> list:
+        """Returns the names of the stored apps, without the query history"""
+        return [app for app in self.apps() if include_history or app != HISTORY_APP]
+
+    def sql_scripts(self) -> dict:
+        """Returns the '.sql' files stored for each app, in the order the app runs them"""
+        out = {app: [] for app in self.apps()}
+        for app, path in self.connection.execute(
+            'SELECT apps.name, files.path FROM files JOIN apps ON apps.id = files.app_id'
+            + ' ORDER BY apps.id, files.position, files.id'
+        ):
+            out[app].append(path)
+        return out
+
+    def file_steps(self, include_history:bool=False) -> dict:
+        """Returns the step running each stored '.sql' file, keyed by ``(app, file)``"""
+        condition, parameters = self._etl_filter(include_history)
+        return {
+            (app, path): step for app, path, step in self.connection.execute(
+                'SELECT apps.name, files.path, files.step FROM files'
+                + ' JOIN apps ON apps.id = files.app_id'
+                + ' WHERE 1=1' + condition, parameters
+            )
+        }
+
+    def apps_modifying_tables(self, include_history:bool=False) -> dict:
+        """Returns the tables found in each app's statements, as found in
+        ``apps_modifying_tables.json``"""
+        condition, parameters = self._etl_filter(include_history)
+        out = {app: [] for app in self._etl_apps(include_history)}
+        for app, table in self.connection.execute(
+            f'WITH refs AS ({_TABLE_REFS}{condition})'
+            + ' SELECT apps.name, refs.table_name FROM refs'
+            + ' JOIN apps ON apps.id = refs.app_id'
+            + ' GROUP BY apps.id, refs.table_name'
+            + ' ORDER BY apps.id, MIN(refs.seen)', parameters
+        ):
+            out[app].append(table)
+        return out
+
+    def common_tables_between_apps(self, include_history:bool=False) -> dict:
+        """Returns the tables each app shares with any other app, as found in
+        ``common_tables_between_apps.json``"""
+        condition, parameters = self._etl_filter(include_history)
+        out = {app: [] for app in self._etl_apps(include_history)}
+        for app, table in self.connection.execute(
+            f'WITH refs AS ({_TABLE_REFS}{condition}),'
+            + ' app_tables AS ('
+                + 'SELECT app_id, table_name, MIN(seen) AS first_seen FROM refs'
+                + ' GROUP BY app_id, table_name'
+            + ')'
+            + ' SELECT apps.name, app_tables.table_name FROM app_tables'
+            + ' JOIN apps ON apps.id = app_tables.app_id'
+            + ' WHERE EXISTS ('
+                + 'SELECT 1 FROM app_tables AS other'
+                + ' WHERE other.table_name = app_tables.table_name'
+                + ' AND other.app_id != app_tables.app_id'
+            + ')'
+            + ' ORDER BY apps.id, app_tables.first_seen', parameters
+        ):
+            out[app].append(table)
+        return out
+
+    def known_tables(self) -> dict:
+        """Returns the KeyTables status of each app's tables, as found in ``known_tables.json``"""
+        out = {}
+        for app, status, table in self.connection.execute(
+            'SELECT apps.name, key_tables.status, key_tables.table_name FROM key_tables'
+            + ' JOIN apps ON apps.id = key_tables.app_id ORDER BY apps.id, key_tables.rowid'
+        ):
+            out.setdefault(app, {'found': [], 'not found': [], 'unknown': []})
+            out[app][status].append(table)
+        return out
+
+    def apps_touching(self, table:str, role:str=None, include_history:bool=False) -> list:
+        """Returns the apps whose statements read or write a table
+
+        Parameters
+        ----------
+        table : str
+            The name of the table
+        role : str, default to None
+            Only return the apps that ``read`` or ``write`` the table
+        include_history : bool, default to False
+            Whether the queries of ``HISTORY_APP`` are searched as well
+        """
+        query = 'SELECT DISTINCT apps.name FROM table_refs' \
+            + ' JOIN statements ON statements.id = table_refs.statement_id' \
+            + ' JOIN files ON files.id = statements.file_id' \
+            + ' JOIN apps ON apps.id = files.app_id' \
+            + ' WHERE table_refs.table_key = ?'
+        condition, history_parameters = self._etl_filter(include_history)
+        query += condition
+        parameters = [table_key(table), *history_parameters]
+        if role is not None:
+            query += ' AND table_refs.role = ?'
+            parameters.append(role)
+        return [row[0] for row in self.connection.execute(query + ' ORDER BY apps.id', parameters)]
+
+    def statements(self, app:str=None, statement_type:str=None, include_history:bool=False):
+        """Yields the stored statements as ``(app, file, position, sql.json record)``
+
+        Parameters
+        ----------
+        app : str, default to None
+            Only yield the statements of this app, the queries of ``HISTORY_APP`` included when
+            it is the one asked for
+        statement_type : str, default to None
+            Only yield the statements of this type
+        include_history : bool, default to False
+            Whether the queries of ``HISTORY_APP`` are yielded along with the ETL scripts
+        """
+        query = 'SELECT statements.id, apps.name, files.path, statements.position,' \
+            + ' statements.type, statements.target, statements.skipped, statement_texts.value' \
+            + ' FROM statements' \
+            + ' JOIN files ON files.id = statements.file_id' \
+            + ' JOIN apps ON apps.id = files.app_id' \
+            + ' JOIN statement_texts ON statement_texts.hash = statements.text_hash' \
+            + ' WHERE 1=1'
+        parameters = []
+        if app is not None:
+            query += ' AND apps.name = ?'
+            parameters.append(app)
+        else:
+            condition, parameters = self._etl_filter(include_history)
+            query += condition
+        if statement_type is not None:
+            query += ' AND statements.type = ?'
+            parameters.append(statement_type)
+        query += ' ORDER BY apps.id, files.position, files.id, statements.position'
+        for statement_id, _app, path, position, _type, target, skipped, value \
+        in self.connection.execute(query, parameters).fetchall():
+            record = {'type': _type, 'target': target, 'skipped': bool(skipped), 'value': value}
+            if not skipped:
+                record['tables'] = [
+                    row[0] for row in self.connection.execute(
+                        'SELECT table_name FROM table_refs WHERE statement_id = ?'
+                        + ' ORDER BY position', (statement_id,)
+                    )
+                ]
+                record['columns'] = {}
+                for section, column in self.connection.execute(
+                    'SELECT section, column_name FROM columns WHERE statement_id = ?'
+                    + ' ORDER BY rowid', (statement_id,)
+                ):
+                    record['columns'].setdefault(section, []).append(column)
+            yield _app, path, position, record
+
+def open_results(database:str=RESULTS_DATABASE) -> ResultsStore:
+    """Opens the results database, importing the JSON artifacts the first time it is used"""
+    store = ResultsStore(database)
+    if not store.apps():
+        store.import_sql_json('sql.json', 'sql_scripts.json')
+        store.import_known_tables('known_tables.json')
+    return store
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    arguments.add_argument(
+        '--joins', action='store_true',
+        help='Parse the stored scripts with new_join_parser and store their joins'
+    )
+    arguments.add_argument('--app', help='Only store the joins of this app')
+    options = arguments.parse_args()
+    results = open_results()
+    if options.joins:
+        from new_join_parser import connect_to_redshift #pylint: disable=C0415
+        _stored = results.import_joins(connect_to_redshift().cursor(), options.app)
+        print(f'Stored the joins of {_stored} statements')
+    results.close()
@@ -0,0 +1,158 @@
+"""Suggests sort keys from the columns the statements filter ranges of and join on.
+
+Redshift skips the blocks whose zone map, the minimum and maximum of each block, is outside a
+range predicate, but only for the columns the table is sorted on. Across every parsed statement,
+the columns each table is range-filtered on in ``WHERE`` clauses, like the
+``dsc_processed_at >= '<start_date>'`` of the delta loads, and the columns it is joined on are
+counted. They are compared to the current sort keys of the catalog snapshot written by
+``distribution.py``.
+"""
+import os
+import re
+import json
+import argparse
+from sqlparse.sql import Where
+from distribution import SNAPSHOT_FILE, join_pairs, load_snapshot, query_distributions
+
+# A column compared with a range: ``column >= value``, ``column < value`` or ``column BETWEEN``,
+# the column taken before a ``::type`` cast, but not ``column <> value``
+_RANGE = re.compile(
+    r'(?<![\w.$:])(?:([a-z_][a-z0-9_$]*)\.)?([a-z_][a-z0-9_$]*)'
+    + r'(?:\s*::\s*[a-z_][\w ]*?(?:\([\d,\s]*\))?)?'
+    + r'\s*(?:>=|<=|>|<(?!>)|\bbetween\b)',
+    re.IGNORECASE
+)
+
+def range_columns(statement) -> set:
+    """Returns the ``(table, column)`` pairs a parsed statement filters ranges of
+
+    A column is resolved through the alias before it, or to the only table of the statement.
+    """
+    where = next((_token for _token in statement.tokens.tokens if isinstance(_token, Where)), None)
+    if where is None:
+        return set()
+    # The same table can be cached with and without its alias.
+    tables = list({_table.key: _table for _table in statement.table_cache}.values())
+    # A ``DELETE`` filters the table it deletes from.
+    if not tables and statement.table is not None:
+        tables = [statement.table]
+    found = set()
+    # The literals, like ``'<start_date>'``, are not compared columns.
+    for alias, column in _RANGE.findall(re.sub(r"'[^']*'", "''", where.value)):
+        if alias:
+            _table = statement.get_alias_in_cache(alias)
+            # Subqueries and CTEs are not tables and have no sort key.
+            if _table is None or not hasattr(_table, 'key'):
+                continue
+        elif len(tables) == 1:
+            _table = tables[0]
+        else:
+            continue
+        found.add((_table.key, column.lower()))
+    return found
+
+class SortKeyReport():
+    """Counts the statements filtering and joining every column of every table
+
+    Attributes
+    ----------
+    distributions : dict of str to distribution.TableDistribution()
+        The catalog snapshot holding the current sort key of every table
+    ranges : dict of str to dict
+        The number of statements range-filtering each column of every table
+    joins : dict of str to dict
+        The number of joins on each column of every table
+    """
+    def __init__(self, distributions:dict) -> None:
+        self.distributions = distributions
+        self.ranges = {}
+        self.joins = {}
+
+    def add_statements(self, statements:list) -> None:
+        """Counts the range predicates and join columns of parsed statements"""
+        for statement in (_statement for parsed in statements for _statement in parsed.walk()):
+            for table, column in range_columns(statement):
+                columns = self.ranges.setdefault(table, {})
+                columns[column] = columns.get(column, 0) + 1
+        for pair in join_pairs(statements):
+            for left, right in pair.columns:
+                for table, column in ((pair.left_table, left), (pair.right_table, right)):
+                    columns = self.joins.setdefault(table, {})
+                    columns[column] = columns.get(column, 0) + 1
+
+    def suggestion(self, table:str) -> dict:
+        """Returns the sort key suggested for a table
+
+        The column range-filtered by the most statements leads the sort key, as it is the one
+        zone maps prune. The column joined on the most is added after it, or leads the sort key
+        when the table is never range-filtered.
+        """
+        ranges = self.ranges.get(table, {})
+        joins = self.joins.get(table, {})
+        suggested = []
+        if ranges:
+            suggested.append(max(ranges, key=lambda column: (ranges[column], column)))
+        if joins:
+            joined = max(joins, key=lambda column: (joins[column], column))
+            if joined not in suggested:
+                suggested.append(joined)
+        distribution = self.distributions.get(table)
+        current = distribution.sortkey if distribution is not None else None
+        if current is None:
+            status = 'unknown'
+        elif current[:1] == suggested[:1]:
+            status = 'keep'
+        else:
+            status = 'change'
+        return {
+            'table': table,
+            'status': status,
+            'current_sortkey': current,
+            'suggested_sortkey': suggested,
+            'range_filters': dict(sorted(ranges.items(), key=lambda item: -item[1])),
+            'joins': dict(sorted(joins.items(), key=lambda item: -item[1])),
+            'statements': sum(ranges.values()) + sum(joins.values())
+        }
+
+    def suggestions(self) -> list:
+        """Returns the suggestions of every table, the tables to change with the most supporting
+        statements first"""
+        tables = set(self.ranges) | set(self.joins)
+        return sorted(
+            (self.suggestion(table) for table in tables),
+            key=lambda suggestion: (suggestion['status'] != 'change', -suggestion['statements'])
+        )
+
+if __name__ == '__main__':
+    #pylint: disable=C0415
+    from concurrency import UnparsedStatement
+    from new_join_parser import connect_to_redshift, parse_file
+    from results_store import open_results
+    arguments = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    arguments.add_argument(
+        '--snapshot', help=f'Read the sort keys from a local snapshot, like {SNAPSHOT_FILE}'
+    )
+    options = arguments.parse_args()
+    cursor = connect_to_redshift().cursor()
+    _report = SortKeyReport(
+        load_snapshot(options.snapshot) if options.snapshot is not None
+        else query_distributions(cursor)
+    )
+    results = open_results()
+    _catalog = {}
+    _unparsed = 0
+    for _file_name in {path for _app, path, _position, _record in results.statements()}:
+        if not os.path.isfile(_file_name):
+            continue
+        # The statements the parser rejects are skipped instead of stopping the report.
+        _statements = parse_file(_file_name, cursor, _catalog, keep_unparsed=True)
+        _parsed = [
+            _statement for _statement in _statements
+            if not isinstance(_statement, UnparsedStatement)
+        ]
+        _unparsed += len(_statements) - len(_parsed)
+        _report.add_statements(_parsed)
+    results.close()
+    with open('sort_key_suggestions.json', 'w', encoding='utf-8') as json_file:
+        json.dump(_report.suggestions(), json_file, indent=4)
+    print(f'{_unparsed} statements were not parsed and are left out of the report')
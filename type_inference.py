@@ -0,0 +1,296 @@
+"""Infers the data type of the expressions selected by a SQL statement.
+
+The types use the names found in Redshift's ``information_schema.columns``, so an inferred type
+can be compared with the type of a column queried from the catalog. The columns referenced by an
+expression are resolved with a callback, which returns ``None`` for an unknown column.
+"""
+import re
+from typing import Callable, Tuple, Union
+
+UNKNOWN = ('UNKNOWN', 0)
+
+# The names of the data types, as found in ``information_schema.columns``
+TYPE_NAMES = {
+    'int': 'INTEGER',
+    'int4': 'INTEGER',
+    'integer': 'INTEGER',
+    'int2': 'SMALLINT',
+    'smallint': 'SMALLINT',
+    'int8': 'BIGINT',
+    'bigint': 'BIGINT',
+    'numeric': 'NUMERIC',
+    'decimal': 'NUMERIC',
+    'real': 'REAL',
+    'float4': 'REAL',
+    'float': 'DOUBLE PRECISION',
+    'float8': 'DOUBLE PRECISION',
+    'double precision': 'DOUBLE PRECISION',
+    'bool': 'BOOLEAN',
+    'boolean': 'BOOLEAN',
+    'char': 'CHARACTER',
+    'character': 'CHARACTER',
+    'nchar': 'CHARACTER',
+    'bpchar': 'CHARACTER',
+    'varchar': 'CHARACTER VARYING',
+    'character varying': 'CHARACTER VARYING',
+    'nvarchar': 'CHARACTER VARYING',
+    'text': 'CHARACTER VARYING',
+    'date': 'DATE',
+    'timestamp': 'TIMESTAMP WITHOUT TIME ZONE',
+    'timestamp without time zone': 'TIMESTAMP WITHOUT TIME ZONE',
+    'timestamptz': 'TIMESTAMP WITH TIME ZONE',
+    'timestamp with time zone': 'TIMESTAMP WITH TIME ZONE',
+    'time': 'TIME WITHOUT TIME ZONE',
+    'interval': 'INTERVAL',
+    'super': 'SUPER'
+}
+
+# The numeric types, from the narrowest to the widest
+NUMERIC_TYPES = ('SMALLINT', 'INTEGER', 'BIGINT', 'NUMERIC', 'REAL', 'DOUBLE PRECISION')
+DATE_TYPES = ('DATE', 'TIMESTAMP WITHOUT TIME ZONE', 'TIMESTAMP WITH TIME ZONE')
+
+# The type returned by each function. ``None`` means the type of the first argument with a known
+# type.
+FUNCTION_TYPES = {
+    'count': 'BIGINT',
+    'row_number': 'BIGINT',
+    'rank': 'BIGINT',
+    'dense_rank': 'BIGINT',
+    'ntile': 'BIGINT',
+    'datediff': 'BIGINT',
+    'months_between': 'DOUBLE PRECISION',
+    'date_part': 'DOUBLE PRECISION',
+    'extract': 'DOUBLE PRECISION',
+    'len': 'INTEGER',
+    'length': 'INTEGER',
+    'char_length': 'INTEGER',
+    'octet_length': 'INTEGER',
+    'position': 'INTEGER',
+    'strpos': 'INTEGER',
+    'charindex': 'INTEGER',
+    'avg': 'NUMERIC',
+    'to_number': 'NUMERIC',
+    'getdate': 'TIMESTAMP WITHOUT TIME ZONE',
+    'sysdate': 'TIMESTAMP WITHOUT TIME ZONE',
+    'date_trunc': 'TIMESTAMP WITHOUT TIME ZONE',
+    'dateadd': 'TIMESTAMP WITHOUT TIME ZONE',
+    'to_timestamp': 'TIMESTAMP WITH TIME ZONE',
+    'convert_timezone': 'TIMESTAMP WITHOUT TIME ZONE',
+    'trunc': 'DATE',
+    'to_date': 'DATE',
+    'last_day': 'DATE',
+    'current_date': 'DATE',
+    'lower': 'CHARACTER VARYING',
+    'upper': 'CHARACTER VARYING',
+    'trim': 'CHARACTER VARYING',
+    'btrim': 'CHARACTER VARYING',
+    'ltrim': 'CHARACTER VARYING',
+    'rtrim': 'CHARACTER VARYING',
+    'substring': 'CHARACTER VARYING',
+    'substr': 'CHARACTER VARYING',
+    'left': 'CHARACTER VARYING',
+    'right': 'CHARACTER VARYING',
+    'concat': 'CHARACTER VARYING',
+    'replace': 'CHARACTER VARYING',
+    'regexp_replace': 'CHARACTER VARYING',
+    'regexp_substr': 'CHARACTER VARYING',
+    'split_part': 'CHARACTER VARYING',
+    'to_char': 'CHARACTER VARYING',
+    'md5': 'CHARACTER VARYING',
+    'listagg': 'CHARACTER VARYING',
+    'initcap': 'CHARACTER VARYING',
+    'json_extract_path_text': 'CHARACTER VARYING',
+    'bool_or': 'BOOLEAN',
+    'bool_and': 'BOOLEAN',
+    'sum': None,
+    'min': None,
+    'max': None,
+    'abs': None,
+    'round': None,
+    'ceil': None,
+    'ceiling': None,
+    'floor': None,
+    'coalesce': None,
+    'nvl': None,
+    'nvl2': None,
+    'isnull': None,
+    'nullif': None,
+    'greatest': None,
+    'least': None,
+    'first_value': None,
+    'last_value': None,
+    'lag': None,
+    'lead': None,
+    'any_value': None,
+    'median': None
+}
+# The functions called without parenthesis
+KEYWORD_FUNCTIONS = ('current_date', 'current_timestamp', 'sysdate', 'getdate')
+
+_COLUMN = re.compile(r'[a-z_][a-z0-9_$]*(?:\.[a-z_][a-z0-9_$]*)?$', re.IGNORECASE)
+_FUNCTION = re.compile(r'([a-z_][a-z0-9_]*)\s*\(', re.IGNORECASE)
+_COMPARISON = re.compile(
+    r'<>|!=|<=|>=|=|<|>|\b(?:and|or|not|is|like|ilike|in|between|exists|similar)\b', re.IGNORECASE
+)
+
+def normalize_type(type_name:str) -> Tuple[str, int]:
+    """Returns the catalog name and the length of a type, like ``varchar(256)``"""
+    length_match = re.search(r'\(\s*(\d+)', type_name)
+    name = ' '.join(re.sub(r'\(.*\)', ' ', type_name).lower().split())
+    length = int(length_match.groups()[0]) if length_match else 0
+    return (TYPE_NAMES.get(name, name.upper()), length)
+
+def mask(expression:str) -> str:
+    """Returns the expression with the text inside quotes and parenthesis replaced by spaces, so
+    the operators and keywords found in it are at the top level of the expression."""
+    masked = list(expression)
+    depth = 0
+    quote = None
+    for index, character in enumerate(expression):
+        if quote is not None:
+            if character == quote:
+                quote = None
+            else:
+                masked[index] = ' '
+        elif character in ('\'', '"'):
+            quote = character
+        elif character == '(':
+            if depth > 0:
+                masked[index] = ' '
+            depth += 1
+        elif character == ')':
+            depth -= 1
+            if depth > 0:
+                masked[index] = ' '
+        elif depth > 0:
+            masked[index] = ' '
+    return ''.join(masked)
+
+def _split(expression:str, masked:str, separator:str) -> list:
+    """Splits the expression on the separators found at its top level"""
+    parts = []
+    start = 0
+    for match in re.finditer(separator, masked, re.IGNORECASE):
+        parts.append(expression[start:match.start()])
+        start = match.end()
+    parts.append(expression[start:])
+    return [part.strip() for part in parts]
+
+def _first_known(types:list) -> Tuple[str, int]:
+    """Returns the first type that is known"""
+    return next((_type for _type in types if _type != UNKNOWN), UNKNOWN)
+
+def _common_type(types:list) -> Tuple[str, int]:
+    """Returns the type of the results of a ``CASE``, with the longest length of that type"""
+    known = _first_known(types)
+    return (known[0], max(_type[1] or 0 for _type in types if _type[0] == known[0]))
+
+def _arithmetic_type(types:list) -> Tuple[str, int]:
+    """Returns the type of an arithmetic expression from the types of its operands"""
+    names = [_type[0] for _type in types]
+    # Adding an interval or a number of days to a date keeps the date's type.
+    dates = [_type for _type in types if _type[0] in DATE_TYPES]
+    if dates:
+        return dates[0]
+    numerics = [name for name in names if name in NUMERIC_TYPES]
+    if not numerics or len(numerics) != len(names):
+        return _first_known(types)
+    widest = max(numerics, key=NUMERIC_TYPES.index)
+    return (widest, max(_type[1] or 0 for _type in types if _type[0] == widest))
+
+def infer_type(
+    expression:str, resolve:Callable[[str], Union[Tuple[str, int], None]]=None
+) -> Tuple[str, int]:
+    """Infers the data type of a selected expression
+
+    Parameters
+    ----------
+    expression : str
+        The expression, without the alias of the selected column
+    resolve : callable, default to None
+        Returns the type and length of a referenced column, like ``o.id``, or ``None`` when the
+        column is unknown
+
+    Returns
+    -------
+    tuple of str and int
+        The data type and length of the expression, or ``UNKNOWN``
+    """
+    expression = re.sub(r'^distinct\s+', '', expression.strip(), flags=re.IGNORECASE).strip()
+    if not expression:
+        return UNKNOWN
+    masked = mask(expression)
+    # Remove the parenthesis around the whole expression.
+    if masked.startswith('(') and masked.endswith(')') and masked.count('(') == 1:
+        if re.match(r'\(\s*select\b', expression, re.IGNORECASE):
+            return UNKNOWN
+        return infer_type(expression[1:-1], resolve)
+    cast_match = re.match(r'(?:cast|convert)\s*\((.*)\)$', expression, re.IGNORECASE|re.DOTALL)
+    if cast_match:
+        as_match = re.search(r'\s+as\s+(.+)$', mask(cast_match.groups()[0]), re.IGNORECASE)
+        if as_match:
+            return normalize_type(cast_match.groups()[0][as_match.start(1):])
+    if re.match(r'case\b', masked, re.IGNORECASE) and re.search(r'\bend$', masked, re.IGNORECASE):
+        keywords = list(re.finditer(r'\b(when|then|else|end)\b', masked, re.IGNORECASE))
+        results = [
+            expression[keyword.end():_next.start()]
+            for keyword, _next in zip(keywords, keywords[1:])
+            if keyword.groups()[0].lower() in ('then', 'else')
+        ]
+        return _common_type([infer_type(result, resolve) for result in results])
+    if '||' in masked:
+        return ('CHARACTER VARYING', 0)
+    if _COMPARISON.search(masked):
+        return ('BOOLEAN', 0)
+    # Leave out the sign of a number or a column.
+    if re.match(r'[-+]', masked):
+        return infer_type(expression[1:], resolve)
+    operands = _split(expression, masked, r'(?<![eE])[-+*/%]')
+    if len(operands) > 1:
+        return _arithmetic_type([infer_type(operand, resolve) for operand in operands])
+    # A cast, which binds tighter than the operators, decides the type whatever is casted.
+    casts = _split(expression, masked, '::')
+    if len(casts) > 1:
+        return normalize_type(casts[-1])
+    # Literals
+    if re.match(r"'(?:[^']|'')*'$", expression):
+        return ('CHARACTER VARYING', len(expression) - 2)
+    if re.match(r'\d+$', expression):
+        return ('BIGINT', 0) if int(expression) > 2147483647 else ('INTEGER', 0)
+    if re.match(r'(\d+\.\d*|\.\d+)(e[-+]?\d+)?$', expression, re.IGNORECASE):
+        return ('NUMERIC', 0)
+    typed_literal = re.match(r"(interval|date|timestamp)\s+'", expression, re.IGNORECASE)
+    if typed_literal:
+        return normalize_type(typed_literal.groups()[0])
+    if expression.lower() in ('true', 'false'):
+        return ('BOOLEAN', 0)
+    if expression.lower() == 'null':
+        return UNKNOWN
+    if expression.lower() in KEYWORD_FUNCTIONS:
+        return normalize_type(
+            'date' if expression.lower() == 'current_date' else 'timestamp'
+        )
+    function_match = _FUNCTION.match(expression)
+    if function_match and masked.endswith(')') or function_match and re.search(
+        r'\)\s+(over|within)\b', masked, re.IGNORECASE
+    ):
+        name = function_match.groups()[0].lower()
+        arguments_start = function_match.end()
+        arguments_end = masked.index(')', arguments_start)
+        arguments = expression[arguments_start:arguments_end]
+        if name not in FUNCTION_TYPES:
+            return UNKNOWN
+        if FUNCTION_TYPES[name] is not None:
+            return normalize_type(FUNCTION_TYPES[name])
+        argument_types = [
+            infer_type(argument, resolve) for argument in _split(arguments, mask(arguments), ',')
+        ]
+        # ``SUM`` of integers is a ``BIGINT``.
+        if name == 'sum' and argument_types and argument_types[0][0] in NUMERIC_TYPES[:3]:
+            return ('BIGINT', 0)
+        return _first_known(argument_types)
+    if _COLUMN.match(expression) and resolve is not None:
+        resolved = resolve(expression)
+        if resolved is not None:
+            return resolved
+    return UNKNOWN
@@ -0,0 +1,160 @@
+"""Finds the columns of the tables written by the ETL that no statement ever reads.
+
+The columns each statement of every app selects, joins on, filters and orders by are read from the
+results database. A column qualified with its table, like ``dmt.f_invoice.profit``, or with the
+alias of a table of its statement is read from that table. A column without a qualifier, or
+qualified with a subquery or a name the statement does not define, is counted as read from every
+table its statement reads, and a ``SELECT *`` reads every column, so only the columns no statement
+can be reading are reported.
+
+The columns of every table written by the ETL are queried from the Redshift catalog with
+``Table.query_data()`` and the columns never read are reported with their data type, as the
+columns that could be dropped to save storage and scan I/O.
+"""
+import json
+from sql_metadata import Parser
+from corpus import statement_reads, statement_target
+from results_store import ResultsStore, open_results
+from Table import Table
+from utils import table_key, parse_table_name
+
+# The sections of ``columns_dict`` that write columns instead of reading them
+WRITE_SECTIONS = ('insert',)
+
+def statement_aliases(record:dict) -> dict:
+    """Returns the table each qualifier of a ``sql.json`` record's columns refers to
+
+    The aliases and names of the statement's tables refer to their table. The aliases of its
+    subqueries and the temp tables refer to ``None``, as their columns can come from any table of
+    the statement.
+    """
+    def _key(table:str):
+        return table_key(table) if parse_table_name(table).schema is not None else None
+    aliases = {}
+    for table in record.get('tables') or []:
+        aliases[parse_table_name(table).table.lower()] = _key(table)
+        aliases[table_key(table)] = _key(table)
+    try:
+        metadata = Parser(record['value'])
+        aliases.update(
+            (alias.lower(), _key(table)) for alias, table in metadata.tables_aliases.items()
+        )
+        aliases.update((alias.lower(), None) for alias in metadata.subqueries_names)
+    except Exception: #pylint: disable=W0703
+        pass
+    aliases.update((alias.lower(), None) for alias in record.get('subqueries') or {})
+    return aliases
+
+class ColumnConsumption():
+    """The columns read from every table across the corpus
+
+    Attributes
+    ----------
+    columns : dict of str to set
+        The names of the columns read from every table
+    wildcard : set of str
+        The tables read with ``SELECT *``, whose columns are all read
+    written : set of str
+        The tables written by the ETL that are not temp tables
+    """
+    def __init__(self) -> None:
+        self.columns = {}
+        self.wildcard = set()
+        self.written = set()
+
+    def add(self, record:dict) -> None:
+        """Adds the columns read by a ``sql.json`` record"""
+        target = statement_target(record)
+        if target is not None and parse_table_name(target).schema is not None:
+            self.written.add(target)
+        # The bare columns of a ``DELETE`` or ``UPDATE`` are read from the table it writes.
+        tables = set(statement_reads(record)) or ({target} if target is not None else set())
+        aliases = None
+        for section, columns in (record.get('columns') or {}).items():
+            if section in WRITE_SECTIONS:
+                continue
+            for column in columns:
+                # ``sql_metadata`` nests the columns combined in a single expression.
+                for name in column if isinstance(column, list) else [column]:
+                    # The qualifiers are only resolved for the statements that need them.
+                    if aliases is None and name.count('.') == 1:
+                        aliases = statement_aliases(record)
+                    self._add_column(name, tables, aliases)
+
+    def _add_column(self, name:str, tables:set, aliases:dict=None) -> None:
+        """Adds a column read from its table, or from every table its statement reads when its
+        qualifier is not a table of the statement"""
+        parts = name.lower().split('.')
+        if len(parts) > 2:
+            read_from = {table_key('.'.join(parts[:-1]))}
+        elif len(parts) == 2 and (aliases or {}).get(parts[0]) is not None:
+            read_from = {aliases[parts[0]]}
+        else:
+            read_from = tables
+        for table in read_from:
+            if parts[-1] == '*':
+                self.wildcard.add(table)
+            else:
+                self.columns.setdefault(table, set()).add(parts[-1])
+
+    @classmethod
+    def from_store(cls, store:ResultsStore):
+        """Returns the columns read by every statement stored in the results database"""
+        consumption = cls()
+        for _app, _file_name, _position, record in store.statements():
+            consumption.add(record)
+        return consumption
+
+    def unused_columns(self, table:Table) -> list:
+        """Returns the catalog columns of a table that are never read
+
+        Parameters
+        ----------
+        table : Table()
+            The table, with its columns queried from Redshift
+        """
+        if table.key in self.wildcard:
+            return []
+        read = self.columns.get(table.key, set())
+        return [
+            {
+                'name': column.column_name,
+                'data_type': column.data_type,
+                'data_length': column.data_length
+            }
+            for column in table.columns if column.column_name.lower() not in read
+        ]
+
+    def report(self, redshift_cursor) -> list:
+        """Returns the never-read columns of every written table, the most unused columns first
+
+        Parameters
+        ----------
+        redshift_cursor : sqlparse.connection()
+            The ``sqlparse`` database session used to query the columns of the tables
+        """
+        out = []
+        for key in sorted(self.written):
+            _name = parse_table_name(key)
+            table = Table(_name.schema, _name.table, redshift_cursor).query_data()
+            unused = self.unused_columns(table)
+            if unused:
+                out.append({
+                    'table': key,
+                    'columns': len(table.columns),
+                    'unused': unused
+                })
+        return sorted(out, key=lambda entry: -len(entry['unused']))
+
+if __name__ == '__main__':
+    from new_join_parser import connect_to_redshift #pylint: disable=C0415
+    results = open_results()
+    consumption = ColumnConsumption.from_store(results)
+    results.close()
+    _report = consumption.report(connect_to_redshift().cursor())
+    with open('unused_columns.json', 'w', encoding='utf-8') as json_file:
+        json.dump(_report, json_file, indent=4)
+    print(
+        f'{sum(len(entry["unused"]) for entry in _report)} unused columns'
+        + f' in {len(_report)} of {len(consumption.written)} tables'
+    )
@@ -1,17 +1,64 @@
-import os
-import pandas as pd
+import re
+import sys
+from collections import namedtuple
+from functools import lru_cache
+from typing import Iterable
 
+# The Redshift schemas KeyTables lists tables without
+SCHEMA_PREFIXES = frozenset(('dmt', 'stg', 'map', 'extract', 'tmp', 'spectrum'))
+
+TableName = namedtuple('TableName', 'database schema table')
+
+# Matches the parts of a dotted, optionally quoted, table name at the start of a string
+_NAME_PART = r'(?:"(?:[^"]|"")+"|[^\s."(),;]+)'
+_TABLE_NAME = re.compile(r'\s*(' + _NAME_PART + r'(?:\s*\.\s*' + _NAME_PART + r'){0,2})')
+
+def _split_name(table_name: str) -> list:
+    """Returns the unquoted, case-folded parts of a dotted table name"""
+    match = _TABLE_NAME.match(table_name)
+    if match is None:
+        return [table_name.strip().lower()]
+    return [
+        part[1:-1].replace('""', '"').lower() if part.startswith('"') else part.lower()
+        for part in re.findall(_NAME_PART, match.group(1))
+    ]
+
+@lru_cache(maxsize=None)
+def parse_table_name(table_name: str) -> TableName:
+    """Parses a ``table``, ``schema.table`` or ``database.schema.table`` name
+
+    Quoted identifiers are unquoted and every part is case-folded the way Redshift folds
+    identifiers. Anything after the name, like the column list of ``INSERT INTO table (...)``
+    or an alias, is ignored.
+    """
+    parts = _split_name(table_name)
+    parts = [None] * (3 - len(parts)) + parts
+    return TableName(*[sys.intern(part) if part is not None else None for part in parts])
+
+@lru_cache(maxsize=None)
+def canonical_table_name(table_name: str) -> str:
+    """Returns the interned key every lookup uses for a table: ``schema.table``, or the name of
+    a temp table that has no schema."""
+    name = parse_table_name(table_name)
+    if name.schema is None:
+        return name.table
+    return sys.intern(f'{name.schema}.{name.table}')
+
+def table_key(table_name: str) -> str:
+    """Returns the key used to compare table names: lowercase ``schema.table`` or the name of
+    the temp table."""
+    return canonical_table_name(table_name)
+
+@lru_cache(maxsize=None)
 def table_name_cleaner( table_name: str ) -> str:
-    if ( table_name.startswith('dmt.') ):
-        return table_name.replace('dmt.', '')
-    if ( table_name.startswith('stg.') ):
-        return table_name.replace('stg.', '')
-    if ( table_name.startswith('map.') ):
-        return table_name.replace('map.', '')
-    if ( table_name.startswith('extract.') ):
-        return table_name.replace('extract.', '')
-    if ( table_name.startswith('tmp.') ):
-        return table_name.replace('tmp.', '')
-    if ( table_name.startswith('spectrum.') ):
-        return table_name.replace('spectrum.', '')
-    return table_name
+    """Returns the canonical table name without the schemas found in ``SCHEMA_PREFIXES``"""
+    name = parse_table_name(table_name)
+    if name.schema in SCHEMA_PREFIXES:
+        return name.table
+    return canonical_table_name(table_name)
+
+def set_schema_prefixes(prefixes: Iterable[str]) -> None:
+    """Replaces the schemas ``table_name_cleaner`` removes from table names"""
+    global SCHEMA_PREFIXES #pylint: disable=W0603
+    SCHEMA_PREFIXES = frozenset(prefix.lower() for prefix in prefixes)
+    table_name_cleaner.cache_clear()